@@ -2,17 +2,24 @@ import aiohttp
 import asyncio
 import logging
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Optional
 import json
 import re
-from config import TARGET_COEFFICIENTS, REQUEST_TIMEOUT
+from config import REQUEST_TIMEOUT
 from database import Database
+from coefficient_matcher import CoefficientMatcher
+from fixture_resolver import FixtureResolver
 
 logger = logging.getLogger(__name__)
 
 class AdvancedMatchParser:
-    def __init__(self, database: Database):
+    def __init__(self, database: Database, matcher: Optional[CoefficientMatcher] = None,
+                 fixture_resolver: Optional[FixtureResolver] = None):
         self.db = database
+        self.matcher = matcher or CoefficientMatcher()
+        self.fixture_resolver = fixture_resolver or FixtureResolver(database)
+        # Подписчики на результаты сканирования каждого источника: callback(bookmaker, events)
+        self.scan_listeners: List[Callable[[str, List[Dict]], None]] = []
         self.session = None
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
@@ -76,8 +83,11 @@ class AdvancedMatchParser:
             elif isinstance(result, Exception):
                 logger.error(f"Ошибка при парсинге: {result}")
         
+        # Проверяем коэффициенты всех событий одной пачкой
+        target_matches = self.matcher.filter_matches(all_matches)
+        
         # Удаляем дубликаты
-        unique_matches = self.remove_duplicates(all_matches)
+        unique_matches = self.remove_duplicates(target_matches)
         
         logger.info(f"Всего найдено уникальных матчей: {len(unique_matches)}")
         return unique_matches
@@ -94,13 +104,25 @@ class AdvancedMatchParser:
             elif bookmaker == 'williamhill':
                 matches = await self.parse_williamhill_api()
             
-            logger.info(f"Найдено {len(matches)} матчей через API {bookmaker}")
+            logger.info(f"Получено {len(matches)} событий через API {bookmaker}")
+            
+            # Сопоставляем один и тот же матч разных букмекеров
+            await self.fixture_resolver.resolve_matches(matches)
+            self.notify_scan_listeners(bookmaker, matches)
             return matches
             
         except Exception as e:
             logger.error(f"Ошибка при парсинге API {bookmaker}: {e}")
             return []
     
+    def notify_scan_listeners(self, bookmaker: str, events: List[Dict]):
+        """Передача результатов сканирования источника подписчикам"""
+        for listener in self.scan_listeners:
+            try:
+                listener(bookmaker, events)
+            except Exception as e:
+                logger.error(f"Ошибка обработчика сканирования {bookmaker}: {e}")
+    
     async def parse_1xbet_api(self) -> List[Dict]:
         """Парсинг API 1xbet"""
         matches = []
@@ -180,7 +202,7 @@ class AdvancedMatchParser:
                 for event in data['events']:
                     if event.get('sport') == 'football':
                         match_data = await self.extract_match_from_1xbet_event(event)
-                        if match_data and self.check_target_coefficients(match_data['coefficient_1'], match_data['coefficient_2']):
+                        if match_data:
                             matches.append(match_data)
                             
         except Exception as e:
@@ -198,7 +220,7 @@ class AdvancedMatchParser:
                 for event in data['events']:
                     if event.get('sport') == 'football':
                         match_data = await self.extract_match_from_bet365_event(event)
-                        if match_data and self.check_target_coefficients(match_data['coefficient_1'], match_data['coefficient_2']):
+                        if match_data:
                             matches.append(match_data)
                             
         except Exception as e:
@@ -216,7 +238,7 @@ class AdvancedMatchParser:
                 for event in data['events']:
                     if event.get('sport') == 'football':
                         match_data = await self.extract_match_from_williamhill_event(event)
-                        if match_data and self.check_target_coefficients(match_data['coefficient_1'], match_data['coefficient_2']):
+                        if match_data:
                             matches.append(match_data)
                             
         except Exception as e:
@@ -235,6 +257,7 @@ class AdvancedMatchParser:
             # Извлечение коэффициентов
             odds = event.get('odds', {})
             coefficient_1 = float(odds.get('home', 0))
+            coefficient_draw = float(odds.get('draw', 0))
             coefficient_2 = float(odds.get('away', 0))
             
             # Время матча
@@ -247,6 +270,7 @@ class AdvancedMatchParser:
                 'league': league,
                 'bookmaker': '1xbet',
                 'coefficient_1': coefficient_1,
+                'coefficient_draw': coefficient_draw,
                 'coefficient_2': coefficient_2,
                 'match_time': match_time
             }
@@ -266,6 +290,7 @@ class AdvancedMatchParser:
             # Извлечение коэффициентов
             odds = event.get('odds', {})
             coefficient_1 = float(odds.get('home', 0))
+            coefficient_draw = float(odds.get('draw', 0))
             coefficient_2 = float(odds.get('away', 0))
             
             # Время матча
@@ -278,6 +303,7 @@ class AdvancedMatchParser:
                 'league': league,
                 'bookmaker': 'bet365',
                 'coefficient_1': coefficient_1,
+                'coefficient_draw': coefficient_draw,
                 'coefficient_2': coefficient_2,
                 'match_time': match_time
             }
@@ -297,6 +323,7 @@ class AdvancedMatchParser:
             # Извлечение коэффициентов
             odds = event.get('odds', {})
             coefficient_1 = float(odds.get('home', 0))
+            coefficient_draw = float(odds.get('draw', 0))
             coefficient_2 = float(odds.get('away', 0))
             
             # Время матча
@@ -309,6 +336,7 @@ class AdvancedMatchParser:
                 'league': league,
                 'bookmaker': 'williamhill',
                 'coefficient_1': coefficient_1,
+                'coefficient_draw': coefficient_draw,
                 'coefficient_2': coefficient_2,
                 'match_time': match_time
             }
@@ -325,7 +353,8 @@ class AdvancedMatchParser:
             if source_name == 'manual_scraping':
                 # Используем базовый парсер как fallback
                 from parser import MatchParser
-                async with MatchParser(self.db) as parser:
+                async with MatchParser(self.db, self.matcher, self.fixture_resolver) as parser:
+                    parser.scan_listeners = self.scan_listeners
                     matches = await parser.parse_all_bookmakers()
             
             logger.info(f"Найдено {len(matches)} матчей через скрапинг {source_name}")
@@ -383,39 +412,26 @@ class AdvancedMatchParser:
     
     def check_target_coefficients(self, coef1: float, coef2: float) -> bool:
         """Проверка соответствия коэффициентов целевым значениям"""
-        for target_coef1, target_coef2 in TARGET_COEFFICIENTS:
-            # Допустимая погрешность ±0.05
-            if (abs(coef1 - target_coef1) <= 0.05 and abs(coef2 - target_coef2) <= 0.05):
-                return True
-        return False
+        return self.matcher.matches(coef1, coef2)
     
     def remove_duplicates(self, matches: List[Dict]) -> List[Dict]:
         """Удаление дубликатов матчей"""
-        unique_matches = []
-        seen = set()
-        
-        for match in matches:
-            # Создаем уникальный ключ для матча
-            key = f"{match['home_team']}_{match['away_team']}_{match['bookmaker']}_{match['match_time'].strftime('%Y%m%d%H%M')}"
-            
-            if key not in seen:
-                seen.add(key)
-                unique_matches.append(match)
-        
-        return unique_matches
+        # Ключ — канонический fixture_id, общий для всех букмекеров
+        return self.fixture_resolver.unique_by_fixture(matches)
     
     async def save_matches_to_db(self, matches: List[Dict]):
         """Сохранение найденных матчей в базу данных"""
         for match in matches:
             try:
-                await self.db.add_match(
+                match['id'] = await self.db.add_match(
                     home_team=match['home_team'],
                     away_team=match['away_team'],
                     league=match['league'],
                     bookmaker=match['bookmaker'],
                     coefficient_1=match['coefficient_1'],
                     coefficient_2=match['coefficient_2'],
-                    match_time=match['match_time']
+                    match_time=match['match_time'],
+                    fixture_id=match.get('fixture_id')
                 )
             except Exception as e:
                 logger.error(f"Ошибка при сохранении матча в БД: {e}")
@@ -0,0 +1,246 @@
+import asyncio
+import csv
+import logging
+import os
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import (
+    TARGET_COEFFICIENTS, COEFFICIENT_TOLERANCE, BACKTEST_TARGET_SPAN, BACKTEST_TARGET_STEP,
+    BACKTEST_TOLERANCES, BACKTEST_MIN_BETS, BACKTEST_MAX_CELLS, BACKTEST_IMPORT_DIR
+)
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+# Исходы матча
+RESULT_DRAW = 0
+RESULT_HOME = 1
+RESULT_AWAY = 2
+
+# Ставка по стратегии: на победу хозяев (П1) или гостей (П2)
+SIDES = (RESULT_HOME, RESULT_AWAY)
+
+_RESULT_CODES = {'1': RESULT_HOME, 'x': RESULT_DRAW, 'х': RESULT_DRAW, '0': RESULT_DRAW, '2': RESULT_AWAY}
+
+
+def parse_result(row: Dict) -> Optional[int]:
+    """Исход матча из строки CSV (result или счет)"""
+    result = (row.get('result') or '').strip().lower()
+    if result in _RESULT_CODES:
+        return _RESULT_CODES[result]
+    
+    home_goals = (row.get('home_goals') or '').strip()
+    away_goals = (row.get('away_goals') or '').strip()
+    if home_goals.isdigit() and away_goals.isdigit():
+        home_goals, away_goals = int(home_goals), int(away_goals)
+        if home_goals > away_goals:
+            return RESULT_HOME
+        if home_goals < away_goals:
+            return RESULT_AWAY
+        return RESULT_DRAW
+    return None
+
+
+def resolve_import_path(name: str, directory: str = BACKTEST_IMPORT_DIR) -> Optional[str]:
+    """Путь к CSV внутри каталога импорта; None, если имя указывает за его пределы"""
+    root = os.path.realpath(directory)
+    path = os.path.realpath(os.path.join(root, name))
+    if os.path.commonpath([root, path]) != root or path == root:
+        return None
+    return path
+
+
+def read_csv(path: str) -> Tuple[List[Tuple], int]:
+    """Чтение исторических коэффициентов из CSV: (строки для БД, пропущено)"""
+    rows = []
+    skipped = 0
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        for row in csv.DictReader(f):
+            try:
+                result = parse_result(row)
+                if result is None:
+                    raise ValueError("нет исхода матча")
+                rows.append((
+                    row['home_team'].strip(),
+                    row['away_team'].strip(),
+                    (row.get('league') or '').strip(),
+                    (row.get('bookmaker') or '').strip(),
+                    float(row['coefficient_1'].replace(',', '.')),
+                    float(row['coefficient_2'].replace(',', '.')),
+                    datetime.fromisoformat(row['match_time'].strip()),
+                    result
+                ))
+            except (KeyError, ValueError, AttributeError) as e:
+                skipped += 1
+                logger.debug(f"Пропущена строка CSV {row}: {e}")
+    return rows, skipped
+
+
+def build_strategy_grid(targets=None, tolerances=None) -> Dict[str, np.ndarray]:
+    """Сетка параметров стратегий вокруг целевых коэффициентов"""
+    targets = TARGET_COEFFICIENTS if targets is None else targets
+    if tolerances is None:
+        tolerances = sorted(set(BACKTEST_TOLERANCES) | {COEFFICIENT_TOLERANCE})
+    tolerances = np.asarray(tolerances, dtype=np.float64)
+    offsets = np.arange(-BACKTEST_TARGET_SPAN, BACKTEST_TARGET_SPAN + BACKTEST_TARGET_STEP / 2, BACKTEST_TARGET_STEP)
+    
+    pairs = set()
+    for target_1, target_2 in targets:
+        for offset_1 in offsets:
+            for offset_2 in offsets:
+                pair = (round(target_1 + offset_1, 3), round(target_2 + offset_2, 3))
+                if pair[0] > 1 and pair[1] > 1:
+                    pairs.add(pair)
+        # Текущие настройки бота всегда входят в сетку
+        pairs.add((float(target_1), float(target_2)))
+    
+    pairs = np.array(sorted(pairs), dtype=np.float64)
+    grid_pairs = np.repeat(pairs, len(tolerances) * len(SIDES), axis=0)
+    grid_tolerances = np.tile(np.repeat(tolerances, len(SIDES)), len(pairs))
+    grid_sides = np.tile(np.array(SIDES, dtype=np.int8), len(pairs) * len(tolerances))
+    
+    return {
+        'target_1': grid_pairs[:, 0],
+        'target_2': grid_pairs[:, 1],
+        'tolerance': grid_tolerances,
+        'side': grid_sides
+    }
+
+
+def run_backtest(coefficient_1: np.ndarray, coefficient_2: np.ndarray, results: np.ndarray,
+                 grid: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Векторный прогон всех стратегий сетки по истории (ставка 1 единица)"""
+    count = len(grid['side'])
+    bets = np.zeros(count, dtype=np.int64)
+    wins = np.zeros(count, dtype=np.int64)
+    profit = np.zeros(count, dtype=np.float64)
+    drawdown = np.zeros(count, dtype=np.float64)
+    
+    events = len(results)
+    if not events or not count:
+        return {'bets': bets, 'wins': wins, 'profit': profit, 'max_drawdown': drawdown,
+                'hit_rate': np.zeros(count), 'roi': np.zeros(count)}
+    
+    # Выигрыш ставки на каждую сторону по каждому матчу
+    side_pnl = np.stack([
+        np.zeros(events),
+        np.where(results == RESULT_HOME, coefficient_1 - 1, -1.0),
+        np.where(results == RESULT_AWAY, coefficient_2 - 1, -1.0)
+    ])
+    
+    # Матчи, отсортированные по П1, для быстрого отбора кандидатов по цели
+    order_1 = np.argsort(coefficient_1, kind='stable')
+    sorted_1 = coefficient_1[order_1]
+    
+    # Стратегии с одной целевой парой проверяются на общем наборе кандидатов
+    pairs, group = np.unique(np.stack([grid['target_1'], grid['target_2']], axis=1), axis=0, return_inverse=True)
+    group = group.ravel()
+    
+    for pair_index, (target_1, target_2) in enumerate(pairs):
+        rows = np.flatnonzero(group == pair_index)
+        max_tolerance = grid['tolerance'][rows].max()
+        
+        lo = np.searchsorted(sorted_1, target_1 - max_tolerance, side='left')
+        hi = np.searchsorted(sorted_1, target_1 + max_tolerance, side='right')
+        candidates = order_1[lo:hi]
+        candidates = np.sort(candidates[np.abs(coefficient_2[candidates] - target_2) <= max_tolerance])
+        if not len(candidates):
+            continue
+        
+        # Стратегии пары обрабатываются пачками, чтобы матрица (стратегии x матчи) помещалась в память
+        chunk = max(1, BACKTEST_MAX_CELLS // len(candidates))
+        for start in range(0, len(rows), chunk):
+            part = rows[start:start + chunk]
+            tolerance = grid['tolerance'][part, None]
+            hit = (
+                (np.abs(coefficient_1[candidates][None, :] - target_1) <= tolerance) &
+                (np.abs(coefficient_2[candidates][None, :] - target_2) <= tolerance)
+            )
+            pnl = side_pnl[grid['side'][part]][:, candidates] * hit
+            
+            # Кривая капитала и максимальная просадка от пика
+            equity = np.cumsum(pnl, axis=1)
+            peak = np.maximum.accumulate(np.maximum(equity, 0), axis=1)
+            
+            bets[part] = hit.sum(axis=1)
+            wins[part] = (pnl > 0).sum(axis=1)
+            profit[part] = equity[:, -1]
+            drawdown[part] = (peak - equity).max(axis=1)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        hit_rate = np.where(bets > 0, wins / bets, 0.0)
+        roi = np.where(bets > 0, profit / bets, 0.0)
+    
+    return {'bets': bets, 'wins': wins, 'profit': profit, 'max_drawdown': drawdown,
+            'hit_rate': hit_rate, 'roi': roi}
+
+
+class Backtester:
+    """Оценка доходности целевых коэффициентов на исторических данных"""
+    
+    def __init__(self, database: Database):
+        self.db = database
+    
+    async def import_csv(self, path: str) -> Tuple[int, int]:
+        """Импорт исторических коэффициентов из CSV: (загружено, пропущено)"""
+        # Чтение и разбор большого файла не должны останавливать цикл событий
+        rows, skipped = await asyncio.to_thread(read_csv, path)
+        if rows:
+            await self.db.add_historical_odds(rows)
+        logger.info(f"Импортировано исторических матчей: {len(rows)}, пропущено: {skipped}")
+        return len(rows), skipped
+    
+    async def load_arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """История из базы в виде массивов (по времени матча)"""
+        rows = await self.db.get_historical_odds()
+        coefficient_1 = np.fromiter((row['coefficient_1'] for row in rows), dtype=np.float64, count=len(rows))
+        coefficient_2 = np.fromiter((row['coefficient_2'] for row in rows), dtype=np.float64, count=len(rows))
+        results = np.fromiter((row['result'] for row in rows), dtype=np.int8, count=len(rows))
+        return coefficient_1, coefficient_2, results
+    
+    def evaluate(self, coefficient_1: np.ndarray, coefficient_2: np.ndarray, results: np.ndarray) -> Dict:
+        """Прогон сетки стратегий и сводка результатов"""
+        grid = build_strategy_grid()
+        metrics = run_backtest(coefficient_1, coefficient_2, results, grid)
+        
+        strategies = [
+            {
+                'target_1': float(grid['target_1'][i]),
+                'target_2': float(grid['target_2'][i]),
+                'tolerance': float(grid['tolerance'][i]),
+                'side': int(grid['side'][i]),
+                'bets': int(metrics['bets'][i]),
+                'hit_rate': float(metrics['hit_rate'][i]),
+                'roi': float(metrics['roi'][i]),
+                'profit': float(metrics['profit'][i]),
+                'max_drawdown': float(metrics['max_drawdown'][i])
+            }
+            for i in range(len(grid['side']))
+        ]
+        
+        current_targets = {(float(target_1), float(target_2)) for target_1, target_2 in TARGET_COEFFICIENTS}
+        current = [
+            strategy for strategy in strategies
+            if (strategy['target_1'], strategy['target_2']) in current_targets
+            and abs(strategy['tolerance'] - COEFFICIENT_TOLERANCE) < 1e-9
+        ]
+        ranked = sorted(
+            (strategy for strategy in strategies if strategy['bets'] >= BACKTEST_MIN_BETS),
+            key=lambda strategy: strategy['roi'],
+            reverse=True
+        )
+        
+        return {
+            'matches': len(results),
+            'strategies': len(strategies),
+            'current': current,
+            'best': ranked[:5]
+        }
+    
+    async def run(self) -> Dict:
+        """Полный бэктест по данным из базы (расчет в отдельном потоке)"""
+        coefficient_1, coefficient_2, results = await self.load_arrays()
+        return await asyncio.to_thread(self.evaluate, coefficient_1, coefficient_2, results)
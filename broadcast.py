@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from config import BROADCAST_CONCURRENCY, BROADCAST_PER_CHAT_INTERVAL, BROADCAST_MAX_ATTEMPTS
+from delivery_errors import (
+    DeliveryErrorTracker, ChatUnavailable, classify_error, PERMANENT_REASONS, REASON_RETRY_AFTER, REASON_TRANSIENT,
+    REASON_CONFIG
+)
+from message_scheduler import PRIORITY_SIGNAL
+from ttl import TTLMap
+
+logger = logging.getLogger(__name__)
+
+# Результат попытки: сообщение возвращено в очередь для повтора
+_RETRY = object()
+
+
+class BroadcastEngine:
+    """Параллельная рассылка сообщений; общий лимит Telegram соблюдает планировщик бота"""
+    
+    def __init__(self, bot, concurrency: int = BROADCAST_CONCURRENCY,
+                 per_chat_interval: float = BROADCAST_PER_CHAT_INTERVAL,
+                 error_tracker: Optional[DeliveryErrorTracker] = None):
+        self.bot = bot
+        self.error_tracker = error_tracker
+        self.concurrency = concurrency
+        self.per_chat_interval = per_chat_interval
+        # chat_id -> время, раньше которого в чат не отправляем; запись живет один интервал
+        self.chat_next_send = TTLMap()
+    
+    async def broadcast(self, messages: List[Dict], name: str = "рассылка",
+                        on_sent: Optional[Callable[[Dict], Awaitable[None]]] = None,
+                        on_failed: Optional[Callable[[Dict, Exception], Awaitable[None]]] = None,
+                        priority: str = PRIORITY_SIGNAL) -> Dict:
+        """Отправка пачки сообщений в классе планировщика; каждое — аргументы bot.send_message"""
+        stats = {'total': len(messages), 'sent': 0, 'failed': 0, 'retried': 0, 'elapsed': 0.0, 'rate': 0.0,
+                 'errors': Counter()}
+        if not messages:
+            return stats
+        
+        queue = asyncio.Queue()
+        for message in messages:
+            queue.put_nowait((message, 1))
+        
+        started = time.monotonic()
+        
+        async def worker():
+            while True:
+                try:
+                    message, attempt = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                
+                error = await self._send(message, attempt, queue, stats, priority)
+                callback = None
+                if error is None:
+                    stats['sent'] += 1
+                    callback = on_sent(message) if on_sent else None
+                elif error is not _RETRY and on_failed:
+                    callback = on_failed(message, error)
+                
+                if callback is not None:
+                    try:
+                        await callback
+                    except Exception as e:
+                        logger.error(f"Ошибка обработки результата отправки {message['chat_id']}: {e}")
+        
+        workers = [asyncio.create_task(worker()) for _ in range(min(self.concurrency, len(messages)))]
+        await asyncio.gather(*workers)
+        
+        stats['elapsed'] = time.monotonic() - started
+        stats['rate'] = stats['sent'] / stats['elapsed'] if stats['elapsed'] else 0.0
+        logger.info(
+            f"{name.capitalize()} завершена: отправлено {stats['sent']}/{stats['total']}, "
+            f"ошибок {stats['failed']} {dict(stats['errors'])}, повторов {stats['retried']}, "
+            f"{stats['elapsed']:.1f} с ({stats['rate']:.1f} сообщ./с)"
+        )
+        
+        # Недоступные чаты деактивируются одним запросом после рассылки
+        if self.error_tracker:
+            try:
+                await self.error_tracker.flush()
+            except Exception as e:
+                logger.error(f"Ошибка деактивации недоступных чатов: {e}")
+        return stats
+    
+    async def _send(self, message: Dict, attempt: int, queue: asyncio.Queue, stats: Dict, priority: str):
+        """Одна попытка отправки: None, ошибка или _RETRY, если сообщение возвращено в очередь"""
+        chat_id = message['chat_id']
+        
+        # Чаты, уже признанные недоступными, не тратят лимит
+        if self.error_tracker and self.error_tracker.is_dead(chat_id):
+            error = ChatUnavailable(f"Чат {chat_id} недоступен")
+            stats['errors'][self.error_tracker.record(chat_id, error)] += 1
+            stats['failed'] += 1
+            return error
+        
+        # Не чаще одного сообщения в чат за интервал
+        wait = self.chat_next_send.get(chat_id, 0.0) - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        
+        self.chat_next_send.set(chat_id, time.monotonic() + self.per_chat_interval, self.per_chat_interval)
+        
+        try:
+            # Очередь и пауза после RetryAfter — в планировщике бота
+            await self.bot.send_message(**message, rate_limit_args={'priority': priority})
+            if self.error_tracker:
+                self.error_tracker.record_success(chat_id)
+            return None
+        
+        except Exception as e:
+            error = e
+        
+        reason = self.error_tracker.record(chat_id, error) if self.error_tracker else classify_error(error)
+        stats['errors'][reason] += 1
+        
+        # Повторяем только лимит и временные сетевые ошибки
+        if reason not in (REASON_RETRY_AFTER, REASON_TRANSIENT):
+            # Постоянные ошибки и ошибки настройки уже записаны трекером
+            if reason not in PERMANENT_REASONS and reason != REASON_CONFIG:
+                logger.error(f"Ошибка отправки сообщения пользователю {chat_id} ({reason}): {error}")
+            stats['failed'] += 1
+            return error
+        
+        if attempt < BROADCAST_MAX_ATTEMPTS:
+            stats['retried'] += 1
+            queue.put_nowait((message, attempt + 1))
+            return _RETRY
+        
+        logger.error(f"Сообщение пользователю {chat_id} не отправлено после {attempt} попыток: {error}")
+        stats['failed'] += 1
+        return error
@@ -0,0 +1,92 @@
+import logging
+from datetime import datetime, timedelta
+from typing import List
+
+from telegram.error import BadRequest
+
+from broadcast import BroadcastEngine
+from config import SIGNAL_CHANNEL_ID, CHANNEL_INVITE_TTL_HOURS, CHANNEL_REMOVE_BATCH
+from database import Database
+from message_renderer import RenderedMessage
+from message_scheduler import PRIORITY_PAYMENT, PRIORITY_REPORT
+
+logger = logging.getLogger(__name__)
+
+
+class ChannelPublisher:
+    """Публикация сигналов в закрытый канал и управление доступом к нему"""
+    
+    def __init__(self, database: Database, broadcaster: BroadcastEngine, channel_id=SIGNAL_CHANNEL_ID):
+        self.db = database
+        self.broadcaster = broadcaster
+        self.bot = broadcaster.bot
+        self.channel_id = channel_id
+        # Недоступный канал — ошибка настройки: публикация повторяется после паузы
+        if broadcaster.error_tracker:
+            broadcaster.error_tracker.add_config_chat(channel_id)
+    
+    async def publish(self, messages: List[RenderedMessage], name: str = "публикация в канал") -> int:
+        """Публикация сигналов: одно сообщение в канал на сигнал, независимо от числа подписчиков"""
+        stats = await self.broadcaster.broadcast([message.for_chat(self.channel_id) for message in messages], name)
+        return stats['sent']
+    
+    async def on_subscription_updated(self, user_id: int, subscription_type: str, subscription_end: datetime):
+        """Выдача персональной ссылки-приглашения после оплаты подписки"""
+        try:
+            # Пользователь мог быть удален из канала после прошлой подписки
+            await self.bot.unban_chat_member(
+                self.channel_id, user_id, only_if_banned=True, rate_limit_args={'priority': PRIORITY_PAYMENT}
+            )
+            
+            # Ссылка одноразовая и живет не дольше подписки
+            expire_date = min(subscription_end, datetime.now() + timedelta(hours=CHANNEL_INVITE_TTL_HOURS))
+            invite = await self.bot.create_chat_invite_link(
+                self.channel_id,
+                expire_date=expire_date,
+                member_limit=1,
+                name=f"user {user_id}",
+                rate_limit_args={'priority': PRIORITY_PAYMENT}
+            )
+            await self.db.add_channel_member(user_id, invite.invite_link)
+            
+            await self.bot.send_message(
+                chat_id=user_id,
+                rate_limit_args={'priority': PRIORITY_PAYMENT},
+                text=f"""
+📢 Сигналы публикуются в закрытом канале
+
+Ваша персональная ссылка для входа:
+{invite.invite_link}
+
+⏳ Ссылка действует до {expire_date.strftime("%d.%m.%Y %H:%M")} и только для одного входа.
+"""
+            )
+            logger.info(f"Пользователю {user_id} выдано приглашение в канал сигналов")
+        
+        except Exception as e:
+            logger.error(f"Ошибка выдачи приглашения в канал пользователю {user_id}: {e}")
+    
+    async def remove_expired_members(self) -> int:
+        """Удаление из канала пачки пользователей с истекшей подпиской"""
+        user_ids = await self.db.get_expired_channel_members(datetime.now(), CHANNEL_REMOVE_BATCH)
+        removed = []
+        
+        for user_id in user_ids:
+            try:
+                # Бан с немедленным разбаном удаляет из канала, но оставляет возможность вернуться
+                await self.bot.ban_chat_member(self.channel_id, user_id, rate_limit_args={'priority': PRIORITY_REPORT})
+                await self.bot.unban_chat_member(
+                    self.channel_id, user_id, only_if_banned=True, rate_limit_args={'priority': PRIORITY_REPORT}
+                )
+                removed.append(user_id)
+            except BadRequest as e:
+                # Пользователь так и не вошел в канал или уже покинул его
+                logger.info(f"Пользователь {user_id} не удален из канала: {e}")
+                removed.append(user_id)
+            except Exception as e:
+                logger.error(f"Ошибка удаления пользователя {user_id} из канала: {e}")
+        
+        if removed:
+            await self.db.mark_channel_members_removed(removed)
+            logger.info(f"Удалено из канала сигналов пользователей с истекшей подпиской: {len(removed)}")
+        return len(removed)
@@ -0,0 +1,159 @@
+import logging
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from config import TARGET_COEFFICIENTS, COEFFICIENT_TOLERANCE
+
+logger = logging.getLogger(__name__)
+
+# Шаг для упаковки пары номеров ячеек (x, y) в один int64 ключ
+_KEY_STRIDE = 1 << 32
+# Размер пачки событий, обрабатываемых за один проход (ограничивает память)
+_EVENTS_CHUNK = 1 << 16
+
+
+class CoefficientMatcher:
+    """Поиск целевых пар коэффициентов через индекс на 2-D сетке"""
+
+    def __init__(self, targets: Sequence[Tuple[float, float]] = None, tolerances=None):
+        self.targets = np.empty((0, 2), dtype=np.float64)
+        self.tolerances = np.empty(0, dtype=np.float64)
+        # Сетка на каждый класс допуска: (размер ячейки, отсортированные ключи ячеек, индексы целей)
+        self._grids: List[Tuple[float, np.ndarray, np.ndarray]] = []
+        self.set_targets(TARGET_COEFFICIENTS if targets is None else targets, tolerances)
+
+    def __len__(self) -> int:
+        return len(self.targets)
+
+    def set_targets(self, targets: Sequence[Tuple[float, float]], tolerances=None):
+        """Перестроение индекса по новому набору целевых пар"""
+        targets = np.asarray(targets, dtype=np.float64).reshape(-1, 2)
+        if tolerances is None:
+            tolerances = np.full(len(targets), COEFFICIENT_TOLERANCE, dtype=np.float64)
+        else:
+            tolerances = np.broadcast_to(np.asarray(tolerances, dtype=np.float64), (len(targets),)).copy()
+
+        self.targets = targets
+        self.tolerances = tolerances
+
+        # Цели делятся на классы допуска по степеням двойки, у каждого класса своя сетка:
+        # одна широкая стратегия не укрупняет ячейки остальных целей
+        classes = np.ceil(np.log2(np.maximum(tolerances, 1e-6))).astype(np.int64)
+        self._grids = []
+        for tolerance_class in np.unique(classes):
+            members = np.flatnonzero(classes == tolerance_class)
+            # Ячейка не меньше максимального допуска класса: любая цель класса в пределах допуска
+            # лежит в одной из 9 соседних ячеек события
+            cell_size = max(float(tolerances[members].max()), 1e-6) * (1 + 1e-9)
+            keys = self._cell_keys(targets[members, 0], targets[members, 1], cell_size)
+            order = np.argsort(keys, kind='stable')
+            self._grids.append((cell_size, keys[order], members[order]))
+
+    @staticmethod
+    def _cell_keys(coef1: np.ndarray, coef2: np.ndarray, cell_size: float) -> np.ndarray:
+        """Ключи ячеек сетки для массивов коэффициентов"""
+        cell_x = np.floor(coef1 / cell_size).astype(np.int64)
+        cell_y = np.floor(coef2 / cell_size).astype(np.int64)
+        return cell_x * _KEY_STRIDE + cell_y
+
+    def match_pairs(self, coef1, coef2) -> Tuple[np.ndarray, np.ndarray]:
+        """Все совпадения (индекс события, индекс цели) для пачки событий"""
+        coef1 = np.asarray(coef1, dtype=np.float64).ravel()
+        coef2 = np.asarray(coef2, dtype=np.float64).ravel()
+
+        event_parts = []
+        target_parts = []
+
+        if not len(self.targets) or not len(coef1):
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty
+
+        for start in range(0, len(coef1), _EVENTS_CHUNK):
+            chunk_events, chunk_targets = self._match_chunk(
+                coef1[start:start + _EVENTS_CHUNK],
+                coef2[start:start + _EVENTS_CHUNK]
+            )
+            event_parts.append(chunk_events + start)
+            target_parts.append(chunk_targets)
+
+        return np.concatenate(event_parts), np.concatenate(target_parts)
+
+    def _match_chunk(self, coef1: np.ndarray, coef2: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Сопоставление одной пачки событий с индексом"""
+        event_ids = np.arange(len(coef1), dtype=np.int64)
+
+        candidate_events = []
+        candidate_targets = []
+
+        for cell_size, sorted_keys, order in self._grids:
+            base_keys = self._cell_keys(coef1, coef2, cell_size)
+
+            # Кандидаты из 9 соседних ячеек
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    keys = base_keys + (dx * _KEY_STRIDE + dy)
+                    lo = np.searchsorted(sorted_keys, keys, side='left')
+                    hi = np.searchsorted(sorted_keys, keys, side='right')
+                    counts = hi - lo
+                    total = int(counts.sum())
+                    if not total:
+                        continue
+
+                    # Разворачиваем диапазоны [lo, hi) в плоский список позиций
+                    run_starts = np.repeat(np.cumsum(counts) - counts, counts)
+                    positions = np.repeat(lo, counts) + (np.arange(total) - run_starts)
+
+                    candidate_events.append(np.repeat(event_ids, counts))
+                    candidate_targets.append(order[positions])
+
+        if not candidate_events:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty
+
+        events = np.concatenate(candidate_events)
+        targets = np.concatenate(candidate_targets)
+
+        # Точная проверка допуска для каждого кандидата
+        tolerance = self.tolerances[targets]
+        hit = (
+            (np.abs(coef1[events] - self.targets[targets, 0]) <= tolerance) &
+            (np.abs(coef2[events] - self.targets[targets, 1]) <= tolerance)
+        )
+        return events[hit], targets[hit]
+
+    def match_mask(self, coef1, coef2) -> np.ndarray:
+        """Маска событий, совпавших хотя бы с одной целью"""
+        coef1 = np.asarray(coef1, dtype=np.float64).ravel()
+        mask = np.zeros(len(coef1), dtype=bool)
+        events, _ = self.match_pairs(coef1, coef2)
+        mask[events] = True
+        return mask
+
+    def match_batch(self, coef1, coef2) -> List[np.ndarray]:
+        """Индексы совпавших целей для каждого события пачки"""
+        count = len(np.asarray(coef1).ravel())
+        events, targets = self.match_pairs(coef1, coef2)
+
+        order = np.lexsort((targets, events))
+        events = events[order]
+        targets = targets[order]
+
+        bounds = np.searchsorted(events, np.arange(count + 1), side='left')
+        return [targets[bounds[i]:bounds[i + 1]] for i in range(count)]
+
+    def matches(self, coef1: float, coef2: float) -> bool:
+        """Проверка одной пары коэффициентов"""
+        events, _ = self.match_pairs([coef1], [coef2])
+        return bool(len(events))
+
+    def filter_matches(self, matches: List[Dict]) -> List[Dict]:
+        """Отбор матчей, коэффициенты которых попали в целевые значения"""
+        if not matches:
+            return []
+
+        coef1 = np.fromiter((match['coefficient_1'] for match in matches), dtype=np.float64, count=len(matches))
+        coef2 = np.fromiter((match['coefficient_2'] for match in matches), dtype=np.float64, count=len(matches))
+        mask = self.match_mask(coef1, coef2)
+
+        return [match for match, hit in zip(matches, mask) if hit]
@@ -1,3 +1,4 @@
+import hashlib
 import os
 from dotenv import load_dotenv
 
@@ -10,6 +11,7 @@ DONATION_ALERTS_URL = os.getenv('DONATION_ALERTS_URL')
 
 # Настройки базы данных
 DATABASE_PATH = 'bot_database.db'
+DATABASE_BUSY_TIMEOUT = 30           # секунд ожидания блокировки для транзакций оплаты
 
 # Настройки подписок
 SUBSCRIPTION_PRICES = {
@@ -18,6 +20,39 @@ SUBSCRIPTION_PRICES = {
     'month': 2500
 }
 
+# Намерения оплаты: срок действия ссылки и кэш в памяти
+PAYMENT_LINK_TTL_HOURS = 24
+PAYMENT_INTENT_CACHE_SIZE = 1024
+PAYMENT_LEDGER_CACHE_SIZE = 4096     # уже учтенных платежей для быстрого ответа на повторы
+
+# Фоновая сверка неоплаченных намерений с DonationAlerts
+PAYMENT_RECONCILE_INTERVAL = 60      # секунд между плановыми сверками
+PAYMENT_RECONCILE_MIN_INTERVAL = 10  # не чаще, даже по нажатию «Проверить оплату»
+PAYMENT_RECONCILE_PAGE_SIZE = 500    # намерений из базы за запрос
+PAYMENT_RECONCILE_CONCURRENCY = 4    # одновременных запросов страниц к DonationAlerts
+PAYMENT_RECONCILE_MAX_PAGES = 50
+
+# Клиент API DonationAlerts: постоянный пул соединений, таймауты операций, повторы
+DONATION_ALERTS_API_URL = 'https://www.donationalerts.com/api/v1'
+DONATION_ALERTS_POOL_SIZE = 20       # одновременных соединений
+DONATION_ALERTS_KEEPALIVE = 60       # секунд жизни простаивающего соединения
+DONATION_ALERTS_TIMEOUTS = {         # секунд на одну попытку операции
+    'create_donation': 10,
+    'get_donation': 5,               # пользователь ждет ответа на кнопке
+    'list_donations': 10,
+    'refund_donation': 15
+}
+DONATION_ALERTS_MAX_ATTEMPTS = 3
+DONATION_ALERTS_BACKOFF_BASE = 0.5   # секунд до первой повторной попытки, далее вдвое больше
+DONATION_ALERTS_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # границы гистограммы, секунд
+
+# Срок подписки по типу (дней)
+SUBSCRIPTION_DAYS = {
+    'week': 7,
+    'two_weeks': 14,
+    'month': 30
+}
+
 # Настройки пробного периода
 TRIAL_MESSAGES_LIMIT = 3
 
@@ -30,6 +65,139 @@ TARGET_COEFFICIENTS = [
     (4.22, 1.225)
 ]
 
+# Допустимое отклонение от целевых коэффициентов
+COEFFICIENT_TOLERANCE = 0.05
+
+# Настройки пользовательских стратегий
+MAX_USER_STRATEGIES = 10
+MAX_STRATEGY_TOLERANCE = 0.5
+
+# Настройки сопоставления матчей разных букмекеров
+FIXTURE_TIME_WINDOW_HOURS = 3
+FIXTURE_MATCH_THRESHOLD = 0.6
+FIXTURE_RETENTION_HOURS = 48
+
+# Минимальный запас вилки по лучшим ценам (1% = 0.01)
+ARBITRAGE_MIN_EDGE = 0.01
+
+# Минимальное изменение коэффициента, считающееся новой ценой
+ODDS_DELTA_EPSILON = 0.01
+
+# Сигналы о движении коэффициентов к целевым значениям
+ODDS_MOVEMENT_WINDOW = 12            # точек в скользящем окне
+ODDS_MOVEMENT_MIN_POINTS = 4         # минимум точек для оценки тренда
+ODDS_MOVEMENT_MIN_SLOPE = 0.05       # приближение к цели, единиц коэффициента в час
+ODDS_MOVEMENT_MAX_DISTANCE = 0.3     # максимальное расстояние до цели
+ODDS_MOVEMENT_MAX_VOLATILITY = 0.25  # выше — шум, а не тренд
+ODDS_MOVEMENT_MAX_STREAMS = 20000    # потоков (матч, букмекер) в памяти
+
+# Бэктест целевых коэффициентов
+BACKTEST_TARGET_SPAN = 0.5           # отклонение от целей в сетке параметров
+BACKTEST_TARGET_STEP = 0.05
+BACKTEST_TOLERANCES = [0.01, 0.02, 0.03, 0.05, 0.075, 0.1, 0.15, 0.2]
+BACKTEST_MIN_BETS = 20               # минимум ставок для попадания в рейтинг
+BACKTEST_MAX_CELLS = 20_000_000      # размер пачки (стратегии x матчи)
+BACKTEST_IMPORT_DIR = os.getenv('BACKTEST_IMPORT_DIR', 'backtest_data')  # /backtest_import читает CSV только отсюда
+
+# Рассылка сигналов (лимит Telegram ~30 сообщений в секунду)
+BROADCAST_RATE = 28                  # сообщений в секунду
+BROADCAST_BURST = 30
+BROADCAST_MIN_RATE = 5               # нижняя граница после RetryAfter
+BROADCAST_CONCURRENCY = 50           # одновременных запросов к Bot API
+BROADCAST_PER_CHAT_INTERVAL = 1.0    # секунд между сообщениями в один чат
+BROADCAST_MAX_ATTEMPTS = 3
+
+# Планировщик исходящих сообщений: веса классов в общей очереди под лимитом Telegram
+SCHEDULER_WEIGHTS = {
+    'interactive': 16,               # ответы на команды и кнопки
+    'payment': 8,                    # уведомления об оплате
+    'signal': 2,                     # рассылка сигналов
+    'report': 1                      # отчеты и служебные рассылки
+}
+SCHEDULER_LATENCY_WINDOW = 1000      # последних отправок для статистики ожидания
+
+# Фоновая обработка входящих обновлений Telegram (webhook)
+UPDATE_WORKERS = 16                  # одновременно обрабатываемых пользователей
+UPDATE_QUEUE_SIZE = 5000             # при переполнении webhook отвечает 503 и Telegram повторит доставку
+
+# Защита от повторной доставки обновлений (по update_id)
+UPDATE_DEDUP_WINDOW = 24 * 3600      # секунд; Telegram повторяет доставку до суток
+UPDATE_DEDUP_CAPACITY = 100_000
+UPDATE_DEDUP_PATH = os.getenv('UPDATE_DEDUP_PATH', 'recent_updates.json')
+
+# Защита webhook-сервера: секрет Telegram (по умолчанию выводится из токена бота), лимиты маршрутов
+WEBHOOK_SECRET_TOKEN = os.getenv('WEBHOOK_SECRET_TOKEN') or (
+    hashlib.sha256(BOT_TOKEN.encode()).hexdigest() if BOT_TOKEN else None
+)
+WEBHOOK_TRUST_FORWARDED = os.getenv('WEBHOOK_TRUST_FORWARDED', 'false').lower() == 'true'  # только за прокси Railway
+WEBHOOK_MAX_BODY = 256 * 1024        # байт, общий предел приложения
+TELEGRAM_WEBHOOK_MAX_BODY = 256 * 1024
+TELEGRAM_WEBHOOK_MAX_IN_FLIGHT = 200
+TELEGRAM_WEBHOOK_PER_IP = 100        # Telegram держит до 40 соединений с одного адреса
+PAYMENT_WEBHOOK_MAX_BODY = 64 * 1024
+PAYMENT_WEBHOOK_MAX_IN_FLIGHT = 50
+PAYMENT_WEBHOOK_PER_IP = 10
+
+# Колесо таймеров для записей с ограниченным сроком жизни
+TIMER_TICK = 1.0                     # секунд, точность срабатывания
+TIMER_SLOTS = 3600                   # слотов на оборот; более дальние сроки ждут своего круга
+
+# Очередь доставки сигналов (outbox)
+OUTBOX_WORKERS = 4
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_BACKOFF_BASE = 30             # секунд до первой повторной попытки
+OUTBOX_BACKOFF_MAX = 3600
+OUTBOX_CLAIM_TIMEOUT = 600           # секунд до возврата зависшей пачки в очередь
+OUTBOX_POLL_INTERVAL = 5
+OUTBOX_RETENTION_DAYS = 7
+
+# Доставка сигналов: 'direct' — личные сообщения, 'channel' — публикация в закрытый канал
+SIGNAL_DELIVERY_MODE = os.getenv('SIGNAL_DELIVERY_MODE', 'direct')
+SIGNAL_CHANNEL_ID = os.getenv('SIGNAL_CHANNEL_ID')
+CHANNEL_INVITE_TTL_HOURS = 24
+CHANNEL_REMOVE_BATCH = 100           # пользователей за один проход удаления
+CHANNEL_RETRY_BACKOFF = 60           # секунд паузы после ошибки настройки канала, удваивается до максимума
+CHANNEL_RETRY_BACKOFF_MAX = 3600
+
+# Окно объединения сигналов пользователя в один дайджест (секунды)
+SIGNAL_DIGEST_WINDOW = 15
+
+# Срок жизни кнопок подписки на лиги и команды в показанных сообщениях (часы)
+FOLLOW_TOKEN_TTL_HOURS = 7 * 24
+
+# Кэш готовых сообщений о матчах (записей)
+RENDER_CACHE_SIZE = 2048
+
+# Хранилище истории коэффициентов (append-only сегменты)
+ODDS_STORE_PATH = os.getenv('ODDS_STORE_PATH', 'odds_store')
+ODDS_SEGMENT_MAX_POINTS = 4_000_000
+ODDS_FLUSH_POINTS = 50_000
+ODDS_RETENTION_DAYS = 90
+
+# Синонимы названий команд (синоним -> каноническое название)
+TEAM_ALIASES = {
+    'Man Utd': 'Manchester United',
+    'Man United': 'Manchester United',
+    'Manchester Utd': 'Manchester United',
+    'Man City': 'Manchester City',
+    'Spurs': 'Tottenham Hotspur',
+    'Tottenham': 'Tottenham Hotspur',
+    'Wolves': 'Wolverhampton Wanderers',
+    'Newcastle': 'Newcastle United',
+    'West Ham': 'West Ham United',
+    'Inter': 'Inter Milan',
+    'Internazionale': 'Inter Milan',
+    'PSG': 'Paris Saint Germain',
+    'Bayern': 'Bayern Munich',
+    'Bayern Munchen': 'Bayern Munich',
+    'Atletico': 'Atletico Madrid',
+    'Спартак М': 'Спартак Москва',
+    'ЦСКА М': 'ЦСКА Москва',
+    'Локомотив М': 'Локомотив Москва',
+    'Динамо М': 'Динамо Москва',
+}
+
 # Настройки парсинга
 PARSING_INTERVAL = 300  # 5 минут
 MAX_RETRIES = 3
@@ -1,19 +1,25 @@
 import aiosqlite
 import asyncio
+import json
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional, Tuple
+from typing import Awaitable, Callable, List, Dict, Optional, Tuple
 import logging
-from config import DATABASE_PATH
+from config import DATABASE_PATH, DATABASE_BUSY_TIMEOUT
 
 logger = logging.getLogger(__name__)
 
 class Database:
     def __init__(self):
         self.db_path = DATABASE_PATH
+        # Обработчики изменения подписки: (user_id, тип подписки, дата окончания)
+        self.subscription_listeners: List[Callable[[int, str, datetime], Awaitable[None]]] = []
         
     async def init_database(self):
         """Инициализация базы данных"""
         async with aiosqlite.connect(self.db_path) as db:
+            # WAL: чтение не блокируется записью, базу могут делить несколько процессов
+            await db.execute('PRAGMA journal_mode=WAL')
+            
             # Таблица пользователей
             await db.execute('''
                 CREATE TABLE IF NOT EXISTS users (
@@ -67,9 +73,11 @@ class Database:
                     coefficient_2 REAL,
                     match_time TIMESTAMP,
                     found_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    is_sent BOOLEAN DEFAULT FALSE
+                    is_sent BOOLEAN DEFAULT FALSE,
+                    fixture_id TEXT
                 )
             ''')
+            await self._ensure_column(db, 'matches', 'fixture_id', 'TEXT')
             
             # Таблица отправленных сигналов
             await db.execute('''
@@ -83,9 +91,155 @@ class Database:
                 )
             ''')
             
+            # Очередь доставки сигналов: одна строка на пару (пользователь, матч)
+            await db.execute('''
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER,
+                    match_id INTEGER,
+                    payload TEXT,
+                    state TEXT DEFAULT 'pending',
+                    attempts INTEGER DEFAULT 0,
+                    next_attempt_at TIMESTAMP,
+                    claimed_at TIMESTAMP,
+                    last_error TEXT,
+                    created_at TIMESTAMP,
+                    sent_at TIMESTAMP,
+                    UNIQUE (user_id, match_id),
+                    FOREIGN KEY (user_id) REFERENCES users (user_id),
+                    FOREIGN KEY (match_id) REFERENCES matches (id)
+                )
+            ''')
+            await db.execute('CREATE INDEX IF NOT EXISTS idx_outbox_state ON outbox (state, next_attempt_at)')
+            
+            # Участники закрытого канала сигналов
+            await db.execute('''
+                CREATE TABLE IF NOT EXISTS channel_members (
+                    user_id INTEGER PRIMARY KEY,
+                    invite_link TEXT,
+                    invited_at TIMESTAMP,
+                    removed_at TIMESTAMP,
+                    FOREIGN KEY (user_id) REFERENCES users (user_id)
+                )
+            ''')
+            
+            # Намерения оплаты: ссылка выдана, ожидается платеж (переживают рестарт)
+            await db.execute('''
+                CREATE TABLE IF NOT EXISTS payment_intents (
+                    unique_id TEXT PRIMARY KEY,
+                    external_id TEXT UNIQUE,
+                    user_id INTEGER,
+                    subscription_type TEXT,
+                    amount REAL,
+                    webhook_url TEXT,
+                    status TEXT DEFAULT 'pending',
+                    payment_id TEXT,
+                    created_at TIMESTAMP,
+                    updated_at TIMESTAMP,
+                    FOREIGN KEY (user_id) REFERENCES users (user_id)
+                )
+            ''')
+            await db.execute('''
+                CREATE INDEX IF NOT EXISTS idx_payment_intents_user
+                ON payment_intents (user_id, subscription_type, created_at)
+            ''')
+            await db.execute('CREATE INDEX IF NOT EXISTS idx_payment_intents_status ON payment_intents (status, created_at)')
+            # Сообщение со ссылкой на оплату, которое правится после подтверждения платежа
+            await self._ensure_column(db, 'payment_intents', 'chat_id', 'INTEGER')
+            await self._ensure_column(db, 'payment_intents', 'message_id', 'INTEGER')
+            
+            # Учтенные платежи: каждый платеж провайдера активирует подписку ровно один раз
+            await db.execute('''
+                CREATE TABLE IF NOT EXISTS payment_ledger (
+                    payment_id TEXT PRIMARY KEY,
+                    unique_id TEXT,
+                    user_id INTEGER,
+                    subscription_type TEXT,
+                    amount REAL,
+                    activated_at TIMESTAMP,
+                    FOREIGN KEY (user_id) REFERENCES users (user_id)
+                )
+            ''')
+            
+            # Дайджесты: несколько сигналов пользователю в одном сообщении
+            await db.execute('''
+                CREATE TABLE IF NOT EXISTS digests (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER,
+                    match_ids TEXT,
+                    created_at TIMESTAMP,
+                    FOREIGN KEY (user_id) REFERENCES users (user_id)
+                )
+            ''')
+            
+            # Таблица пользовательских стратегий (целевых коэффициентов)
+            await db.execute('''
+                CREATE TABLE IF NOT EXISTS user_strategies (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER,
+                    coefficient_1 REAL,
+                    coefficient_2 REAL,
+                    tolerance REAL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (user_id) REFERENCES users (user_id)
+                )
+            ''')
+            await db.execute('CREATE INDEX IF NOT EXISTS idx_user_strategies_user ON user_strategies (user_id)')
+            
+            # Таблица подписок на лиги и команды
+            await db.execute('''
+                CREATE TABLE IF NOT EXISTS user_follows (
+                    user_id INTEGER,
+                    kind TEXT,
+                    follow_key TEXT,
+                    title TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (user_id, kind, follow_key),
+                    FOREIGN KEY (user_id) REFERENCES users (user_id)
+                )
+            ''')
+            
+            # Таблица канонических матчей (один матч у разных букмекеров)
+            await db.execute('''
+                CREATE TABLE IF NOT EXISTS fixtures (
+                    id TEXT PRIMARY KEY,
+                    home_team TEXT,
+                    away_team TEXT,
+                    home_key TEXT,
+                    away_key TEXT,
+                    league TEXT,
+                    match_time TIMESTAMP,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            await db.execute('CREATE INDEX IF NOT EXISTS idx_fixtures_match_time ON fixtures (match_time)')
+            
+            # Таблица исторических коэффициентов и исходов для бэктеста
+            await db.execute('''
+                CREATE TABLE IF NOT EXISTS historical_odds (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    home_team TEXT,
+                    away_team TEXT,
+                    league TEXT,
+                    bookmaker TEXT,
+                    coefficient_1 REAL,
+                    coefficient_2 REAL,
+                    match_time TIMESTAMP,
+                    result INTEGER,
+                    UNIQUE (home_team, away_team, bookmaker, match_time)
+                )
+            ''')
+            
             await db.commit()
             logger.info("База данных инициализирована")
     
+    async def _ensure_column(self, db, table: str, column: str, definition: str):
+        """Добавление столбца в существующую таблицу"""
+        async with db.execute(f'PRAGMA table_info({table})') as cursor:
+            columns = [row[1] for row in await cursor.fetchall()]
+        if column not in columns:
+            await db.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+    
     async def add_user(self, user_id: int, username: str = None, first_name: str = None, last_name: str = None):
         """Добавление нового пользователя"""
         async with aiosqlite.connect(self.db_path) as db:
@@ -93,6 +247,14 @@ class Database:
                 INSERT OR IGNORE INTO users (user_id, username, first_name, last_name)
                 VALUES (?, ?, ?, ?)
             ''', (user_id, username, first_name, last_name))
+            # Пользователь снова пишет боту — чат доступен
+            await db.execute('UPDATE users SET is_active = TRUE WHERE user_id = ? AND is_active = FALSE', (user_id,))
+            await db.commit()
+    
+    async def deactivate_users(self, user_ids: List[int]):
+        """Пакетная деактивация пользователей с недоступными чатами"""
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.executemany('UPDATE users SET is_active = FALSE WHERE user_id = ?', [(user_id,) for user_id in user_ids])
             await db.commit()
     
     async def get_user(self, user_id: int) -> Optional[Dict]:
@@ -115,6 +277,73 @@ class Database:
                 WHERE user_id = ?
             ''', (subscription_type, end_date, user_id))
             await db.commit()
+        
+        await self._notify_subscription_listeners(user_id, subscription_type, end_date)
+    
+    async def _notify_subscription_listeners(self, user_id: int, subscription_type: str, end_date: datetime):
+        """Вызов обработчиков изменения подписки"""
+        for listener in self.subscription_listeners:
+            try:
+                await listener(user_id, subscription_type, end_date)
+            except Exception as e:
+                logger.error(f"Ошибка обработчика подписки пользователя {user_id}: {e}")
+    
+    async def activate_payment(self, payment_id: str, unique_id: Optional[str], user_id: int, subscription_type: str,
+                               amount: float, days: int) -> Optional[datetime]:
+        """Атомарная активация подписки по платежу; None, если платеж уже учтен"""
+        activated = await self.activate_payments([{
+            'payment_id': payment_id, 'unique_id': unique_id, 'user_id': user_id,
+            'subscription_type': subscription_type, 'amount': amount, 'days': days
+        }])
+        return activated[0]['subscription_end'] if activated else None
+    
+    async def activate_payments(self, payments: List[Dict]) -> List[Dict]:
+        """Атомарная активация пачки платежей; возвращает платежи, учтенные впервые"""
+        now = datetime.now()
+        activated = []
+        async with aiosqlite.connect(self.db_path, timeout=DATABASE_BUSY_TIMEOUT) as db:
+            # Блокировка на запись: учет платежа, продление подписки и запись о покупке — одна транзакция
+            await db.execute('BEGIN IMMEDIATE')
+            for payment in payments:
+                await db.execute('SAVEPOINT payment')
+                cursor = await db.execute('''
+                    INSERT OR IGNORE INTO payment_ledger (payment_id, unique_id, user_id, subscription_type, amount, activated_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (payment['payment_id'], payment['unique_id'], payment['user_id'], payment['subscription_type'],
+                      payment['amount'], now))
+                claimed = cursor.rowcount > 0
+                if claimed and payment['unique_id']:
+                    # Намерение оплачивается один раз, под каким бы ключом ни пришел платеж
+                    # (id доната из webhook, id из сверки или intent:<unique_id>)
+                    cursor = await db.execute('''
+                        UPDATE payment_intents SET status = 'paid', payment_id = ?, updated_at = ?
+                        WHERE unique_id = ? AND status != 'paid'
+                    ''', (payment['payment_id'], now, payment['unique_id']))
+                    claimed = cursor.rowcount > 0
+                if not claimed:
+                    await db.execute('ROLLBACK TO payment')
+                    await db.execute('RELEASE payment')
+                    continue
+                await db.execute('RELEASE payment')
+                
+                end_date = now + timedelta(days=payment['days'])
+                await db.execute('''
+                    UPDATE users 
+                    SET subscription_type = ?, subscription_end = ?, daily_signals_used = 0
+                    WHERE user_id = ?
+                ''', (payment['subscription_type'], end_date, payment['user_id']))
+                await db.execute('''
+                    INSERT INTO subscriptions (user_id, subscription_type, amount, payment_id)
+                    VALUES (?, ?, ?, ?)
+                ''', (payment['user_id'], payment['subscription_type'], payment['amount'], payment['payment_id']))
+                activated.append({**payment, 'subscription_end': end_date})
+            await db.commit()
+        
+        for payment in activated:
+            await self._notify_subscription_listeners(
+                payment['user_id'], payment['subscription_type'], payment['subscription_end']
+            )
+        return activated
     
     async def revoke_subscription(self, user_id: int):
         """Отзыв подписки пользователя"""
@@ -152,6 +381,21 @@ class Database:
             ''', (today, today, user_id))
             await db.commit()
     
+    async def increment_daily_signals_many(self, user_ids: List[int]):
+        """Увеличение счетчика сигналов за день для пачки пользователей"""
+        today = datetime.now().date()
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.executemany('''
+                UPDATE users 
+                SET daily_signals_used = CASE 
+                    WHEN last_signal_date != ? THEN 1
+                    ELSE daily_signals_used + 1
+                END,
+                last_signal_date = ?
+                WHERE user_id = ?
+            ''', [(today, today, user_id) for user_id in user_ids])
+            await db.commit()
+    
     async def add_admin(self, admin_id: int, username: str = None, first_name: str = None, last_name: str = None):
         """Добавление администратора"""
         async with aiosqlite.connect(self.db_path) as db:
@@ -191,14 +435,16 @@ class Database:
             await db.commit()
     
     async def add_match(self, home_team: str, away_team: str, league: str, bookmaker: str, 
-                       coefficient_1: float, coefficient_2: float, match_time: datetime):
+                       coefficient_1: float, coefficient_2: float, match_time: datetime,
+                       fixture_id: str = None):
         """Добавление найденного матча"""
         async with aiosqlite.connect(self.db_path) as db:
-            await db.execute('''
-                INSERT INTO matches (home_team, away_team, league, bookmaker, coefficient_1, coefficient_2, match_time)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (home_team, away_team, league, bookmaker, coefficient_1, coefficient_2, match_time))
+            cursor = await db.execute('''
+                INSERT INTO matches (home_team, away_team, league, bookmaker, coefficient_1, coefficient_2, match_time, fixture_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (home_team, away_team, league, bookmaker, coefficient_1, coefficient_2, match_time, fixture_id))
             await db.commit()
+            return cursor.lastrowid
     
     async def get_unsent_matches(self) -> List[Dict]:
         """Получение неотправленных матчей"""
@@ -227,6 +473,273 @@ class Database:
             ''', (user_id, match_id))
             await db.commit()
     
+    async def enqueue_outbox(self, rows: List[Tuple], send_after: datetime = None) -> int:
+        """Пакетная постановка сигналов (user_id, match_id, payload) в outbox"""
+        now = datetime.now()
+        send_after = send_after or now
+        async with aiosqlite.connect(self.db_path) as db:
+            before = db.total_changes
+            await db.executemany('''
+                INSERT OR IGNORE INTO outbox (user_id, match_id, payload, state, attempts, next_attempt_at, created_at)
+                VALUES (?, ?, ?, 'pending', 0, ?, ?)
+            ''', [(user_id, match_id, payload, send_after, now) for user_id, match_id, payload in rows])
+            await db.commit()
+            return db.total_changes - before
+    
+    async def count_queued_outbox(self) -> Dict[int, int]:
+        """Число недоставленных строк outbox по пользователям"""
+        async with aiosqlite.connect(self.db_path) as db:
+            async with db.execute('''
+                SELECT user_id, COUNT(*) FROM outbox
+                WHERE state IN ('pending', 'sending')
+                GROUP BY user_id
+            ''') as cursor:
+                rows = await cursor.fetchall()
+                return {row[0]: row[1] for row in rows}
+    
+    async def claim_outbox(self, limit: int, now: datetime) -> List[Dict]:
+        """Захват всех готовых строк outbox для пачки из limit пользователей"""
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            # Блокировка на запись: две пачки не могут захватить одну строку
+            await db.execute('BEGIN IMMEDIATE')
+            async with db.execute('''
+                SELECT * FROM outbox
+                WHERE state = 'pending' AND next_attempt_at <= ? AND user_id IN (
+                    SELECT DISTINCT user_id FROM outbox
+                    WHERE state = 'pending' AND next_attempt_at <= ?
+                    LIMIT ?
+                )
+                ORDER BY user_id, id
+            ''', (now, now, limit)) as cursor:
+                rows = [dict(row) for row in await cursor.fetchall()]
+            
+            if rows:
+                await db.executemany('''
+                    UPDATE outbox SET state = 'sending', attempts = attempts + 1, claimed_at = ?
+                    WHERE id = ?
+                ''', [(now, row['id']) for row in rows])
+            await db.commit()
+            
+            for row in rows:
+                row['attempts'] += 1
+            return rows
+    
+    async def complete_outbox(self, rows: List[Dict], sent_at: datetime):
+        """Фиксация доставки сигналов одного сообщения вместе со счетчиками в одной транзакции"""
+        today = sent_at.date()
+        async with aiosqlite.connect(self.db_path) as db:
+            for row in rows:
+                cursor = await db.execute('''
+                    UPDATE outbox SET state = 'sent', sent_at = ?, last_error = NULL
+                    WHERE id = ? AND state = 'sending'
+                ''', (sent_at, row['id']))
+                if not cursor.rowcount:
+                    continue
+                
+                # Лимит списывается за каждый сигнал, а не за сообщение
+                await db.execute('''
+                    INSERT INTO sent_signals (user_id, match_id, sent_at)
+                    VALUES (?, ?, ?)
+                ''', (row['user_id'], row['match_id'], sent_at))
+                await db.execute('UPDATE matches SET is_sent = TRUE WHERE id = ?', (row['match_id'],))
+                await db.execute('''
+                    UPDATE users 
+                    SET daily_signals_used = CASE 
+                        WHEN last_signal_date != ? THEN 1
+                        ELSE daily_signals_used + 1
+                    END,
+                    last_signal_date = ?
+                    WHERE user_id = ?
+                ''', (today, today, row['user_id']))
+            await db.commit()
+    
+    async def retry_outbox(self, outbox_ids: List[int], next_attempt_at: datetime, error: str):
+        """Возврат строк outbox в очередь с отложенной попыткой"""
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.executemany('''
+                UPDATE outbox SET state = 'pending', next_attempt_at = ?, last_error = ?
+                WHERE id = ? AND state = 'sending'
+            ''', [(next_attempt_at, error, outbox_id) for outbox_id in outbox_ids])
+            await db.commit()
+    
+    async def fail_outbox(self, outbox_ids: List[int], error: str):
+        """Окончательная ошибка доставки строк outbox"""
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.executemany('''
+                UPDATE outbox SET state = 'failed', last_error = ?
+                WHERE id = ? AND state = 'sending'
+            ''', [(error, outbox_id) for outbox_id in outbox_ids])
+            await db.commit()
+    
+    async def add_digest(self, user_id: int, match_ids: List[int]) -> int:
+        """Сохранение дайджеста сигналов пользователя"""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute('''
+                INSERT INTO digests (user_id, match_ids, created_at)
+                VALUES (?, ?, ?)
+            ''', (user_id, json.dumps(match_ids), datetime.now()))
+            await db.commit()
+            return cursor.lastrowid
+    
+    async def get_digest(self, digest_id: int) -> Optional[Dict]:
+        """Получение дайджеста"""
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            async with db.execute('SELECT * FROM digests WHERE id = ?', (digest_id,)) as cursor:
+                row = await cursor.fetchone()
+                if not row:
+                    return None
+                digest = dict(row)
+                digest['match_ids'] = json.loads(digest['match_ids'])
+                return digest
+    
+    async def add_channel_member(self, user_id: int, invite_link: str):
+        """Запись о приглашении пользователя в канал сигналов"""
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute('''
+                INSERT OR REPLACE INTO channel_members (user_id, invite_link, invited_at, removed_at)
+                VALUES (?, ?, ?, NULL)
+            ''', (user_id, invite_link, datetime.now()))
+            await db.commit()
+    
+    async def get_expired_channel_members(self, now: datetime, limit: int) -> List[int]:
+        """Участники канала без действующей подписки"""
+        async with aiosqlite.connect(self.db_path) as db:
+            async with db.execute('''
+                SELECT cm.user_id FROM channel_members cm
+                JOIN users u ON u.user_id = cm.user_id
+                WHERE cm.removed_at IS NULL AND (
+                    u.subscription_type IN ('trial', 'revoked')
+                    OR u.subscription_end IS NULL
+                    OR u.subscription_end < ?
+                )
+                LIMIT ?
+            ''', (now, limit)) as cursor:
+                rows = await cursor.fetchall()
+                return [row[0] for row in rows]
+    
+    async def mark_channel_members_removed(self, user_ids: List[int]):
+        """Отметка об удалении пользователей из канала"""
+        now = datetime.now()
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.executemany('''
+                UPDATE channel_members SET removed_at = ? WHERE user_id = ?
+            ''', [(now, user_id) for user_id in user_ids])
+            await db.commit()
+    
+    async def get_matches_by_ids(self, match_ids: List[int]) -> Dict[int, Dict]:
+        """Получение матчей по идентификаторам"""
+        if not match_ids:
+            return {}
+        placeholders = ','.join('?' * len(match_ids))
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            async with db.execute(f'SELECT * FROM matches WHERE id IN ({placeholders})', list(match_ids)) as cursor:
+                rows = await cursor.fetchall()
+                return {row['id']: dict(row) for row in rows}
+    
+    async def reset_stale_outbox(self, claimed_before: datetime) -> int:
+        """Возврат в очередь строк, захваченных раньше указанного времени"""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute('''
+                UPDATE outbox SET state = 'pending'
+                WHERE state = 'sending' AND claimed_at < ?
+            ''', (claimed_before,))
+            await db.commit()
+            return cursor.rowcount
+    
+    async def prune_outbox(self, before: datetime) -> int:
+        """Удаление доставленных и окончательно неудачных строк outbox и старых дайджестов"""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute('''
+                DELETE FROM outbox WHERE state IN ('sent', 'failed') AND created_at < ?
+            ''', (before,))
+            await db.execute('DELETE FROM digests WHERE created_at < ?', (before,))
+            await db.commit()
+            return cursor.rowcount
+    
+    async def add_payment_intent(self, intent: Dict):
+        """Сохранение намерения оплаты"""
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute('''
+                INSERT INTO payment_intents
+                (unique_id, external_id, user_id, subscription_type, amount, webhook_url, status, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, 'pending', ?, ?)
+            ''', (intent['unique_id'], intent['external_id'], intent['user_id'], intent['subscription_type'],
+                  intent['amount'], intent.get('webhook_url'), intent['created_at'], intent['created_at']))
+            await db.commit()
+    
+    async def get_payment_intent(self, unique_id: str = None, external_id: str = None) -> Optional[Dict]:
+        """Намерение оплаты по unique_id или external_id"""
+        column, value = ('unique_id', unique_id) if unique_id is not None else ('external_id', external_id)
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            async with db.execute(f'SELECT * FROM payment_intents WHERE {column} = ?', (value,)) as cursor:
+                row = await cursor.fetchone()
+                return dict(row) if row else None
+    
+    async def get_latest_payment_intent(self, user_id: int, subscription_type: str,
+                                        status: str = 'pending') -> Optional[Dict]:
+        """Последнее намерение оплаты пользователя по типу подписки"""
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            async with db.execute('''
+                SELECT * FROM payment_intents
+                WHERE user_id = ? AND subscription_type = ? AND status = ?
+                ORDER BY created_at DESC LIMIT 1
+            ''', (user_id, subscription_type, status)) as cursor:
+                row = await cursor.fetchone()
+                return dict(row) if row else None
+    
+    async def set_payment_intent_message(self, unique_id: str, chat_id: int, message_id: int):
+        """Привязка сообщения со ссылкой на оплату к намерению"""
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute('''
+                UPDATE payment_intents SET chat_id = ?, message_id = ? WHERE unique_id = ?
+            ''', (chat_id, message_id, unique_id))
+            await db.commit()
+    
+    async def set_payment_intent_status(self, unique_id: str, status: str, from_status: str = 'pending') -> bool:
+        """Смена статуса намерения, если оно еще в статусе from_status"""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute('''
+                UPDATE payment_intents SET status = ?, updated_at = ? WHERE unique_id = ? AND status = ?
+            ''', (status, datetime.now(), unique_id, from_status))
+            await db.commit()
+            return cursor.rowcount > 0
+    
+    async def get_pending_payment_intents(self, limit: int, after: Tuple = None) -> List[Dict]:
+        """Страница неоплаченных намерений по (created_at, unique_id) после указанной позиции"""
+        created_at, unique_id = after or ('', '')
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            async with db.execute('''
+                SELECT * FROM payment_intents
+                WHERE status = 'pending' AND (created_at > ? OR (created_at = ? AND unique_id > ?))
+                ORDER BY created_at, unique_id
+                LIMIT ?
+            ''', (created_at, created_at, unique_id, limit)) as cursor:
+                rows = await cursor.fetchall()
+                return [dict(row) for row in rows]
+    
+    async def expire_payment_intents(self, unique_ids: List[str]) -> List[str]:
+        """Перевод указанных намерений в просроченные, если они еще не оплачены"""
+        expired = []
+        async with aiosqlite.connect(self.db_path) as db:
+            # Пачками, чтобы не упереться в предел числа параметров SQLite
+            for start in range(0, len(unique_ids), 500):
+                chunk = unique_ids[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                async with db.execute(f'''
+                    UPDATE payment_intents SET status = 'expired', updated_at = ?
+                    WHERE status = 'pending' AND unique_id IN ({placeholders})
+                    RETURNING unique_id
+                ''', (datetime.now(), *chunk)) as cursor:
+                    expired.extend(row[0] for row in await cursor.fetchall())
+            await db.commit()
+        return expired
+    
     async def get_subscription_stats(self) -> Dict:
         """Получение статистики подписок"""
         async with aiosqlite.connect(self.db_path) as db:
@@ -296,4 +809,106 @@ class Database:
                 AND is_active = TRUE
             ''') as cursor:
                 rows = await cursor.fetchall()
-                return [dict(row) for row in rows] 
\ No newline at end of file
+                return [dict(row) for row in rows]
+    
+    async def add_user_strategy(self, user_id: int, coefficient_1: float, coefficient_2: float, tolerance: float) -> int:
+        """Добавление пользовательской стратегии"""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute('''
+                INSERT INTO user_strategies (user_id, coefficient_1, coefficient_2, tolerance)
+                VALUES (?, ?, ?, ?)
+            ''', (user_id, coefficient_1, coefficient_2, tolerance))
+            await db.commit()
+            return cursor.lastrowid
+    
+    async def remove_user_strategy(self, user_id: int, strategy_id: int) -> bool:
+        """Удаление пользовательской стратегии"""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute('''
+                DELETE FROM user_strategies WHERE id = ? AND user_id = ?
+            ''', (strategy_id, user_id))
+            await db.commit()
+            return cursor.rowcount > 0
+    
+    async def get_user_strategies(self, user_id: int) -> List[Dict]:
+        """Получение стратегий пользователя"""
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            async with db.execute('''
+                SELECT * FROM user_strategies WHERE user_id = ? ORDER BY id
+            ''', (user_id,)) as cursor:
+                rows = await cursor.fetchall()
+                return [dict(row) for row in rows]
+    
+    async def get_all_strategies(self) -> List[Dict]:
+        """Получение всех пользовательских стратегий"""
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            async with db.execute('SELECT * FROM user_strategies ORDER BY id') as cursor:
+                rows = await cursor.fetchall()
+                return [dict(row) for row in rows] 
+    
+    async def add_follow(self, user_id: int, kind: str, follow_key: str, title: str):
+        """Подписка пользователя на лигу или команду"""
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute('''
+                INSERT OR IGNORE INTO user_follows (user_id, kind, follow_key, title)
+                VALUES (?, ?, ?, ?)
+            ''', (user_id, kind, follow_key, title))
+            await db.commit()
+    
+    async def remove_follow(self, user_id: int, kind: str, follow_key: str):
+        """Отписка пользователя от лиги или команды"""
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute('''
+                DELETE FROM user_follows WHERE user_id = ? AND kind = ? AND follow_key = ?
+            ''', (user_id, kind, follow_key))
+            await db.commit()
+    
+    async def get_all_follows(self) -> List[Dict]:
+        """Получение всех подписок на лиги и команды"""
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            async with db.execute('SELECT * FROM user_follows') as cursor:
+                rows = await cursor.fetchall()
+                return [dict(row) for row in rows]
+    
+    async def add_fixtures(self, fixtures: List[Tuple]):
+        """Пакетное добавление канонических матчей"""
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.executemany('''
+                INSERT OR IGNORE INTO fixtures (id, home_team, away_team, home_key, away_key, league, match_time)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', fixtures)
+            await db.commit()
+    
+    async def get_fixtures_since(self, since: datetime) -> List[Dict]:
+        """Получение канонических матчей, начинающихся после указанного времени"""
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            async with db.execute('''
+                SELECT * FROM fixtures WHERE match_time >= ?
+            ''', (since,)) as cursor:
+                rows = await cursor.fetchall()
+                return [dict(row) for row in rows]
+    
+    async def add_historical_odds(self, rows: List[Tuple]):
+        """Пакетное добавление исторических коэффициентов"""
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.executemany('''
+                INSERT OR REPLACE INTO historical_odds
+                (home_team, away_team, league, bookmaker, coefficient_1, coefficient_2, match_time, result)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            await db.commit()
+    
+    async def get_historical_odds(self) -> List[Dict]:
+        """Исторические коэффициенты в порядке времени матчей"""
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            async with db.execute('''
+                SELECT coefficient_1, coefficient_2, result FROM historical_odds
+                ORDER BY match_time, id
+            ''') as cursor:
+                rows = await cursor.fetchall()
+                return [dict(row) for row in rows]
\ No newline at end of file
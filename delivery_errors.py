@@ -0,0 +1,148 @@
+import logging
+from collections import Counter
+from typing import Dict, Set
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+
+from config import CHANNEL_RETRY_BACKOFF, CHANNEL_RETRY_BACKOFF_MAX
+from database import Database
+from ttl import TTLMap
+
+logger = logging.getLogger(__name__)
+
+# Причины ошибок доставки
+REASON_BLOCKED = 'blocked'
+REASON_CHAT_NOT_FOUND = 'chat_not_found'
+REASON_DEACTIVATED = 'deactivated'
+REASON_RETRY_AFTER = 'retry_after'
+REASON_TRANSIENT = 'transient'
+REASON_OTHER = 'other'
+REASON_INACTIVE = 'inactive'
+REASON_CONFIG = 'config'
+
+# Ошибки, после которых писать в чат бессмысленно
+PERMANENT_REASONS = {REASON_BLOCKED, REASON_CHAT_NOT_FOUND, REASON_DEACTIVATED, REASON_INACTIVE}
+
+REASON_TITLES = {
+    REASON_BLOCKED: 'Бот заблокирован',
+    REASON_CHAT_NOT_FOUND: 'Чат не найден',
+    REASON_DEACTIVATED: 'Аккаунт удален',
+    REASON_RETRY_AFTER: 'Лимит Telegram',
+    REASON_TRANSIENT: 'Временные ошибки',
+    REASON_OTHER: 'Прочие ошибки',
+    REASON_INACTIVE: 'Пропущено (чат недоступен)',
+    REASON_CONFIG: 'Ошибка настройки канала'
+}
+
+
+class ChatUnavailable(Exception):
+    """Отправка пропущена: чат уже признан недоступным"""
+
+
+def classify_error(error: Exception) -> str:
+    """Причина ошибки отправки сообщения"""
+    message = str(error).lower()
+    
+    if isinstance(error, ChatUnavailable):
+        return REASON_INACTIVE
+    if isinstance(error, RetryAfter):
+        return REASON_RETRY_AFTER
+    if isinstance(error, Forbidden):
+        if 'deactivated' in message:
+            return REASON_DEACTIVATED
+        return REASON_BLOCKED
+    if isinstance(error, BadRequest):
+        if 'chat not found' in message or 'user not found' in message:
+            return REASON_CHAT_NOT_FOUND
+        if 'deactivated' in message:
+            return REASON_DEACTIVATED
+        return REASON_OTHER
+    # BadRequest наследует NetworkError, поэтому проверяется раньше
+    if isinstance(error, (TimedOut, NetworkError)):
+        return REASON_TRANSIENT
+    return REASON_OTHER
+
+
+def is_permanent(error: Exception) -> bool:
+    """Ошибка означает, что чат больше недоступен"""
+    return classify_error(error) in PERMANENT_REASONS
+
+
+class DeliveryErrorTracker:
+    """Счетчики ошибок доставки и пакетная деактивация недоступных чатов"""
+    
+    def __init__(self, database: Database):
+        self.db = database
+        self.counters: Counter = Counter()
+        # Недоступные чаты, еще не записанные в базу
+        self.pending_deactivations: Set[int] = set()
+        # Все чаты, признанные недоступными с момента запуска
+        self.dead_chats: Set[int] = set()
+        # Чаты из настроек (канал сигналов): недоступность — ошибка настройки, а не уход пользователя
+        self.config_chats: Set[int] = set()
+        # chat_id -> подряд идущих ошибок настройки; пауза перед повтором — в config_backoff
+        self.config_failures: Dict[int, int] = {}
+        self.config_backoff = TTLMap()
+    
+    def add_config_chat(self, chat_id: int):
+        """Чат из настроек никогда не отключается навсегда"""
+        self.config_chats.add(chat_id)
+    
+    def record_success(self, chat_id: int = None):
+        self.counters['sent'] += 1
+        self.config_failures.pop(chat_id, None)
+    
+    def record(self, chat_id: int, error: Exception) -> str:
+        """Учет ошибки отправки; возвращает причину"""
+        reason = classify_error(error)
+        
+        if chat_id in self.config_chats:
+            if reason in PERMANENT_REASONS and reason != REASON_INACTIVE:
+                reason = REASON_CONFIG
+                self._back_off(chat_id, error)
+            self.counters[reason] += 1
+            return reason
+        
+        self.counters[reason] += 1
+        if reason in PERMANENT_REASONS and chat_id not in self.dead_chats:
+            self.dead_chats.add(chat_id)
+            self.pending_deactivations.add(chat_id)
+            logger.info(f"Чат {chat_id} недоступен ({reason}): {error}")
+        return reason
+    
+    def _back_off(self, chat_id: int, error: Exception):
+        """Пауза перед повтором отправки в чат из настроек"""
+        # Параллельные отправки той же рассылки не удлиняют уже назначенную паузу
+        if chat_id in self.config_backoff:
+            return
+        failures = self.config_failures.get(chat_id, 0) + 1
+        self.config_failures[chat_id] = failures
+        delay = min(CHANNEL_RETRY_BACKOFF * 2 ** (failures - 1), CHANNEL_RETRY_BACKOFF_MAX)
+        self.config_backoff.set(chat_id, True, delay)
+        logger.error(
+            f"Чат {chat_id} из настроек недоступен: {error}. "
+            f"Проверьте, что бот добавлен в канал администратором; повтор через {delay} с"
+        )
+    
+    def is_dead(self, chat_id: int) -> bool:
+        return chat_id in self.dead_chats or chat_id in self.config_backoff
+    
+    def revive(self, chat_id: int):
+        """Пользователь снова написал боту"""
+        self.dead_chats.discard(chat_id)
+        self.pending_deactivations.discard(chat_id)
+    
+    async def flush(self) -> int:
+        """Деактивация накопленных недоступных чатов одним запросом"""
+        if not self.pending_deactivations:
+            return 0
+        
+        user_ids = list(self.pending_deactivations)
+        self.pending_deactivations.clear()
+        await self.db.deactivate_users(user_ids)
+        logger.info(f"Деактивировано недоступных пользователей: {len(user_ids)}")
+        return len(user_ids)
+    
+    def snapshot(self) -> Dict[str, int]:
+        """Текущие значения счетчиков"""
+        return dict(self.counters)
@@ -1,81 +1,50 @@
-import aiohttp
 import asyncio
 import logging
-import uuid
 import aiosqlite
-from datetime import datetime, timedelta
 from typing import Dict, Optional, List
 from config import DONATION_ALERTS_TOKEN, DONATION_ALERTS_URL, SUBSCRIPTION_PRICES
 from database import Database
+from donation_alerts_client import DonationAlertsClient
+from payment_intents import PaymentIntentStore
+from payment_ledger import PaymentLedger
+
+# Индивидуальный webhook для каждого платежа
+PAYMENT_WEBHOOK_URL = "https://telegrambotfootballproduction-production.up.railway.app/webhook/donation_alerts/{unique_id}"
 
 logger = logging.getLogger(__name__)
 
 class DonationAlerts:
     def __init__(self, database: Database):
         self.db = database
-        self.token = DONATION_ALERTS_TOKEN
         self.base_url = DONATION_ALERTS_URL
-        self.session = None
-        self.payment_links = {}  # Кэш для хранения ссылок на оплату
+        # Один клиент API на процесс: соединения переиспользуются между покупками
+        self.client = DonationAlertsClient(DONATION_ALERTS_TOKEN)
+        # Намерения оплаты хранятся в базе и переживают рестарт
+        self.intents = PaymentIntentStore(database)
+        # Журнал платежей: активация подписки ровно один раз на платеж
+        self.ledger = PaymentLedger(database, self.intents)
         
-    async def ensure_session(self):
-        """Обеспечивает наличие активной сессии"""
-        if self.session is None:
-            self.session = aiohttp.ClientSession()
+    async def close(self):
+        """Закрытие соединений с API"""
+        await self.client.close()
         
     async def __aenter__(self):
-        self.session = aiohttp.ClientSession()
         return self
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        if self.session:
-            await self.session.close()
-    
-    def generate_unique_payment_link(self, user_id: int, subscription_type: str) -> str:
-        """Генерация уникальной ссылки для оплаты"""
-        unique_id = str(uuid.uuid4())
-        payment_data = {
-            'user_id': user_id,
-            'subscription_type': subscription_type,
-            'amount': SUBSCRIPTION_PRICES[subscription_type],
-            'unique_id': unique_id,
-            'created_at': datetime.now()
-        }
-        
-        # Сохраняем данные платежа в кэше
-        self.payment_links[unique_id] = payment_data
-        
-        # Генерируем уникальную ссылку
-        if self.base_url.endswith('/'):
-            payment_url = f"{self.base_url}{unique_id}"
-        else:
-            payment_url = f"{self.base_url}/{unique_id}"
-        
-        return payment_url
+        await self.close()
     
     async def create_payment_link(self, user_id: int, subscription_type: str) -> Dict:
         """Создание ссылки для оплаты"""
+        payment_data = None
         try:
             if subscription_type not in SUBSCRIPTION_PRICES:
                 raise ValueError(f"Неизвестный тип подписки: {subscription_type}")
             
-            await self.ensure_session()
             amount = SUBSCRIPTION_PRICES[subscription_type]
-            unique_id = str(uuid.uuid4())
+            payment_data = await self.intents.create(user_id, subscription_type, amount, PAYMENT_WEBHOOK_URL)
+            unique_id = payment_data['unique_id']
             payment_url = f"{self.base_url}/{unique_id}"
-            payment_data = {
-                'user_id': user_id,
-                'subscription_type': subscription_type,
-                'amount': amount,
-                'unique_id': unique_id,
-                'created_at': datetime.now(),
-                'webhook_url': f"https://telegrambotfootballproduction-production.up.railway.app/webhook/donation_alerts/{unique_id}"
-            }
-            self.payment_links[unique_id] = payment_data
-            headers = {
-                'Authorization': f'Bearer {self.token}',
-                'Content-Type': 'application/json'
-            }
             payload = {
                 'url': payment_url,
                 'amount': amount,
@@ -85,127 +54,82 @@ class DonationAlerts:
                 'webhook_url': payment_data['webhook_url'],
                 'auto_confirm': True
             }
-            async with self.session.post(
-                'https://www.donationalerts.com/api/v1/alerts/donations',
-                headers=headers,
-                json=payload
-            ) as response:
-                if response.status == 200:
-                    return {
-                        'payment_url': payment_url,
-                        'amount': amount,
-                        'subscription_type': subscription_type,
-                        'external_id': unique_id,
-                        'webhook_url': payment_data['webhook_url']
-                    }
-                else:
-                    logger.error(f"Ошибка создания ссылки DonationAlerts: {response.status}")
-                    return None
+            # Повтор с тем же ключом не создаст второй донат
+            status, _ = await self.client.request('create_donation', 'POST', '/alerts/donations',
+                                                  json=payload, idempotency_key=unique_id)
+            if status == 200:
+                return {
+                    'payment_url': payment_url,
+                    'amount': amount,
+                    'subscription_type': subscription_type,
+                    'external_id': unique_id,
+                    'webhook_url': payment_data['webhook_url']
+                }
+            else:
+                logger.error(f"Ошибка создания ссылки DonationAlerts: {status}")
         except Exception as e:
             logger.error(f"Ошибка при создании ссылки для оплаты: {e}")
-            return None
+        
+        # Ссылку пользователь не получил — намерение не должно висеть ожидающим
+        if payment_data:
+            await self.intents.fail(payment_data['unique_id'])
+        return None
 
     async def check_payment_status(self, unique_id: str) -> Optional[Dict]:
         """Мгновенная проверка статуса платежа"""
         try:
-            await self.ensure_session()
-            payment_data = None
-            for cached_id, data in self.payment_links.items():
-                if data.get('external_id') == unique_id or cached_id == unique_id:
-                    payment_data = data
-                    break
+            payment_data = await self.intents.get(unique_id) or await self.intents.get_by_external_id(unique_id)
             if not payment_data:
                 return {
                     'status': 'not_found',
                     'message': 'Платеж не найден'
                 }
-            headers = {
-                'Authorization': f'Bearer {self.token}',
-                'Content-Type': 'application/json'
-            }
-            async with self.session.get(
-                f'https://www.donationalerts.com/api/v1/alerts/donations/{unique_id}',
-                headers=headers,
-                timeout=aiohttp.ClientTimeout(total=5)
-            ) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if data.get('status') == 'paid':
-                        paid_amount = float(data.get('amount', 0))
-                        required_amount = payment_data['amount']
-                        if paid_amount >= required_amount:
-                            return {
-                                'status': 'success',
-                                'user_id': payment_data['user_id'],
-                                'subscription_type': payment_data['subscription_type'],
-                                'amount': paid_amount,
-                                'payment_id': data.get('id'),
-                                'payment_data': data
-                            }
-                        else:
-                            return {
-                                'status': 'insufficient_amount',
-                                'paid_amount': paid_amount,
-                                'required_amount': required_amount
-                            }
-                    elif data.get('status') == 'pending':
-                        return {'status': 'pending', 'message': 'Платеж в обработке'}
+            status, data = await self.client.request('get_donation', 'GET', f'/alerts/donations/{unique_id}')
+            if status == 200:
+                if data.get('status') == 'paid':
+                    paid_amount = float(data.get('amount', 0))
+                    required_amount = payment_data['amount']
+                    if paid_amount >= required_amount:
+                        return {
+                            'status': 'success',
+                            'unique_id': payment_data['unique_id'],
+                            'user_id': payment_data['user_id'],
+                            'subscription_type': payment_data['subscription_type'],
+                            'amount': paid_amount,
+                            'payment_id': data.get('id'),
+                            'payment_data': data
+                        }
                     else:
-                        return {'status': 'failed', 'message': 'Платеж не прошел'}
+                        return {
+                            'status': 'insufficient_amount',
+                            'paid_amount': paid_amount,
+                            'required_amount': required_amount
+                        }
+                elif data.get('status') == 'pending':
+                    return {'status': 'pending', 'message': 'Платеж в обработке'}
                 else:
-                    logger.error(f"Ошибка проверки статуса платежа: {response.status}")
-                    return None
+                    return {'status': 'failed', 'message': 'Платеж не прошел'}
+            else:
+                logger.error(f"Ошибка проверки статуса платежа: {status}")
+                return None
         except asyncio.TimeoutError:
             logger.warning(f"Таймаут при проверке платежа {unique_id}")
             return {'status': 'timeout', 'message': 'Превышено время ожидания'}
         except Exception as e:
             logger.error(f"Ошибка при проверке платежа {unique_id}: {e}")
             return {'status': 'error', 'message': 'Ошибка проверки платежа'}
-            
-            # Проверяем платеж через API DonationAlerts
-            headers = {
-                'Authorization': f'Bearer {self.token}',
-                'Content-Type': 'application/json'
-            }
-            
-            async with self.session.get(
-                f'https://www.donationalerts.com/api/v1/alerts/donations/{payment_data["external_id"]}',
-                headers=headers
-            ) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    
-                    # Проверяем статус платежа
-                    if data.get('status') == 'paid':
-                        # Проверяем сумму платежа
-                        paid_amount = float(data.get('amount', 0))
-                        required_amount = payment_data['amount']
-                        
-                        if paid_amount >= required_amount:
-                            return {
-                                'status': 'success',
-                                'user_id': payment_data['user_id'],
-                                'subscription_type': payment_data['subscription_type'],
-                                'amount': paid_amount,
-                                'payment_id': data.get('id'),
-                                'payment_data': data
-                            }
-                        else:
-                            return {
-                                'status': 'insufficient_amount',
-                                'paid_amount': paid_amount,
-                                'required_amount': required_amount
-                            }
-                    elif data.get('status') == 'pending':
-                        return {'status': 'pending'}
-                    else:
-                        return {'status': 'failed'}
-                else:
-                    logger.error(f"Ошибка проверки статуса платежа: {response.status}")
-                    return None
-                    
+    
+    async def list_donations(self, page: int) -> Optional[Dict]:
+        """Страница последних донатов (новые первыми): {'data': [...], 'meta': {...}}"""
+        try:
+            status, data = await self.client.request('list_donations', 'GET', '/alerts/donations',
+                                                     params={'page': page})
+            if status == 200:
+                return data
+            logger.error(f"Ошибка получения списка платежей (страница {page}): {status}")
+            return None
         except Exception as e:
-            logger.error(f"Ошибка при проверке статуса платежа: {e}")
+            logger.error(f"Ошибка при получении списка платежей (страница {page}): {e}")
             return None
     
     async def process_payment_webhook(self, webhook_data: Dict) -> Optional[Dict]:
@@ -220,31 +144,29 @@ class DonationAlerts:
             if not external_id or status != 'paid':
                 return None
             
-            # Ищем соответствующий платеж в кэше
-            for unique_id, payment_data in self.payment_links.items():
-                if payment_data.get('external_id') == external_id:
-                    # Проверяем сумму
-                    required_amount = payment_data['amount']
-                    
-                    if amount >= required_amount:
-                        # Удаляем из кэша
-                        del self.payment_links[unique_id]
-                        
-                        return {
-                            'status': 'success',
-                            'user_id': payment_data['user_id'],
-                            'subscription_type': payment_data['subscription_type'],
-                            'amount': amount,
-                            'payment_id': payment_id
-                        }
-                    else:
-                        return {
-                            'status': 'insufficient_amount',
-                            'paid_amount': amount,
-                            'required_amount': required_amount
-                        }
+            # Ищем соответствующее намерение оплаты по индексу external_id
+            payment_data = await self.intents.get_by_external_id(external_id)
+            if not payment_data:
+                return None
             
-            return None
+            # Проверяем сумму
+            required_amount = payment_data['amount']
+            
+            if amount >= required_amount:
+                return {
+                    'status': 'success',
+                    'unique_id': payment_data['unique_id'],
+                    'user_id': payment_data['user_id'],
+                    'subscription_type': payment_data['subscription_type'],
+                    'amount': amount,
+                    'payment_id': payment_id
+                }
+            else:
+                return {
+                    'status': 'insufficient_amount',
+                    'paid_amount': amount,
+                    'required_amount': required_amount
+                }
             
         except Exception as e:
             logger.error(f"Ошибка при обработке webhook: {e}")
@@ -271,49 +193,24 @@ class DonationAlerts:
     async def refund_payment(self, payment_id: str, reason: str = "Отмена подписки") -> bool:
         """Возврат платежа"""
         try:
-            headers = {
-                'Authorization': f'Bearer {self.token}',
-                'Content-Type': 'application/json'
-            }
-            
             payload = {
                 'reason': reason
             }
             
-            async with self.session.post(
-                f'https://www.donationalerts.com/api/v1/alerts/donations/{payment_id}/refund',
-                headers=headers,
-                json=payload
-            ) as response:
-                if response.status == 200:
-                    logger.info(f"Платеж {payment_id} успешно возвращен")
-                    return True
-                else:
-                    logger.error(f"Ошибка возврата платежа: {response.status}")
-                    return False
+            # Один возврат на платеж: повтор после обрыва соединения не вернет деньги дважды
+            status, _ = await self.client.request('refund_donation', 'POST', f'/alerts/donations/{payment_id}/refund',
+                                                  json=payload, idempotency_key=f'refund-{payment_id}')
+            if status == 200:
+                logger.info(f"Платеж {payment_id} успешно возвращен")
+                return True
+            else:
+                logger.error(f"Ошибка возврата платежа: {status}")
+                return False
                     
         except Exception as e:
             logger.error(f"Ошибка при возврате платежа: {e}")
             return False
     
-    async def cleanup_expired_links(self):
-        """Очистка просроченных ссылок на оплату"""
-        try:
-            current_time = datetime.now()
-            expired_links = []
-            
-            for unique_id, payment_data in self.payment_links.items():
-                # Удаляем ссылки старше 24 часов
-                if current_time - payment_data['created_at'] > timedelta(hours=24):
-                    expired_links.append(unique_id)
-            
-            for unique_id in expired_links:
-                del self.payment_links[unique_id]
-                logger.info(f"Удалена просроченная ссылка: {unique_id}")
-                
-        except Exception as e:
-            logger.error(f"Ошибка при очистке просроченных ссылок: {e}")
-    
     def get_subscription_info(self, subscription_type: str) -> Dict:
         """Получение информации о подписке"""
         if subscription_type not in SUBSCRIPTION_PRICES:
@@ -0,0 +1,149 @@
+import aiohttp
+import asyncio
+import bisect
+import logging
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from config import (
+    DONATION_ALERTS_TOKEN, DONATION_ALERTS_API_URL, DONATION_ALERTS_POOL_SIZE, DONATION_ALERTS_KEEPALIVE,
+    DONATION_ALERTS_TIMEOUTS, DONATION_ALERTS_MAX_ATTEMPTS, DONATION_ALERTS_BACKOFF_BASE,
+    DONATION_ALERTS_LATENCY_BUCKETS
+)
+
+logger = logging.getLogger(__name__)
+
+# Названия операций для статистики
+OPERATION_TITLES = {
+    'create_donation': 'Создание платежа',
+    'get_donation': 'Статус платежа',
+    'list_donations': 'Список платежей',
+    'refund_donation': 'Возврат платежа'
+}
+
+# Ответы, после которых запрос имеет смысл повторить
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class LatencyHistogram:
+    """Гистограмма длительности запросов с фиксированными границами"""
+    
+    def __init__(self, buckets: Tuple[float, ...] = DONATION_ALERTS_LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        # Последняя ячейка — длительности больше верхней границы
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.errors = 0
+        self.retries = 0
+    
+    def observe(self, seconds: float):
+        """Учет одной длительности"""
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.total += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+    
+    def quantile(self, q: float) -> float:
+        """Верхняя граница ячейки, в которую попадает квантиль"""
+        if not self.total:
+            return 0.0
+        rank = q * self.total
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else self.max
+        return self.max
+    
+    def snapshot(self) -> Dict:
+        """Сводка по гистограмме"""
+        return {
+            'count': self.total,
+            'errors': self.errors,
+            'retries': self.retries,
+            'avg': self.sum / self.total if self.total else 0.0,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'max': self.max
+        }
+
+
+class DonationAlertsClient:
+    """HTTP-клиент API DonationAlerts с постоянным пулом соединений"""
+    
+    def __init__(self, token: str = DONATION_ALERTS_TOKEN, base_url: str = DONATION_ALERTS_API_URL,
+                 timeouts: Dict[str, float] = DONATION_ALERTS_TIMEOUTS,
+                 max_attempts: int = DONATION_ALERTS_MAX_ATTEMPTS):
+        self.token = token
+        self.base_url = base_url.rstrip('/')
+        self.timeouts = timeouts
+        self.max_attempts = max_attempts
+        self.session: Optional[aiohttp.ClientSession] = None
+        # Операция -> гистограмма длительности запросов
+        self.latency: Dict[str, LatencyHistogram] = {}
+    
+    def _ensure_session(self) -> aiohttp.ClientSession:
+        """Сессия создается один раз на процесс и переиспользует соединения между запросами"""
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=DONATION_ALERTS_POOL_SIZE,
+                limit_per_host=DONATION_ALERTS_POOL_SIZE,
+                keepalive_timeout=DONATION_ALERTS_KEEPALIVE,
+                ttl_dns_cache=300
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                headers={'Authorization': f'Bearer {self.token}', 'Accept': 'application/json'}
+            )
+        return self.session
+    
+    async def close(self):
+        """Закрытие сессии и пула соединений"""
+        if self.session and not self.session.closed:
+            await self.session.close()
+        self.session = None
+    
+    async def request(self, operation: str, method: str, path: str, json: Dict = None,
+                      params: Dict = None, idempotency_key: str = None) -> Tuple[int, Any]:
+        """Запрос к API: (HTTP-статус, JSON ответа или None); ошибка последней попытки пробрасывается"""
+        session = self._ensure_session()
+        histogram = self.latency.setdefault(operation, LatencyHistogram())
+        timeout = aiohttp.ClientTimeout(total=self.timeouts.get(operation, 10))
+        headers = {'Idempotency-Key': idempotency_key} if idempotency_key else None
+        # GET повторяется при сетевых ошибках, 429 и 5xx; POST — только с ключом идемпотентности
+        retriable = method == 'GET' or idempotency_key is not None
+        attempts = self.max_attempts if retriable else 1
+        
+        for attempt in range(1, attempts + 1):
+            started = time.monotonic()
+            delay = DONATION_ALERTS_BACKOFF_BASE * 2 ** (attempt - 1)
+            try:
+                async with session.request(method, f'{self.base_url}{path}', json=json, params=params,
+                                           headers=headers, timeout=timeout) as response:
+                    data = await response.json(content_type=None) if response.status == 200 else None
+                    histogram.observe(time.monotonic() - started)
+                    if response.status >= 400:
+                        histogram.errors += 1
+                    if response.status not in RETRY_STATUSES or attempt == attempts:
+                        return response.status, data
+                    
+                    retry_after = response.headers.get('Retry-After', '')
+                    if retry_after.isdigit():
+                        # Ожидание не дольше таймаута одной попытки
+                        delay = max(delay, min(float(retry_after), timeout.total))
+                    logger.warning(f"DonationAlerts {operation}: ответ {response.status}, попытка {attempt}")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                histogram.observe(time.monotonic() - started)
+                histogram.errors += 1
+                if attempt == attempts:
+                    raise
+                logger.warning(f"DonationAlerts {operation}: {type(e).__name__}, попытка {attempt}")
+            
+            histogram.retries += 1
+            await asyncio.sleep(delay)
+    
+    def latency_snapshot(self) -> Dict[str, Dict]:
+        """Длительность запросов по операциям (секунды)"""
+        return {operation: histogram.snapshot() for operation, histogram in self.latency.items()}
\ No newline at end of file
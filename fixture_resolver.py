@@ -0,0 +1,237 @@
+import logging
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from config import TEAM_ALIASES, FIXTURE_TIME_WINDOW_HOURS, FIXTURE_MATCH_THRESHOLD, FIXTURE_RETENTION_HOURS
+from database import Database
+from follow_index import normalize_key
+from ttl import TTLMap
+
+logger = logging.getLogger(__name__)
+
+# Служебные слова, не влияющие на идентичность команды
+_STOP_WORDS = {'fc', 'cf', 'afc', 'sc', 'fk', 'фк', 'the'}
+# Предел размера кэша нормализованных названий
+_NAME_CACHE_LIMIT = 50000
+# Триграммы, встречающиеся у большего числа матчей, не используются для поиска кандидатов
+_COMMON_GRAM_MIN = 50
+
+
+def trigrams(name: str) -> Set[str]:
+    """Набор триграмм нормализованного названия"""
+    padded = f"  {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _numbers(name: str) -> Tuple[str, ...]:
+    """Числовые токены названия"""
+    return tuple(word for word in name.split() if word.isdigit())
+
+
+def retention_seconds(match: Dict, now: datetime = None) -> float:
+    """Сколько секунд матч нужен в памяти: до начала и еще FIXTURE_RETENTION_HOURS после"""
+    border = match['match_time'] + timedelta(hours=FIXTURE_RETENTION_HOURS)
+    return (border - (now or datetime.now())).total_seconds()
+
+
+def jaccard(first: Set[str], second: Set[str]) -> float:
+    """Коэффициент Жаккара двух множеств"""
+    if not first or not second:
+        return 0.0
+    intersection = len(first & second)
+    return intersection / (len(first) + len(second) - intersection)
+
+
+class FixtureResolver:
+    """Определение единого идентификатора матча для разных букмекеров"""
+    
+    def __init__(self, database: Database):
+        self.db = database
+        self.loaded = False
+        self.time_window = timedelta(hours=FIXTURE_TIME_WINDOW_HOURS)
+        self.aliases = {normalize_key(alias): normalize_key(name) for alias, name in TEAM_ALIASES.items()}
+        # fixture_id -> данные матча
+        self.fixtures: Dict[str, Dict] = {}
+        # (home_key, away_key) -> идентификаторы матчей
+        self.exact_index: Dict[Tuple[str, str], List[str]] = {}
+        # триграмма названия хозяев -> идентификаторы матчей
+        self.trigram_index: Dict[str, Set[str]] = {}
+        # исходное название -> (ключ, триграммы)
+        self.name_cache: Dict[str, Tuple[str, Set[str]]] = {}
+        # Таймеры удаления давно прошедших матчей
+        self.expiry = TTLMap(on_expire=self._expire_fixtures)
+    
+    async def ensure_loaded(self):
+        """Ленивая загрузка недавних матчей из базы данных"""
+        if self.loaded:
+            return
+        self.loaded = True
+        
+        since = datetime.now() - timedelta(hours=FIXTURE_RETENTION_HOURS)
+        for fixture in await self.db.get_fixtures_since(since):
+            match_time = fixture['match_time']
+            if isinstance(match_time, str):
+                match_time = datetime.fromisoformat(match_time)
+            self._index_fixture(fixture['id'], fixture['home_key'], fixture['away_key'], {
+                'home_team': fixture['home_team'],
+                'away_team': fixture['away_team'],
+                'league': fixture['league'],
+                'match_time': match_time
+            })
+        
+        logger.info(f"Загружено матчей для сопоставления: {len(self.fixtures)}")
+    
+    def team_key(self, name: str) -> Tuple[str, Set[str]]:
+        """Канонический ключ команды и его триграммы"""
+        cached = self.name_cache.get(name)
+        if cached:
+            return cached
+        
+        key = normalize_key(name)
+        key = self.aliases.get(key, key)
+        key = ' '.join(word for word in key.split() if word not in _STOP_WORDS) or key
+        key = self.aliases.get(key, key)
+        
+        if len(self.name_cache) >= _NAME_CACHE_LIMIT:
+            self.name_cache.clear()
+        self.name_cache[name] = (key, trigrams(key))
+        return self.name_cache[name]
+    
+    def _index_fixture(self, fixture_id: str, home_key: str, away_key: str, match: Dict):
+        """Добавление матча в индексы"""
+        self.fixtures[fixture_id] = {
+            'id': fixture_id,
+            'home_key': home_key,
+            'away_key': away_key,
+            'home_grams': trigrams(home_key),
+            'away_grams': trigrams(away_key),
+            'home_team': match['home_team'],
+            'away_team': match['away_team'],
+            'league': match.get('league'),
+            'match_time': match['match_time'],
+            'variants': [(home_key, away_key)]
+        }
+        self.exact_index.setdefault((home_key, away_key), []).append(fixture_id)
+        for gram in self.fixtures[fixture_id]['home_grams']:
+            self.trigram_index.setdefault(gram, set()).add(fixture_id)
+        self.expiry.set(fixture_id, None, retention_seconds(match))
+    
+    def _unindex_fixture(self, fixture_id: str):
+        """Удаление матча из индексов"""
+        fixture = self.fixtures.pop(fixture_id)
+        self.expiry.pop(fixture_id)
+        
+        for exact_key in fixture['variants']:
+            ids = self.exact_index.get(exact_key, [])
+            if fixture_id in ids:
+                ids.remove(fixture_id)
+            if not ids:
+                self.exact_index.pop(exact_key, None)
+        
+        for gram in fixture['home_grams']:
+            postings = self.trigram_index.get(gram)
+            if postings is not None:
+                postings.discard(fixture_id)
+                if not postings:
+                    del self.trigram_index[gram]
+    
+    def _within_window(self, fixture: Dict, match_time: datetime) -> bool:
+        """Проверка попадания времени матча в окно"""
+        return abs(fixture['match_time'] - match_time) <= self.time_window
+    
+    def find_fixture(self, home_key: str, away_key: str, home_grams: Set[str],
+                     away_grams: Set[str], match_time: datetime) -> Optional[str]:
+        """Поиск существующего матча: точный ключ, затем триграммы"""
+        for fixture_id in self.exact_index.get((home_key, away_key), ()):
+            if self._within_window(self.fixtures[fixture_id], match_time):
+                return fixture_id
+        
+        # Кандидаты — матчи, у которых название хозяев делит редкие триграммы с искомым
+        common_limit = max(_COMMON_GRAM_MIN, len(self.fixtures) // 10)
+        shared = Counter()
+        for gram in home_grams:
+            postings = self.trigram_index.get(gram)
+            if postings and len(postings) <= common_limit:
+                shared.update(postings)
+        
+        best_id = None
+        best_score = FIXTURE_MATCH_THRESHOLD
+        min_shared = max(1, len(home_grams) // 3)
+        home_numbers = _numbers(home_key)
+        away_numbers = _numbers(away_key)
+        
+        for fixture_id, count in shared.items():
+            if count < min_shared:
+                continue
+            fixture = self.fixtures[fixture_id]
+            if not self._within_window(fixture, match_time):
+                continue
+            # Числа в названиях (Team 2, Динамо-2) должны совпадать точно
+            if _numbers(fixture['home_key']) != home_numbers or _numbers(fixture['away_key']) != away_numbers:
+                continue
+            
+            # Обе команды должны быть похожи, а не одна в среднем
+            score = min(jaccard(home_grams, fixture['home_grams']), jaccard(away_grams, fixture['away_grams']))
+            if score >= best_score:
+                best_id = fixture_id
+                best_score = score
+        
+        if best_id:
+            # Запоминаем вариант написания, чтобы следующий раз найти его точным ключом
+            self.exact_index.setdefault((home_key, away_key), []).append(best_id)
+            self.fixtures[best_id]['variants'].append((home_key, away_key))
+        
+        return best_id
+    
+    async def resolve_matches(self, matches: List[Dict]) -> List[Dict]:
+        """Назначение fixture_id всем матчам пачки"""
+        await self.ensure_loaded()
+        
+        new_fixtures = []
+        for match in matches:
+            if match.get('fixture_id'):
+                continue
+            
+            home_key, home_grams = self.team_key(match['home_team'])
+            away_key, away_grams = self.team_key(match['away_team'])
+            
+            fixture_id = self.find_fixture(home_key, away_key, home_grams, away_grams, match['match_time'])
+            if not fixture_id:
+                fixture_id = uuid.uuid4().hex[:16]
+                self._index_fixture(fixture_id, home_key, away_key, match)
+                new_fixtures.append((
+                    fixture_id, match['home_team'], match['away_team'],
+                    home_key, away_key, match.get('league'), match['match_time']
+                ))
+            
+            match['fixture_id'] = fixture_id
+        
+        if new_fixtures:
+            try:
+                await self.db.add_fixtures(new_fixtures)
+            except Exception as e:
+                logger.error(f"Ошибка при сохранении матчей: {e}")
+        
+        return matches
+    
+    def _expire_fixtures(self, expired: List[Tuple[str, None]]):
+        """Удаление давно прошедших матчей из памяти по таймерам"""
+        for fixture_id, _ in expired:
+            if fixture_id in self.fixtures:
+                self._unindex_fixture(fixture_id)
+    
+    @staticmethod
+    def unique_by_fixture(matches: List[Dict]) -> List[Dict]:
+        """Один матч на fixture_id (первый из найденных)"""
+        unique_matches = []
+        seen = set()
+        
+        for match in matches:
+            key = match.get('fixture_id') or f"{match['home_team']}_{match['away_team']}_{match['match_time'].strftime('%Y%m%d%H%M')}"
+            if key not in seen:
+                seen.add(key)
+                unique_matches.append(match)
+        
+        return unique_matches
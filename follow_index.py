@@ -0,0 +1,134 @@
+import hashlib
+import logging
+import re
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from config import FOLLOW_TOKEN_TTL_HOURS
+from database import Database
+from ttl import TTLMap
+
+logger = logging.getLogger(__name__)
+
+FOLLOW_LEAGUE = 'league'
+FOLLOW_TEAM = 'team'
+
+
+def normalize_key(name: str) -> str:
+    """Нормализация названия лиги или команды для индекса"""
+    name = (name or '').lower().replace('ё', 'е')
+    name = re.sub(r'[^\w\s]', ' ', name)
+    return ' '.join(name.split())
+
+
+def follow_token(kind: str, key: str) -> str:
+    """Короткий идентификатор подписки для callback_data"""
+    return hashlib.sha1(f"{kind}:{key}".encode('utf-8')).hexdigest()[:12]
+
+
+class FollowIndex:
+    """Инвертированный индекс подписок на лиги и команды"""
+    
+    def __init__(self, database: Database):
+        self.db = database
+        # kind -> нормализованный ключ -> пользователи
+        self.index: Dict[str, Dict[str, Set[int]]] = {FOLLOW_LEAGUE: {}, FOLLOW_TEAM: {}}
+        # Пользователи, у которых есть хотя бы одна подписка
+        self.following_users: Set[int] = set()
+        self.user_follows: Dict[int, Set[Tuple[str, str]]] = {}
+        # token -> (kind, key, title) для подписок, на которые кто-то подписан; восстанавливаются из базы
+        self.follow_tokens: Dict[str, Tuple[str, str, str]] = {}
+        # token -> (kind, key, title) для кнопок показанных сообщений; живут FOLLOW_TOKEN_TTL_HOURS
+        self.tokens = TTLMap()
+    
+    async def load(self):
+        """Загрузка подписок из базы данных"""
+        follows = await self.db.get_all_follows()
+        for follow in follows:
+            self._add(follow['user_id'], follow['kind'], follow['follow_key'], follow['title'])
+        logger.info(f"Загружено подписок на лиги и команды: {len(follows)}")
+    
+    def _add(self, user_id: int, kind: str, key: str, title: str):
+        """Добавление подписки в индекс"""
+        self.index[kind].setdefault(key, set()).add(user_id)
+        self.user_follows.setdefault(user_id, set()).add((kind, key))
+        self.following_users.add(user_id)
+        self.follow_tokens.setdefault(follow_token(kind, key), (kind, key, title))
+    
+    def _remove(self, user_id: int, kind: str, key: str):
+        """Удаление подписки из индекса"""
+        users = self.index[kind].get(key)
+        if users is not None:
+            users.discard(user_id)
+            if not users:
+                del self.index[kind][key]
+                self.follow_tokens.pop(follow_token(kind, key), None)
+        
+        follows = self.user_follows.get(user_id)
+        if follows is not None:
+            follows.discard((kind, key))
+            if not follows:
+                del self.user_follows[user_id]
+                self.following_users.discard(user_id)
+    
+    def register_token(self, kind: str, key: str, title: str) -> str:
+        """Регистрация токена для inline-кнопки"""
+        token = follow_token(kind, key)
+        self.tokens.set(token, (kind, key, title), FOLLOW_TOKEN_TTL_HOURS * 3600)
+        return token
+    
+    def resolve_token(self, token: str) -> Optional[Tuple[str, str, str]]:
+        """Получение подписки по токену кнопки"""
+        return self.follow_tokens.get(token) or self.tokens.get(token)
+    
+    async def follow(self, user_id: int, kind: str, title: str) -> bool:
+        """Подписка пользователя на лигу или команду"""
+        key = normalize_key(title)
+        if not key:
+            return False
+        
+        if (kind, key) in self.user_follows.get(user_id, ()):
+            return False
+        
+        await self.db.add_follow(user_id, kind, key, title.strip())
+        self._add(user_id, kind, key, title.strip())
+        return True
+    
+    async def unfollow(self, user_id: int, kind: str, title: str) -> bool:
+        """Отписка пользователя от лиги или команды"""
+        key = normalize_key(title)
+        if (kind, key) not in self.user_follows.get(user_id, ()):
+            return False
+        
+        await self.db.remove_follow(user_id, kind, key)
+        self._remove(user_id, kind, key)
+        return True
+    
+    def get_user_follows(self, user_id: int) -> List[Tuple[str, str, str]]:
+        """Подписки пользователя: (kind, key, title)"""
+        follows = []
+        for kind, key in sorted(self.user_follows.get(user_id, ())):
+            title = self.follow_tokens.get(follow_token(kind, key), (kind, key, key))[2]
+            follows.append((kind, key, title))
+        return follows
+    
+    def followers_for_match(self, match: Dict) -> Set[int]:
+        """Пользователи, следящие за лигой или командами матча"""
+        groups = [
+            self.index[FOLLOW_LEAGUE].get(normalize_key(match.get('league'))),
+            self.index[FOLLOW_TEAM].get(normalize_key(match.get('home_team'))),
+            self.index[FOLLOW_TEAM].get(normalize_key(match.get('away_team')))
+        ]
+        groups = [group for group in groups if group]
+        if not groups:
+            return set()
+        return set().union(*groups)
+    
+    def filter_recipients(self, match: Dict, candidates: Iterable[int]) -> Set[int]:
+        """Отбор получателей матча с учетом подписок на лиги и команды"""
+        candidates = candidates if isinstance(candidates, set) else set(candidates)
+        
+        # Без подписок пользователь получает все сигналы
+        recipients = candidates - self.following_users
+        
+        recipients |= self.followers_for_match(match) & candidates
+        return recipients
@@ -9,20 +9,41 @@ import json
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.constants import ParseMode
+from telegram.error import BadRequest
 from telegram.ext import (
-    Application, CommandHandler, MessageHandler, CallbackQueryHandler,
-    ContextTypes, filters
+    Application, CommandHandler, MessageHandler, CallbackQueryHandler, TypeHandler,
+    ApplicationHandlerStop, ContextTypes, filters
 )
 
 from config import (
     BOT_TOKEN, TRIAL_MESSAGES_LIMIT, DAILY_SIGNALS_LIMIT, 
     SUBSCRIPTION_PRICES, MAX_ADMINS, WEEKLY_REPORT_DAY, WEEKLY_REPORT_HOUR,
-    PARSING_INTERVAL
+    PARSING_INTERVAL, COEFFICIENT_TOLERANCE, MAX_USER_STRATEGIES, MAX_STRATEGY_TOLERANCE,
+    SIGNAL_DELIVERY_MODE, SIGNAL_CHANNEL_ID, SUBSCRIPTION_DAYS, BACKTEST_IMPORT_DIR
 )
 from database import Database
 from parser import MatchParser
+from strategy_engine import StrategyEngine
+from follow_index import FollowIndex, FOLLOW_LEAGUE, FOLLOW_TEAM, normalize_key
+from fixture_resolver import FixtureResolver
+from odds_index import BestOddsIndex
+from odds_store import OddsSnapshotStore
+from odds_delta import OddsDeltaEngine, DELTA_NEW, DELTA_PRICE_CHANGED
+from odds_movement import OddsMovementDetector
+from backtesting import Backtester, RESULT_HOME, resolve_import_path
+from broadcast import BroadcastEngine
+from message_scheduler import MessageScheduler, PRIORITY_TITLES, PRIORITY_REPORT
+from outbox import OutboxDispatcher
+from message_renderer import MessageRenderer, match_from_row
+from channel_publisher import ChannelPublisher
+from delivery_errors import DeliveryErrorTracker, REASON_TITLES
 from donation_alerts import DonationAlerts
+from donation_alerts_client import OPERATION_TITLES
 from webhook_handler import WebhookHandler
+from update_dedup import UpdateDeduplicator
+from payment_reconciler import PaymentReconciler
+from payment_notifier import PaymentNotifier
+from ttl import timers
 
 # Настройка логирования
 logging.basicConfig(
@@ -40,9 +61,25 @@ class FootballBot:
         self.db = Database()
         self.donation_alerts = None
         self.parser = None
+        self.strategy_engine = None
+        self.follow_index = None
+        self.renderer = None
+        self.fixture_resolver = None
+        self.delta_engine = None
+        self.odds_index = BestOddsIndex()
+        self.odds_store = OddsSnapshotStore()
+        self.movement_detector = OddsMovementDetector()
+        self.update_dedup = UpdateDeduplicator()
         self.application = None
+        self.scheduler = None
+        self.broadcaster = None
+        self.delivery_errors = None
+        self.outbox = None
+        self.channel_publisher = None
         self.webhook_handler = None
         self.webhook_runner = None
+        self.payment_reconciler = None
+        self.payment_notifier = None
         self.running = False
         
     async def initialize(self):
@@ -54,24 +91,73 @@ class FootballBot:
             
             # Инициализация DonationAlerts
             self.donation_alerts = DonationAlerts(self.db)
-            logger.info("DonationAlerts инициализирован")
-            
-            # Инициализация парсера
-            self.parser = MatchParser(self.db)
+            pending = await self.donation_alerts.intents.schedule_pending()
+            logger.info(f"DonationAlerts инициализирован, ожидают оплаты: {pending}")
+            
+            # Загрузка пользовательских стратегий
+            self.strategy_engine = StrategyEngine(self.db)
+            await self.strategy_engine.load()
+            logger.info("Стратегии пользователей загружены")
+            
+            # Загрузка подписок на лиги и команды
+            self.follow_index = FollowIndex(self.db)
+            await self.follow_index.load()
+            logger.info("Подписки на лиги и команды загружены")
+            
+            # Форматирование сообщений о матчах (один раз на матч и цену)
+            self.renderer = MessageRenderer(self.build_follow_buttons)
+            
+            # Загрузка канонических матчей для сопоставления букмекеров
+            self.fixture_resolver = FixtureResolver(self.db)
+            await self.fixture_resolver.ensure_loaded()
+            
+            # Инициализация парсера (индекс целей общий со стратегиями)
+            self.parser = MatchParser(self.db, self.strategy_engine.matcher, self.fixture_resolver)
+            self.parser.scan_listeners.append(self.odds_index.update_source)
+            self.parser.scan_listeners.append(self.odds_store.record_scan)
+            self.parser.scan_listeners.append(self.movement_detector.update_source)
+            
+            # Изменения линии между сканированиями
+            self.delta_engine = OddsDeltaEngine(self.strategy_engine.matcher)
+            self.parser.scan_listeners.append(self.delta_engine.update_source)
             logger.info("Парсер инициализирован")
             
-            # Создание приложения
-            self.application = Application.builder().token(BOT_TOKEN).build()
+            # Создание приложения; все исходящие запросы идут через общий планировщик
+            self.scheduler = MessageScheduler()
+            self.application = Application.builder().token(BOT_TOKEN).rate_limiter(self.scheduler).build()
             logger.info("Telegram приложение создано")
             
+            # Рассылка сигналов с учетом лимитов Telegram
+            self.delivery_errors = DeliveryErrorTracker(self.db)
+            self.broadcaster = BroadcastEngine(self.application.bot, error_tracker=self.delivery_errors)
+            self.outbox = OutboxDispatcher(self.db, self.broadcaster, self.renderer)
+            
+            # Режим канала: сигнал публикуется один раз, доступ выдается по подписке
+            if SIGNAL_DELIVERY_MODE == 'channel':
+                if SIGNAL_CHANNEL_ID:
+                    self.channel_publisher = ChannelPublisher(self.db, self.broadcaster)
+                    self.db.subscription_listeners.append(self.channel_publisher.on_subscription_updated)
+                    logger.info("Сигналы публикуются в канал")
+                else:
+                    logger.error("SIGNAL_CHANNEL_ID не задан, сигналы отправляются личными сообщениями")
+            
             # Инициализация приложения
             await self.application.initialize()
             logger.info("Telegram приложение инициализировано")
             
-            # Инициализация webhook handler
-            self.webhook_handler = WebhookHandler(self.db, self.donation_alerts, self.application)
+            # Инициализация webhook handler (повторные доставки отсекаются до постановки в очередь)
+            self.update_dedup.load()
+            self.webhook_handler = WebhookHandler(self.db, self.donation_alerts, self.application, self.update_dedup)
             logger.info("Webhook handler инициализирован")
             
+            # Подтверждение оплаты правкой исходного сообщения, кто бы ни подтвердил платеж
+            self.payment_notifier = PaymentNotifier(self.db, self.application.bot)
+            self.donation_alerts.ledger.activation_listeners.append(self.payment_notifier.on_activated)
+            self.donation_alerts.intents.expiry_listeners.append(self.payment_notifier.forget)
+            
+            # Сверка платежей, webhook по которым не дошел
+            self.payment_reconciler = PaymentReconciler(self.donation_alerts)
+            
             # Регистрация обработчиков
             self.register_handlers()
             logger.info("Обработчики зарегистрированы")
@@ -80,10 +166,15 @@ class FootballBot:
             self.webhook_runner = await self.webhook_handler.start_server()
             logger.info("Webhook сервер запущен")
             
-            # Запуск фоновых задач
+            # Запуск фоновых задач; сроки жизни записей отслеживает общее колесо таймеров
+            timers.start()
             asyncio.create_task(self.background_tasks())
             logger.info("Фоновые задачи запущены")
             
+            # Доставка сигналов из outbox (в том числе оставшихся после рестарта)
+            await self.outbox.start()
+            self.payment_reconciler.start()
+            
             logger.info("Бот полностью инициализирован")
             
         except Exception as e:
@@ -97,6 +188,13 @@ class FootballBot:
         self.application.add_handler(CommandHandler("help", self.help_command))
         self.application.add_handler(CommandHandler("status", self.status_command))
         self.application.add_handler(CommandHandler("subscription", self.subscription_command))
+        self.application.add_handler(CommandHandler("strategy", self.strategy_command))
+        self.application.add_handler(CommandHandler("strategies", self.strategies_command))
+        self.application.add_handler(CommandHandler("strategy_remove", self.strategy_remove_command))
+        self.application.add_handler(CommandHandler("follow_league", self.follow_league_command))
+        self.application.add_handler(CommandHandler("follow_team", self.follow_team_command))
+        self.application.add_handler(CommandHandler("unfollow", self.unfollow_command))
+        self.application.add_handler(CommandHandler("follows", self.follows_command))
         
         # Админские команды
         self.application.add_handler(CommandHandler("admin", self.admin_command))
@@ -105,6 +203,8 @@ class FootballBot:
         self.application.add_handler(CommandHandler("stats", self.stats_command))
         self.application.add_handler(CommandHandler("give_subscription", self.give_subscription_command))
         self.application.add_handler(CommandHandler("revoke_subscription", self.revoke_subscription_command))
+        self.application.add_handler(CommandHandler("backtest", self.backtest_command))
+        self.application.add_handler(CommandHandler("backtest_import", self.backtest_import_command))
         
         # Обработка callback запросов
         self.application.add_handler(CallbackQueryHandler(self.button_callback))
@@ -125,6 +225,7 @@ class FootballBot:
                 first_name=user.first_name,
                 last_name=user.last_name
             )
+            self.delivery_errors.revive(user_id)
             
             # Получаем информацию о пользователе
             user_info = await self.db.get_user(user_id)
@@ -214,6 +315,11 @@ class FootballBot:
 /start - Запуск бота
 /status - Статус подписки
 /subscription - Управление подпиской
+/strategy - Добавить свои коэффициенты
+/strategies - Мои стратегии
+/follow\\_league - Следить за лигой
+/follow\\_team - Следить за командой
+/follows - Мои лиги и команды
 /help - Эта справка
 
 **Для администраторов:**
@@ -223,6 +329,8 @@ class FootballBot:
 /stats - Статистика
 /give_subscription - Выдать подписку
 /revoke_subscription - Отозвать подписку
+/backtest - Бэктест целевых коэффициентов
+/backtest\\_import - Импорт истории из CSV
 
 **Как это работает:**
 1. Бот автоматически ищет матчи с коэффициентами 4.25/1.225 или 4.22/1.225
@@ -303,6 +411,266 @@ class FootballBot:
         """Обработка команды /subscription"""
         await self.show_subscription_menu(update, context)
     
+    async def strategy_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработка команды /strategy"""
+        try:
+            user_id = update.effective_user.id
+            
+            if len(context.args) < 2:
+                await update.message.reply_text(
+                    "❌ Укажите коэффициенты: /strategy <коэф1> <коэф2> [допуск]\n"
+                    f"Например: /strategy 4.25 1.225 {COEFFICIENT_TOLERANCE}"
+                )
+                return
+            
+            try:
+                coefficient_1 = float(context.args[0].replace(',', '.'))
+                coefficient_2 = float(context.args[1].replace(',', '.'))
+                tolerance = float(context.args[2].replace(',', '.')) if len(context.args) > 2 else COEFFICIENT_TOLERANCE
+            except ValueError:
+                await update.message.reply_text("❌ Неверный формат коэффициентов")
+                return
+            
+            if coefficient_1 <= 1 or coefficient_2 <= 1:
+                await update.message.reply_text("❌ Коэффициенты должны быть больше 1")
+                return
+            
+            if not 0 < tolerance <= MAX_STRATEGY_TOLERANCE:
+                await update.message.reply_text(f"❌ Допуск должен быть в пределах (0; {MAX_STRATEGY_TOLERANCE}]")
+                return
+            
+            if len(self.strategy_engine.get_user_strategies(user_id)) >= MAX_USER_STRATEGIES:
+                await update.message.reply_text(f"❌ Достигнут лимит стратегий ({MAX_USER_STRATEGIES})")
+                return
+            
+            strategy_id = await self.strategy_engine.add_strategy(user_id, coefficient_1, coefficient_2, tolerance)
+            
+            await update.message.reply_text(
+                f"✅ Стратегия #{strategy_id} добавлена: {coefficient_1} / {coefficient_2} (±{tolerance})"
+            )
+        
+        except Exception as e:
+            logger.error(f"Ошибка в strategy_command: {e}")
+            await update.message.reply_text("❌ Произошла ошибка. Попробуйте позже.")
+    
+    async def strategies_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработка команды /strategies"""
+        try:
+            user_id = update.effective_user.id
+            strategies = self.strategy_engine.get_user_strategies(user_id)
+            
+            if not strategies:
+                strategies_text = """
+🎯 **Мои стратегии**
+
+У вас нет своих стратегий, используются стандартные коэффициенты 4.25/1.225 и 4.22/1.225.
+
+💡 Добавить: /strategy <коэф1> <коэф2> [допуск]
+"""
+            else:
+                strategies_text = """
+🎯 **Мои стратегии**
+
+"""
+                for strategy in strategies:
+                    strategies_text += f"#{strategy['id']}: {strategy['coefficient_1']} / {strategy['coefficient_2']} (±{strategy['tolerance']})\n"
+                
+                strategies_text += """
+💡 Удалить: /strategy\\_remove <номер>
+"""
+            
+            keyboard = [
+                [InlineKeyboardButton(f"❌ Удалить #{strategy['id']}", callback_data=f"strategy_remove_{strategy['id']}")]
+                for strategy in strategies
+            ]
+            keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data="start")])
+            
+            reply_markup = InlineKeyboardMarkup(keyboard)
+            
+            if update.message:
+                await update.message.reply_text(
+                    strategies_text,
+                    reply_markup=reply_markup,
+                    parse_mode=ParseMode.MARKDOWN
+                )
+            elif update.callback_query:
+                await update.callback_query.edit_message_text(
+                    strategies_text,
+                    reply_markup=reply_markup,
+                    parse_mode=ParseMode.MARKDOWN
+                )
+        
+        except Exception as e:
+            logger.error(f"Ошибка в strategies_command: {e}")
+            if update.message:
+                await update.message.reply_text("❌ Произошла ошибка. Попробуйте позже.")
+            elif update.callback_query:
+                await update.callback_query.edit_message_text("❌ Произошла ошибка. Попробуйте позже.")
+    
+    async def strategy_remove_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработка команды /strategy_remove"""
+        try:
+            user_id = update.effective_user.id
+            
+            if not context.args:
+                await update.message.reply_text("❌ Укажите номер стратегии: /strategy_remove <номер>")
+                return
+            
+            try:
+                strategy_id = int(context.args[0].lstrip('#'))
+            except ValueError:
+                await update.message.reply_text("❌ Неверный номер стратегии")
+                return
+            
+            if await self.strategy_engine.remove_strategy(user_id, strategy_id):
+                await update.message.reply_text(f"✅ Стратегия #{strategy_id} удалена")
+            else:
+                await update.message.reply_text("❌ Стратегия не найдена")
+        
+        except Exception as e:
+            logger.error(f"Ошибка в strategy_remove_command: {e}")
+            await update.message.reply_text("❌ Произошла ошибка. Попробуйте позже.")
+    
+    async def follow_league_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработка команды /follow_league"""
+        await self.follow_by_name(FOLLOW_LEAGUE, update, context)
+    
+    async def follow_team_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработка команды /follow_team"""
+        await self.follow_by_name(FOLLOW_TEAM, update, context)
+    
+    async def follow_by_name(self, kind: str, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Подписка на лигу или команду по названию из команды"""
+        try:
+            user_id = update.effective_user.id
+            title = ' '.join(context.args)
+            command = "follow_league" if kind == FOLLOW_LEAGUE else "follow_team"
+            
+            if not normalize_key(title):
+                await update.message.reply_text(f"❌ Укажите название: /{command} <название>")
+                return
+            
+            if await self.follow_index.follow(user_id, kind, title):
+                await update.message.reply_text(f"✅ Вы следите за: {title}")
+            else:
+                await update.message.reply_text(f"ℹ️ Вы уже следите за: {title}")
+        
+        except Exception as e:
+            logger.error(f"Ошибка в follow_by_name: {e}")
+            await update.message.reply_text("❌ Произошла ошибка. Попробуйте позже.")
+    
+    async def unfollow_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработка команды /unfollow"""
+        try:
+            user_id = update.effective_user.id
+            title = ' '.join(context.args)
+            
+            if not normalize_key(title):
+                await update.message.reply_text("❌ Укажите название: /unfollow <название>")
+                return
+            
+            removed_league = await self.follow_index.unfollow(user_id, FOLLOW_LEAGUE, title)
+            removed_team = await self.follow_index.unfollow(user_id, FOLLOW_TEAM, title)
+            
+            if removed_league or removed_team:
+                await update.message.reply_text(f"✅ Вы больше не следите за: {title}")
+            else:
+                await update.message.reply_text("❌ Подписка не найдена")
+        
+        except Exception as e:
+            logger.error(f"Ошибка в unfollow_command: {e}")
+            await update.message.reply_text("❌ Произошла ошибка. Попробуйте позже.")
+    
+    async def follows_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработка команды /follows"""
+        try:
+            user_id = update.effective_user.id
+            follows = self.follow_index.get_user_follows(user_id)
+            
+            if not follows:
+                follows_text = "⭐️ Вы не следите за лигами и командами, поэтому получаете все сигналы."
+            else:
+                follows_text = "⭐️ Ваши лиги и команды:\n\n"
+                for kind, key, title in follows:
+                    icon = "🏆" if kind == FOLLOW_LEAGUE else "⚽️"
+                    follows_text += f"{icon} {title}\n"
+                follows_text += "\nСигналы приходят только по этим лигам и командам."
+            
+            keyboard = [
+                [InlineKeyboardButton(f"❌ {title[:40]}", callback_data=f"unfollow_{self.follow_index.register_token(kind, key, title)}")]
+                for kind, key, title in follows
+            ]
+            keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data="start")])
+            
+            reply_markup = InlineKeyboardMarkup(keyboard)
+            
+            # Названия лиг и команд отправляем без разметки
+            if update.message:
+                await update.message.reply_text(follows_text, reply_markup=reply_markup)
+            elif update.callback_query:
+                await update.callback_query.edit_message_text(follows_text, reply_markup=reply_markup)
+        
+        except Exception as e:
+            logger.error(f"Ошибка в follows_command: {e}")
+            if update.message:
+                await update.message.reply_text("❌ Произошла ошибка. Попробуйте позже.")
+            elif update.callback_query:
+                await update.callback_query.edit_message_text("❌ Произошла ошибка. Попробуйте позже.")
+    
+    async def handle_follow_callback(self, data: str, user_id: int, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработка кнопок подписки на лигу или команду"""
+        action, token = data.split("_", 1)
+        follow = self.follow_index.resolve_token(token)
+        
+        if not follow:
+            await update.callback_query.answer("Кнопка устарела, используйте /follows", show_alert=True)
+            return
+        
+        kind, key, title = follow
+        
+        if action == "follow":
+            await self.follow_index.follow(user_id, kind, title)
+            await update.callback_query.answer(f"Вы следите за: {title}")
+        else:
+            await self.follow_index.unfollow(user_id, kind, title)
+            await update.callback_query.answer(f"Вы больше не следите за: {title}")
+            await self.follows_command(update, context)
+    
+    async def show_digest_page(self, user_id: int, digest_id: int, page: int, update: Update):
+        """Листание дайджеста сигналов"""
+        digest = await self.db.get_digest(digest_id)
+        if not digest or digest['user_id'] != user_id:
+            await update.callback_query.edit_message_text("❌ Дайджест больше недоступен")
+            return
+        
+        matches_by_id = await self.db.get_matches_by_ids(digest['match_ids'])
+        matches = [match_from_row(matches_by_id[match_id]) for match_id in digest['match_ids'] if match_id in matches_by_id]
+        if not matches:
+            await update.callback_query.edit_message_text("❌ Матчи дайджеста больше недоступны")
+            return
+        
+        rendered = self.renderer.digest_page(digest_id, matches, page)
+        try:
+            await update.callback_query.edit_message_text(**rendered.kwargs())
+        except BadRequest as e:
+            # Нажатие на номер текущей страницы не меняет сообщение
+            if "not modified" not in str(e).lower():
+                raise
+    
+    def build_follow_buttons(self, match: Dict) -> List[List[InlineKeyboardButton]]:
+        """Кнопки подписки на лигу и команды матча"""
+        league_token = self.follow_index.register_token(FOLLOW_LEAGUE, normalize_key(match['league']), match['league'])
+        home_token = self.follow_index.register_token(FOLLOW_TEAM, normalize_key(match['home_team']), match['home_team'])
+        away_token = self.follow_index.register_token(FOLLOW_TEAM, normalize_key(match['away_team']), match['away_team'])
+        
+        return [
+            [InlineKeyboardButton(f"⭐️ {match['league'][:30]}", callback_data=f"follow_{league_token}")],
+            [
+                InlineKeyboardButton(f"⭐️ {match['home_team'][:20]}", callback_data=f"follow_{home_token}"),
+                InlineKeyboardButton(f"⭐️ {match['away_team'][:20]}", callback_data=f"follow_{away_token}")
+            ]
+        ]
+    
     async def admin_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработка команды /admin"""
         try:
@@ -438,6 +806,53 @@ class FootballBot:
             logger.error(f"Ошибка в remove_admin_command: {e}")
             await update.message.reply_text("❌ Произошла ошибка. Попробуйте позже.")
     
+    def get_delivery_stats_text(self) -> str:
+        """Счетчики доставки сообщений с момента запуска"""
+        counters = self.delivery_errors.snapshot()
+        lines = ["📬 **Доставка с момента запуска:**", f"• Доставлено: **{counters.get('sent', 0)}**"]
+        for reason, title in REASON_TITLES.items():
+            if counters.get(reason):
+                lines.append(f"• {title}: **{counters[reason]}**")
+        return "\n".join(lines)
+    
+    def get_scheduler_stats_text(self) -> str:
+        """Ожидание в очереди исходящих сообщений по классам"""
+        lines = ["⏱ **Очередь отправки (среднее / p95 / макс.):**"]
+        for priority, stats in self.scheduler.latency_snapshot().items():
+            lines.append(
+                f"• {PRIORITY_TITLES[priority]}: {stats['avg']:.2f} / {stats['p95']:.2f} / {stats['max']:.2f} с, "
+                f"отправлено {stats['served']}, в очереди {stats['queued']}"
+            )
+        return "\n".join(lines)
+    
+    def get_payments_api_stats_text(self) -> str:
+        """Длительность запросов к DonationAlerts по операциям"""
+        lines = ["💳 **API DonationAlerts (среднее / p50 / p95 / макс.):**"]
+        for operation, stats in self.donation_alerts.client.latency_snapshot().items():
+            lines.append(
+                f"• {OPERATION_TITLES.get(operation, operation)}: {stats['avg']:.2f} / {stats['p50']:.2f} / {stats['p95']:.2f} / {stats['max']:.2f} с, "
+                f"запросов {stats['count']}, ошибок {stats['errors']}, повторов {stats['retries']}"
+            )
+        if len(lines) == 1:
+            lines.append("• Запросов еще не было")
+        return "\n".join(lines)
+    
+    def get_updates_stats_text(self) -> str:
+        """Очередь входящих обновлений webhook"""
+        stats = self.webhook_handler.updates.snapshot()
+        return (
+            f"📥 **Входящие обновления:** в очереди {stats['pending']}, старейшее {stats['oldest_age']:.1f} с, "
+            f"ожидание {stats['avg_wait']:.2f} / {stats['max_wait']:.2f} с, "
+            f"обработано {stats['processed']}, ошибок {stats['failed']}, отклонено {stats['rejected']}, "
+            f"повторов отсечено {self.update_dedup.suppressed}"
+        )
+    
+    async def drop_duplicate_update(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Остановка обработки повторно доставленного обновления"""
+        if not self.update_dedup.admit(update.update_id):
+            logger.info(f"Повторное обновление {update.update_id} пропущено")
+            raise ApplicationHandlerStop
+    
     async def stats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработка команды /stats"""
         try:
@@ -460,6 +875,14 @@ class FootballBot:
 • Покупок подписок: **{stats['weekly_purchases']}**
 • Популярная подписка: **{stats['popular_subscription']}**
 
+{self.get_delivery_stats_text()}
+
+{self.get_scheduler_stats_text()}
+
+{self.get_updates_stats_text()}
+
+{self.get_payments_api_stats_text()}
+
 🔄 Обновлено: {datetime.now().strftime("%d.%m.%Y %H:%M")}
 """
             
@@ -556,11 +979,16 @@ class FootballBot:
         """Обработка нажатий на кнопки"""
         try:
             query = update.callback_query
-            await query.answer()
-            
             data = query.data
             user_id = update.effective_user.id
             
+            # Кнопки подписки отвечают на callback сами
+            if data.startswith("follow_") or data.startswith("unfollow_"):
+                await self.handle_follow_callback(data, user_id, update, context)
+                return
+            
+            await query.answer()
+            
             if data == "start":
                 await self.start_command(update, context)
             elif data == "help":
@@ -584,9 +1012,16 @@ class FootballBot:
                 
                 await self.process_subscription_purchase(user_id, subscription_type, update, context)
             elif data.startswith("check_payment_"):
-                # Извлекаем тип подписки из callback_data
-                subscription_type = data.split("_", 2)[2]  # check_payment_week -> week
-                await self.check_payment_status(user_id, subscription_type, update, context)
+                # check_payment_<unique_id>; в старых сообщениях — check_payment_<тип подписки>
+                payment_ref = data.split("_", 2)[2]
+                await self.check_payment_status(user_id, payment_ref, update, context)
+            elif data.startswith("digest_"):
+                _, digest_id, page = data.split("_")
+                await self.show_digest_page(user_id, int(digest_id), int(page), update)
+            elif data.startswith("strategy_remove_"):
+                strategy_id = int(data.split("_", 2)[2])
+                await self.strategy_engine.remove_strategy(user_id, strategy_id)
+                await self.strategies_command(update, context)
             elif data.startswith("admin_"):
                 await self.handle_admin_callback(data, update, context)
             else:
@@ -669,47 +1104,52 @@ class FootballBot:
             
             keyboard = [
                 [InlineKeyboardButton("🔗 Перейти к оплате", url=payment_info['payment_url'])],
-                [InlineKeyboardButton("✅ Проверить оплату", callback_data=f"check_payment_{subscription_type}")],
+                [InlineKeyboardButton("✅ Проверить оплату", callback_data=f"check_payment_{payment_info['external_id']}")],
                 [InlineKeyboardButton("🔙 Назад", callback_data="subscription")]
             ]
             
             reply_markup = InlineKeyboardMarkup(keyboard)
             
-            await update.callback_query.edit_message_text(
+            message = await update.callback_query.edit_message_text(
                 payment_text,
                 reply_markup=reply_markup,
                 parse_mode=ParseMode.MARKDOWN
             )
             
+            # После подтверждения оплаты это сообщение будет исправлено без нажатия кнопок
+            await self.payment_notifier.subscribe(payment_info['external_id'], message.chat_id, message.message_id)
+        
         except Exception as e:
             logger.error(f"Ошибка при создании ссылки для оплаты: {e}")
             await update.callback_query.edit_message_text("❌ Ошибка при создании ссылки для оплаты")
     
-    async def check_payment_status(self, user_id: int, subscription_type: str, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Проверка статуса оплаты"""
+    async def check_payment_status(self, user_id: int, payment_ref: str, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Проверка статуса оплаты по локальным данным (платежи подтверждают webhook и фоновая сверка)"""
         try:
-            # Только реальная проверка через DonationAlerts API
-            payment_status = await self.donation_alerts.check_payment_status(f"user_{user_id}_{subscription_type}")
-            
-            if payment_status and payment_status.get('status') == 'success':
-                # Платеж успешен, активируем подписку
-                amount = payment_status['amount']
-                payment_id = payment_status['payment_id']
-                
-                # Определяем количество дней для подписки
-                subscription_days = {
-                    'week': 7,
-                    'two_weeks': 14,
-                    'month': 30
-                }
-                
-                days = subscription_days.get(subscription_type, 7)
-                
-                # Обновляем подписку пользователя
-                await self.db.update_user_subscription(user_id, subscription_type, days)
-                
-                # Добавляем запись о платеже
-                await self.db.add_subscription_record(user_id, subscription_type, amount, payment_id)
+            if payment_ref in SUBSCRIPTION_PRICES:
+                # Кнопка из старого сообщения: последняя ссылка пользователя на этот тип подписки
+                intent = (await self.db.get_latest_payment_intent(user_id, payment_ref)
+                          or await self.db.get_latest_payment_intent(user_id, payment_ref, 'paid'))
+            else:
+                intent = await self.db.get_payment_intent(unique_id=payment_ref)
+            if intent and intent['user_id'] != user_id:
+                intent = None
+            
+            subscription_type = intent['subscription_type'] if intent else payment_ref
+            check_callback = f"check_payment_{intent['unique_id']}" if intent else f"check_payment_{payment_ref}"
+            retry_callback = f"buy_{subscription_type}" if subscription_type in SUBSCRIPTION_PRICES else "subscription"
+            status = intent['status'] if intent else None
+            
+            # Неподтвержденный платеж проверяется внеочередной сверкой, ответ пользователю — сразу;
+            # при подтверждении это сообщение будет исправлено автоматически
+            if status == 'pending':
+                self.payment_reconciler.request_run()
+                message = update.callback_query.message
+                await self.payment_notifier.subscribe(intent['unique_id'], message.chat_id, message.message_id)
+            
+            if status == 'paid':
+                amount = intent['amount']
+                days = SUBSCRIPTION_DAYS.get(subscription_type, 7)
                 
                 success_text = f"""
 ✅ **Оплата прошла успешно!**
@@ -740,19 +1180,19 @@ class FootballBot:
                     parse_mode=ParseMode.MARKDOWN
                 )
                 
-            elif payment_status and payment_status.get('status') == 'pending':
-                # Платеж в обработке
+            elif status == 'pending':
+                # Оплата еще не подтверждена
                 pending_text = """
 ⏳ **Платеж в обработке**
 
-💳 Ваш платеж обрабатывается платежной системой.
+💳 Оплата пока не подтверждена платежной системой.
 ⏰ Обычно это занимает 1-5 минут.
 
-🔄 Попробуйте проверить статус через несколько минут.
+🔄 Мы проверяем оплату автоматически: подписка активируется сама, и вы получите уведомление.
 """
                 
                 keyboard = [
-                    [InlineKeyboardButton("🔄 Проверить снова", callback_data=f"check_payment_{subscription_type}")],
+                    [InlineKeyboardButton("🔄 Проверить снова", callback_data=check_callback)],
                     [InlineKeyboardButton("🔙 Назад", callback_data="subscription")]
                 ]
                 
@@ -781,8 +1221,8 @@ class FootballBot:
 """
                 
                 keyboard = [
-                    [InlineKeyboardButton("🔄 Проверить снова", callback_data=f"check_payment_{subscription_type}")],
-                    [InlineKeyboardButton("💳 Попробовать снова", callback_data=f"buy_{subscription_type}")],
+                    [InlineKeyboardButton("🔄 Проверить снова", callback_data=check_callback)],
+                    [InlineKeyboardButton("💳 Попробовать снова", callback_data=retry_callback)],
                     [InlineKeyboardButton("🔙 Назад", callback_data="subscription")]
                 ]
                 
@@ -824,55 +1264,20 @@ class FootballBot:
             else:
                 await self.db.increment_daily_signals(user_id)
             
-            # Ищем матчи
+            # Ищем матчи; рассылки строятся только по плановому сканированию
             async with self.parser as parser:
-                matches = await parser.parse_all_bookmakers()
-            
-            if not matches:
-                response_text = """
-🔍 **Поиск завершен**
-
-❌ Подходящих матчей не найдено
-
-Попробуйте позже или проверьте другие коэффициенты.
-"""
-            else:
-                response_text = f"""
-🔍 **Найдено матчей: {len(matches)}**
-
-"""
-                
-                for i, match in enumerate(matches[:5], 1):  # Показываем первые 5 матчей
-                    match_time = match['match_time'].strftime("%d.%m %H:%M")
-                    response_text += f"""
-⚽️ **Матч {i}:**
-🏠 {match['home_team']} vs {match['away_team']}
-🏆 {match['league']}
-📊 Коэффициенты: {match['coefficient_1']} / {match['coefficient_2']}
-🏢 Букмекер: {match['bookmaker']}
-⏰ Время: {match_time}
-"""
+                matches = await parser.parse_all_bookmakers(notify_listeners=False)
             
-            keyboard = [
-                [InlineKeyboardButton("🔄 Поискать еще", callback_data="find_matches")],
-                [InlineKeyboardButton("📊 Статус", callback_data="status")],
-                [InlineKeyboardButton("🔙 Назад", callback_data="start")]
-            ]
+            # Оставляем только матчи под стратегии пользователя
+            matches = self.strategy_engine.matches_for_user(user_id, matches)
             
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            # Страница результатов форматируется один раз для одинаковой выдачи
+            rendered = self.renderer.search_results(matches)
             
             if update.callback_query:
-                await update.callback_query.edit_message_text(
-                    response_text,
-                    reply_markup=reply_markup,
-                    parse_mode=ParseMode.MARKDOWN
-                )
+                await update.callback_query.edit_message_text(**rendered.kwargs())
             else:
-                await update.message.reply_text(
-                    response_text,
-                    reply_markup=reply_markup,
-                    parse_mode=ParseMode.MARKDOWN
-                )
+                await update.message.reply_text(**rendered.kwargs())
                 
         except Exception as e:
             logger.error(f"Ошибка в find_matches_for_user: {e}")
@@ -897,6 +1302,12 @@ class FootballBot:
             # Проверяем дневной лимит сигналов
             return user_info['daily_signals_used'] < DAILY_SIGNALS_LIMIT
     
+    def remaining_signals(self, user_info: Dict) -> int:
+        """Сколько сигналов пользователь еще может получить сегодня"""
+        if user_info['subscription_type'] == 'trial':
+            return max(0, TRIAL_MESSAGES_LIMIT - user_info['trial_messages_used'])
+        return max(0, DAILY_SIGNALS_LIMIT - user_info['daily_signals_used'])
+    
     async def get_user_status_text(self, user_info: Dict) -> str:
         """Получение текста статуса пользователя"""
         if user_info['subscription_type'] == 'trial':
@@ -1067,6 +1478,8 @@ class FootballBot:
 • Количество покупок: **{stats['weekly_purchases']}**
 • Популярная подписка: **{stats['popular_subscription']}**
 
+{self.get_delivery_stats_text()}
+
 🎯 **Целевые коэффициенты:**
 • 4.25 / 1.225
 • 4.22 / 1.225
@@ -1094,15 +1507,39 @@ class FootballBot:
         """Фоновые задачи"""
         while self.running:
             try:
-                # Очистка просроченных ссылок
-                await self.donation_alerts.cleanup_expired_links()
-                
                 # Парсинг матчей каждые 5 минут
                 async with self.parser as parser:
-                    matches = await parser.parse_all_bookmakers()
-                    if matches:
-                        await parser.save_matches_to_db(matches)
-                        await self.send_matches_to_users(matches)
+                    await parser.parse_all_bookmakers()
+                    
+                    # Сохраняем и рассылаем только изменения с прошлого сканирования
+                    deltas = self.delta_engine.pop_deltas()
+                    changed = [delta['match'] for delta in deltas if delta['type'] in (DELTA_NEW, DELTA_PRICE_CHANGED)]
+                    if changed:
+                        await parser.save_matches_to_db(changed)
+                    
+                    fresh = [delta['match'] for delta in deltas if delta['type'] == DELTA_NEW and delta['fixture_new']]
+                    if fresh:
+                        await self.send_matches_to_users(self.fixture_resolver.unique_by_fixture(fresh))
+                
+                # Сигналы о вилках по лучшим ценам букмекеров
+                opportunities = self.odds_index.pop_new_arbitrage()
+                if opportunities:
+                    await self.send_arbitrage_signals(opportunities)
+                
+                # Сигналы о движении коэффициентов к цели
+                movement_alerts = self.movement_detector.pop_alerts()
+                if movement_alerts:
+                    await self.send_movement_alerts(movement_alerts)
+                
+                # Очистка обработанных строк outbox
+                await self.outbox.prune()
+                
+                # Сброс истории коэффициентов на диск (файловые операции — вне цикла событий)
+                await self.odds_store.flush_async()
+                await self.odds_store.remove_old_segments_async()
+                
+                # Сохранение принятых update_id на случай аварийного рестарта
+                await self.update_dedup.save_async()
                 
                 # Отправка еженедельного отчета
                 now = datetime.now()
@@ -1112,54 +1549,217 @@ class FootballBot:
                 # Проверка истекших подписок
                 await self.check_expired_subscriptions()
                 
+                # Удаление из канала пользователей без подписки
+                if self.channel_publisher:
+                    await self.channel_publisher.remove_expired_members()
+                
                 await asyncio.sleep(PARSING_INTERVAL)
                 
             except Exception as e:
                 logger.error(f"Ошибка в фоновых задачах: {e}")
                 await asyncio.sleep(60)
     
+    async def broadcast_signals(self, messages: List[Dict], name: str) -> List[int]:
+        """Рассылка сигналов и учет дневного лимита; возвращает получателей"""
+        delivered = []
+        
+        async def on_sent(message: Dict):
+            delivered.append(message['chat_id'])
+        
+        await self.broadcaster.broadcast(messages, name, on_sent)
+        
+        # Увеличиваем счетчики сигналов одной пачкой
+        if delivered:
+            await self.db.increment_daily_signals_many(delivered)
+        return delivered
+    
     async def send_matches_to_users(self, matches: List[Dict]):
         """Отправка найденных матчей пользователям"""
         try:
+            if self.channel_publisher:
+                await self.channel_publisher.publish([self.renderer.match_signal(match) for match in matches])
+                return
+            
             users = await self.db.get_users_with_active_subscription()
+            users_by_id = {user['user_id']: user for user in users}
             
-            for user in users:
-                try:
-                    if await self.check_user_access(user):
-                        match_text = f"""
-⚽️ **Найден новый матч!**
+            # Получатели каждого матча по индексу стратегий
+            recipients = self.strategy_engine.recipients_for_matches(matches, users_by_id.keys())
+            
+            # Учитываем подписки на лиги и команды
+            recipients = [
+                self.follow_index.filter_recipients(match, match_recipients)
+                for match, match_recipients in zip(matches, recipients)
+            ]
+            
+            # Все подходящие пользователю матчи; несколько сигналов объединятся в дайджест
+            user_matches = {}
+            for match, match_recipients in zip(matches, recipients):
+                if not match.get('id'):
+                    logger.error(f"Матч {match['home_team']} vs {match['away_team']} не сохранен, сигнал не поставлен в очередь")
+                    continue
+                for user_id in match_recipients:
+                    user_matches.setdefault(user_id, []).append(match)
+            
+            # Сигналы прошлых сканирований, еще ждущие доставки, спишутся с того же лимита
+            queued = await self.db.count_queued_outbox() if user_matches else {}
+            
+            rows = []
+            for user_id, user_match_list in user_matches.items():
+                user = users_by_id[user_id]
+                if not await self.check_user_access(user):
+                    continue
+                
+                # Лимит считается по сигналам: не ставим в очередь больше оставшегося
+                limit = max(0, self.remaining_signals(user) - queued.get(user_id, 0))
+                for match in user_match_list[:limit]:
+                    rows.append((user_id, match['id'], self.renderer.match_signal(match).payload))
+            
+            # Доставка и учет сигналов — через outbox, ровно один раз на пару (пользователь, матч)
+            await self.outbox.enqueue(rows)
+                    
+        except Exception as e:
+            logger.error(f"Ошибка в send_matches_to_users: {e}")
+    
+    async def send_arbitrage_signals(self, opportunities: List[Dict]):
+        """Отправка сигналов о вилках по лучшим ценам"""
+        try:
+            if self.channel_publisher:
+                await self.channel_publisher.publish(
+                    [self.renderer.arbitrage_signal(opportunity) for opportunity in opportunities], "публикация вилок"
+                )
+                return
+            
+            users = await self.db.get_users_with_active_subscription()
+            users_by_id = {user['user_id']: user for user in users}
+            
+            for opportunity in opportunities:
+                match = opportunity['match']
+                rendered = self.renderer.arbitrage_signal(opportunity)
+                
+                messages = [
+                    rendered.for_chat(user_id)
+                    for user_id in self.follow_index.filter_recipients(match, users_by_id.keys())
+                    if await self.check_user_access(users_by_id[user_id])
+                ]
+                
+                for user_id in await self.broadcast_signals(messages, "рассылка вилки"):
+                    users_by_id[user_id]['daily_signals_used'] += 1
+        
+        except Exception as e:
+            logger.error(f"Ошибка в send_arbitrage_signals: {e}")
+    
+    async def backtest_import_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработка команды /backtest_import"""
+        try:
+            user_id = update.effective_user.id
+            
+            if not await self.db.is_admin(user_id):
+                await update.message.reply_text("❌ У вас нет доступа к этой команде")
+                return
+            
+            if not context.args:
+                await update.message.reply_text(
+                    f"❌ Укажите CSV из каталога {BACKTEST_IMPORT_DIR}: /backtest_import <файл>\n"
+                    "Столбцы: home_team, away_team, league, bookmaker, coefficient_1, coefficient_2, "
+                    "match_time, result (1/X/2) или home_goals и away_goals"
+                )
+                return
+            
+            name = ' '.join(context.args)
+            path = resolve_import_path(name)
+            if path is None:
+                await update.message.reply_text(f"❌ Файл должен лежать в каталоге {BACKTEST_IMPORT_DIR}")
+                return
+            if not os.path.isfile(path):
+                await update.message.reply_text(f"❌ Файл не найден: {name}")
+                return
+            
+            imported, skipped = await Backtester(self.db).import_csv(path)
+            await update.message.reply_text(f"✅ Импортировано матчей: {imported}, пропущено строк: {skipped}")
+        
+        except Exception as e:
+            logger.error(f"Ошибка в backtest_import_command: {e}")
+            await update.message.reply_text("❌ Произошла ошибка. Попробуйте позже.")
+    
+    async def backtest_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработка команды /backtest"""
+        try:
+            user_id = update.effective_user.id
+            
+            if not await self.db.is_admin(user_id):
+                await update.message.reply_text("❌ У вас нет доступа к этой команде")
+                return
+            
+            await update.message.reply_text("⏳ Запускаю бэктест...")
+            summary = await Backtester(self.db).run()
+            
+            if not summary['matches']:
+                await update.message.reply_text("❌ Нет исторических данных. Загрузите CSV: /backtest_import <файл>")
+                return
+            
+            def format_strategy(strategy: Dict) -> str:
+                side = "П1" if strategy['side'] == RESULT_HOME else "П2"
+                return (
+                    f"• {strategy['target_1']}/{strategy['target_2']} ±{strategy['tolerance']} {side}: "
+                    f"ставок {strategy['bets']}, проходимость {strategy['hit_rate'] * 100:.1f}%, "
+                    f"ROI {strategy['roi'] * 100:+.1f}%, просадка {strategy['max_drawdown']:.1f}"
+                )
+            
+            current_text = "\n".join(format_strategy(strategy) for strategy in summary['current']) or "• нет данных"
+            best_text = "\n".join(format_strategy(strategy) for strategy in summary['best']) or "• недостаточно ставок"
+            
+            backtest_text = f"""
+📊 **Результаты бэктеста**
 
-🏠 {matches[0]['home_team']} vs {matches[0]['away_team']}
-🏆 {matches[0]['league']}
-📊 Коэффициенты: {matches[0]['coefficient_1']} / {matches[0]['coefficient_2']}
-🏢 Букмекер: {matches[0]['bookmaker']}
-⏰ Время: {matches[0]['match_time'].strftime("%d.%m %H:%M")}
+📁 Матчей в истории: **{summary['matches']}**
+🧮 Проверено стратегий: **{summary['strategies']}**
 
-💡 Используйте кнопки ниже для навигации
+🎯 **Текущие настройки:**
+{current_text}
+
+🏆 **Лучшие по ROI:**
+{best_text}
+
+🔄 Обновлено: {datetime.now().strftime("%d.%m.%Y %H:%M")}
 """
-                        
-                        keyboard = [
-                            [InlineKeyboardButton("🔍 Найти еще", callback_data="find_matches")],
-                            [InlineKeyboardButton("📊 Статус", callback_data="status")]
-                        ]
-                        
-                        reply_markup = InlineKeyboardMarkup(keyboard)
-                        
-                        await self.application.bot.send_message(
-                            chat_id=user['user_id'],
-                            text=match_text,
-                            reply_markup=reply_markup,
-                            parse_mode=ParseMode.MARKDOWN
-                        )
-                        
-                        # Увеличиваем счетчик сигналов
-                        await self.db.increment_daily_signals(user['user_id'])
-                        
-                except Exception as e:
-                    logger.error(f"Ошибка отправки матча пользователю {user['user_id']}: {e}")
-                    
+            
+            await update.message.reply_text(backtest_text, parse_mode=ParseMode.MARKDOWN)
+        
         except Exception as e:
-            logger.error(f"Ошибка в send_matches_to_users: {e}")
+            logger.error(f"Ошибка в backtest_command: {e}")
+            await update.message.reply_text("❌ Произошла ошибка. Попробуйте позже.")
+    
+    async def send_movement_alerts(self, alerts: List[Dict]):
+        """Отправка сигналов о движении коэффициентов к цели"""
+        try:
+            if self.channel_publisher:
+                await self.channel_publisher.publish(
+                    [self.renderer.movement_signal(alert) for alert in self.fixture_resolver.unique_by_fixture(alerts)],
+                    "публикация сигналов о движении"
+                )
+                return
+            
+            users = await self.db.get_users_with_active_subscription()
+            users_by_id = {user['user_id']: user for user in users}
+            # Движение считается к глобальным целям — как и обычные сигналы по ним
+            audience = set(users_by_id) - self.strategy_engine.users_with_strategies
+            
+            for alert in self.fixture_resolver.unique_by_fixture(alerts):
+                match = alert['match']
+                rendered = self.renderer.movement_signal(alert)
+                
+                messages = [
+                    rendered.for_chat(user_id)
+                    for user_id in self.follow_index.filter_recipients(match, audience)
+                    if await self.check_user_access(users_by_id[user_id])
+                ]
+                
+                for user_id in await self.broadcast_signals(messages, "рассылка сигналов о движении"):
+                    users_by_id[user_id]['daily_signals_used'] += 1
+        
+        except Exception as e:
+            logger.error(f"Ошибка в send_movement_alerts: {e}")
     
     async def send_weekly_report_to_admins(self):
         """Отправка еженедельного отчета всем админам"""
@@ -1180,6 +1780,8 @@ class FootballBot:
 • Количество покупок: **{stats['weekly_purchases']}**
 • Популярная подписка: **{stats['popular_subscription']}**
 
+{self.get_delivery_stats_text()}
+
 🎯 **Целевые коэффициенты:**
 • 4.25 / 1.225
 • 4.22 / 1.225
@@ -1187,15 +1789,11 @@ class FootballBot:
 💡 Отчет сгенерирован автоматически
 """
             
-            for admin in admins:
-                try:
-                    await self.application.bot.send_message(
-                        chat_id=admin['admin_id'],
-                        text=report_text,
-                        parse_mode=ParseMode.MARKDOWN
-                    )
-                except Exception as e:
-                    logger.error(f"Ошибка отправки отчета админу {admin['admin_id']}: {e}")
+            messages = [
+                {'chat_id': admin['admin_id'], 'text': report_text, 'parse_mode': ParseMode.MARKDOWN}
+                for admin in admins
+            ]
+            await self.broadcaster.broadcast(messages, "еженедельный отчет", priority=PRIORITY_REPORT)
                     
         except Exception as e:
             logger.error(f"Ошибка в send_weekly_report_to_admins: {e}")
@@ -1206,23 +1804,24 @@ class FootballBot:
             expired_users = await self.db.get_users_with_expired_subscription()
             
             for user in expired_users:
-                try:
-                    await self.application.bot.send_message(
-                        chat_id=user['user_id'],
-                        text="""
+                # Подписка отзывается, даже если уведомление не дошло — иначе пользователь
+                # попадал бы в выборку на каждой проверке
+                await self.db.revoke_subscription(user['user_id'])
+            
+            messages = [
+                {
+                    'chat_id': user['user_id'],
+                    'text': """
 ❌ **Ваша подписка истекла**
 
 Для продолжения использования бота необходимо продлить подписку.
 
 💡 Используйте /subscription для покупки новой подписки.
 """
-                    )
-                    
-                    # Обновляем статус пользователя
-                    await self.db.revoke_subscription(user['user_id'])
-                    
-                except Exception as e:
-                    logger.error(f"Ошибка уведомления об истекшей подписке: {e}")
+                }
+                for user in expired_users
+            ]
+            await self.broadcaster.broadcast(messages, "уведомление об истекших подписках", priority=PRIORITY_REPORT)
                     
         except Exception as e:
             logger.error(f"Ошибка в check_expired_subscriptions: {e}")
@@ -1233,6 +1832,17 @@ class FootballBot:
         
         self.running = False
         
+        # Останавливаем доставку сигналов (незавершенные строки дождутся рестарта)
+        if self.outbox:
+            await self.outbox.stop()
+        
+        # Останавливаем сверку платежей
+        if self.payment_reconciler:
+            await self.payment_reconciler.stop()
+        
+        # Останавливаем колесо таймеров
+        await timers.stop()
+        
         # Останавливаем webhook сервер
         if self.webhook_runner:
             await self.webhook_handler.stop_server(self.webhook_runner)
@@ -1245,10 +1855,22 @@ class FootballBot:
             except Exception as e:
                 logger.error(f"Ошибка при остановке приложения: {e}")
         
-        # Закрываем сессию DonationAlerts
-        if self.donation_alerts and self.donation_alerts.session:
+        # Сохраняем накопленную историю коэффициентов (после фоновой записи, если она идет)
+        try:
+            await self.odds_store.flush_async()
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении истории коэффициентов: {e}")
+        
+        # Сохраняем недавно принятые обновления
+        try:
+            self.update_dedup.save()
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении принятых обновлений: {e}")
+        
+        # Закрываем соединения с DonationAlerts
+        if self.donation_alerts:
             try:
-                await self.donation_alerts.session.close()
+                await self.donation_alerts.close()
             except Exception as e:
                 logger.error(f"Ошибка при закрытии DonationAlerts: {e}")
         
@@ -1279,6 +1901,8 @@ class FootballBot:
                     await asyncio.sleep(1)
             else:
                 logger.info("Запуск в режиме polling (локально)")
+                # В webhook-режиме повторы отсекаются до очереди, при polling — до обработчиков
+                self.application.add_handler(TypeHandler(Update, self.drop_duplicate_update), group=-1)
                 await self.application.run_polling()
             
         except Exception as e:
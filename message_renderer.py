@@ -0,0 +1,243 @@
+import json
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, Hashable, List
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.constants import ParseMode
+from telegram.helpers import escape_markdown
+
+from config import RENDER_CACHE_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Сколько матчей показывать на странице результатов поиска
+SEARCH_PAGE_SIZE = 5
+
+
+def md(value) -> str:
+    """Экранирование значения для Markdown (первая версия разметки Telegram)"""
+    return escape_markdown(str(value), version=1)
+
+
+def match_from_row(row: Dict) -> Dict:
+    """Матч из строки таблицы matches (время в datetime)"""
+    match = dict(row)
+    if isinstance(match['match_time'], str):
+        match['match_time'] = datetime.fromisoformat(match['match_time'])
+    return match
+
+
+def match_key(match: Dict) -> Hashable:
+    """Ключ матча для кэша"""
+    return match.get('id') or match.get('fixture_id') or (match['home_team'], match['away_team'], match['bookmaker'])
+
+
+def match_version(match: Dict) -> Hashable:
+    """Версия матча: меняется вместе с ценой"""
+    return (match['coefficient_1'], match['coefficient_2'], match['bookmaker'], match['match_time'])
+
+
+class RenderedMessage:
+    """Готовое сообщение: текст, клавиатура и сериализованный payload"""
+    
+    __slots__ = ('text', 'reply_markup', 'parse_mode', '_payload')
+    
+    def __init__(self, text: str, reply_markup: InlineKeyboardMarkup = None, parse_mode: str = ParseMode.MARKDOWN):
+        self.text = text
+        self.reply_markup = reply_markup
+        self.parse_mode = parse_mode
+        self._payload = None
+    
+    def kwargs(self) -> Dict:
+        """Аргументы send_message / edit_message_text без получателя"""
+        return {'text': self.text, 'reply_markup': self.reply_markup, 'parse_mode': self.parse_mode}
+    
+    def for_chat(self, chat_id: int) -> Dict:
+        """Аргументы send_message для получателя"""
+        return {'chat_id': chat_id, 'text': self.text, 'reply_markup': self.reply_markup, 'parse_mode': self.parse_mode}
+    
+    @property
+    def payload(self) -> str:
+        """Сериализация для outbox (один раз на сообщение)"""
+        if self._payload is None:
+            self._payload = json.dumps({
+                'text': self.text,
+                'parse_mode': self.parse_mode,
+                'reply_markup': self.reply_markup.to_dict() if self.reply_markup else None
+            }, ensure_ascii=False)
+        return self._payload
+
+
+class MessageRenderer:
+    """Однократное форматирование сообщений о матчах с LRU-кэшем"""
+    
+    def __init__(self, follow_buttons: Callable[[Dict], List[List[InlineKeyboardButton]]],
+                 cache_size: int = RENDER_CACHE_SIZE):
+        self.follow_buttons = follow_buttons
+        self.cache_size = cache_size
+        self.cache: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    def _cached(self, key: Hashable, render: Callable[[], RenderedMessage]) -> RenderedMessage:
+        message = self.cache.get(key)
+        if message is not None:
+            self.cache.move_to_end(key)
+            self.hits += 1
+            return message
+        
+        self.misses += 1
+        message = self.cache[key] = render()
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return message
+    
+    def match_signal(self, match: Dict) -> RenderedMessage:
+        """Сигнал о новом матче"""
+        return self._cached(('signal', match_key(match), match_version(match)), lambda: self._render_match_signal(match))
+    
+    def _render_match_signal(self, match: Dict) -> RenderedMessage:
+        text = f"""
+⚽️ **Найден новый матч!**
+
+🏠 {md(match['home_team'])} vs {md(match['away_team'])}
+🏆 {md(match['league'])}
+📊 Коэффициенты: {match['coefficient_1']} / {match['coefficient_2']}
+🏢 Букмекер: {md(match['bookmaker'])}
+⏰ Время: {match['match_time'].strftime("%d.%m %H:%M")}
+
+💡 Используйте кнопки ниже для навигации
+"""
+        
+        keyboard = self.follow_buttons(match) + [
+            [InlineKeyboardButton("🔍 Найти еще", callback_data="find_matches")],
+            [InlineKeyboardButton("📊 Статус", callback_data="status")]
+        ]
+        return RenderedMessage(text, InlineKeyboardMarkup(keyboard))
+    
+    def arbitrage_signal(self, opportunity: Dict) -> RenderedMessage:
+        """Сигнал о вилке по лучшим ценам"""
+        match = opportunity['match']
+        key = ('arbitrage', match_key(match), tuple(opportunity['best']))
+        return self._cached(key, lambda: self._render_arbitrage_signal(opportunity))
+    
+    def _render_arbitrage_signal(self, opportunity: Dict) -> RenderedMessage:
+        match = opportunity['match']
+        (home_price, home_bookmaker), (draw_price, draw_bookmaker), (away_price, away_bookmaker) = opportunity['best']
+        edge = -opportunity['margin'] * 100
+        
+        text = f"""
+💹 **Найдена вилка!**
+
+🏠 {md(match['home_team'])} vs {md(match['away_team'])}
+🏆 {md(match['league'])}
+📈 П1: {home_price} ({md(home_bookmaker)})
+🤝 X: {draw_price} ({md(draw_bookmaker)})
+📉 П2: {away_price} ({md(away_bookmaker)})
+💰 Доходность: {edge:.2f}%
+⏰ Время: {match['match_time'].strftime("%d.%m %H:%M")}
+"""
+        
+        keyboard = self.follow_buttons(match) + [
+            [InlineKeyboardButton("📊 Статус", callback_data="status")]
+        ]
+        return RenderedMessage(text, InlineKeyboardMarkup(keyboard))
+    
+    def movement_signal(self, alert: Dict) -> RenderedMessage:
+        """Сигнал о движении коэффициентов к цели"""
+        key = ('movement', match_key(alert['match']), match_version(alert['match']), alert['target'])
+        return self._cached(key, lambda: self._render_movement_signal(alert))
+    
+    def _render_movement_signal(self, alert: Dict) -> RenderedMessage:
+        match = alert['match']
+        target_1, target_2 = alert['target']
+        eta_minutes = int(alert['eta_hours'] * 60)
+        
+        text = f"""
+📡 **Коэффициенты движутся к цели!**
+
+🏠 {md(match['home_team'])} vs {md(match['away_team'])}
+🏆 {md(match['league'])}
+📈 Сейчас: {match['coefficient_1']} / {match['coefficient_2']} ({md(alert['bookmaker'])})
+🎯 Цель: {target_1} / {target_2}
+⏳ Ориентировочно через {eta_minutes} мин
+⏰ Время: {match['match_time'].strftime("%d.%m %H:%M")}
+"""
+        
+        keyboard = self.follow_buttons(match) + [
+            [InlineKeyboardButton("📊 Статус", callback_data="status")]
+        ]
+        return RenderedMessage(text, InlineKeyboardMarkup(keyboard))
+    
+    def digest_page(self, digest_id: int, matches: List[Dict], page: int) -> RenderedMessage:
+        """Страница дайджеста: один матч и кнопки листания"""
+        total = len(matches)
+        page = max(0, min(page, total - 1))
+        key = ('digest', digest_id, page, match_key(matches[page]), match_version(matches[page]))
+        return self._cached(key, lambda: self._render_digest_page(digest_id, matches, page))
+    
+    def _render_digest_page(self, digest_id: int, matches: List[Dict], page: int) -> RenderedMessage:
+        match = matches[page]
+        total = len(matches)
+        text = f"""
+📬 **Новых матчей: {total}** (матч {page + 1} из {total})
+
+🏠 {md(match['home_team'])} vs {md(match['away_team'])}
+🏆 {md(match['league'])}
+📊 Коэффициенты: {match['coefficient_1']} / {match['coefficient_2']}
+🏢 Букмекер: {md(match['bookmaker'])}
+⏰ Время: {match['match_time'].strftime("%d.%m %H:%M")}
+"""
+        
+        navigation = []
+        if page > 0:
+            navigation.append(InlineKeyboardButton("◀️", callback_data=f"digest_{digest_id}_{page - 1}"))
+        navigation.append(InlineKeyboardButton(f"{page + 1}/{total}", callback_data=f"digest_{digest_id}_{page}"))
+        if page < total - 1:
+            navigation.append(InlineKeyboardButton("▶️", callback_data=f"digest_{digest_id}_{page + 1}"))
+        
+        keyboard = [navigation] + self.follow_buttons(match) + [
+            [InlineKeyboardButton("🔍 Найти еще", callback_data="find_matches")],
+            [InlineKeyboardButton("📊 Статус", callback_data="status")]
+        ]
+        return RenderedMessage(text, InlineKeyboardMarkup(keyboard))
+    
+    def search_results(self, matches: List[Dict]) -> RenderedMessage:
+        """Страница результатов поиска (первые SEARCH_PAGE_SIZE матчей)"""
+        page = matches[:SEARCH_PAGE_SIZE]
+        key = ('search', len(matches), tuple((match_key(match), match_version(match)) for match in page))
+        return self._cached(key, lambda: self._render_search_results(matches, page))
+    
+    def _render_search_results(self, matches: List[Dict], page: List[Dict]) -> RenderedMessage:
+        if not matches:
+            text = """
+🔍 **Поиск завершен**
+
+❌ Подходящих матчей не найдено
+
+Попробуйте позже или проверьте другие коэффициенты.
+"""
+        else:
+            parts = [f"""
+🔍 **Найдено матчей: {len(matches)}**
+
+"""]
+            for i, match in enumerate(page, 1):
+                parts.append(f"""
+⚽️ **Матч {i}:**
+🏠 {md(match['home_team'])} vs {md(match['away_team'])}
+🏆 {md(match['league'])}
+📊 Коэффициенты: {match['coefficient_1']} / {match['coefficient_2']}
+🏢 Букмекер: {md(match['bookmaker'])}
+⏰ Время: {match['match_time'].strftime("%d.%m %H:%M")}
+""")
+            text = ''.join(parts)
+        
+        keyboard = [
+            [InlineKeyboardButton("🔄 Поискать еще", callback_data="find_matches")],
+            [InlineKeyboardButton("📊 Статус", callback_data="status")],
+            [InlineKeyboardButton("🔙 Назад", callback_data="start")]
+        ]
+        return RenderedMessage(text, InlineKeyboardMarkup(keyboard))
@@ -0,0 +1,209 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Union
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from config import (
+    BROADCAST_RATE, BROADCAST_BURST, BROADCAST_MIN_RATE, SCHEDULER_WEIGHTS, SCHEDULER_LATENCY_WINDOW
+)
+
+logger = logging.getLogger(__name__)
+
+# Классы исходящих сообщений в порядке приоритета
+PRIORITY_INTERACTIVE = 'interactive'
+PRIORITY_PAYMENT = 'payment'
+PRIORITY_SIGNAL = 'signal'
+PRIORITY_REPORT = 'report'
+
+PRIORITY_TITLES = {
+    PRIORITY_INTERACTIVE: 'Ответы пользователям',
+    PRIORITY_PAYMENT: 'Уведомления об оплате',
+    PRIORITY_SIGNAL: 'Сигналы',
+    PRIORITY_REPORT: 'Отчеты'
+}
+
+# Методы Bot API, не расходующие лимит отправки сообщений
+UNLIMITED_ENDPOINTS = {
+    'getUpdates', 'getMe', 'setWebhook', 'deleteWebhook', 'getWebhookInfo', 'close', 'logOut',
+    'getMyCommands', 'setMyCommands', 'deleteMyCommands', 'answerCallbackQuery'
+}
+
+
+class TokenBucket:
+    """Глобальный лимит отправки с адаптивным снижением скорости"""
+    
+    def __init__(self, rate: float = BROADCAST_RATE, burst: int = BROADCAST_BURST,
+                 min_rate: float = BROADCAST_MIN_RATE):
+        self.base_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = asyncio.Lock()
+    
+    async def acquire(self):
+        """Ожидание токена на одну отправку"""
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+    
+    def refund(self):
+        """Возврат неиспользованного токена"""
+        self.tokens = min(self.burst, self.tokens + 1)
+    
+    def pause(self, seconds: float):
+        """Остановка всех отправок после RetryAfter и снижение скорости"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+        self.rate = max(self.min_rate, self.rate * 0.75)
+        logger.warning(f"Лимит Telegram: пауза {seconds:.1f} с, скорость снижена до {self.rate:.1f} сообщ./с")
+    
+    def recover(self):
+        """Постепенный возврат скорости после успешной отправки"""
+        if self.rate < self.base_rate:
+            self.rate = min(self.base_rate, self.rate + 0.01)
+
+
+class MessageScheduler(BaseRateLimiter):
+    """Единый планировщик исходящих запросов к Bot API с весовой справедливой очередью классов"""
+    
+    def __init__(self, bucket: TokenBucket = None, weights: Dict[str, float] = None,
+                 latency_window: int = SCHEDULER_LATENCY_WINDOW):
+        self.bucket = bucket or TokenBucket()
+        self.weights = dict(weights or SCHEDULER_WEIGHTS)
+        # Очередь ожидающих отправок: (виртуальное время завершения, порядковый номер, класс, future, время постановки)
+        self.queue: List = []
+        self.sequence = itertools.count()
+        # Виртуальное время планировщика и последняя метка каждого класса
+        self.virtual_time = 0.0
+        self.last_finish = {priority: 0.0 for priority in self.weights}
+        self.queued = {priority: 0 for priority in self.weights}
+        # Статистика ожидания в очереди по классам
+        self.latencies = {priority: deque(maxlen=latency_window) for priority in self.weights}
+        self.served = {priority: 0 for priority in self.weights}
+        self.max_latency = {priority: 0.0 for priority in self.weights}
+        self.ready = asyncio.Event()
+        self.dispatcher: Optional[asyncio.Task] = None
+    
+    async def initialize(self):
+        """Запуск раздачи токенов"""
+        if self.dispatcher is None or self.dispatcher.done():
+            self.dispatcher = asyncio.create_task(self._dispatch())
+    
+    async def shutdown(self):
+        """Остановка раздачи токенов; ожидающие отправки отменяются"""
+        if self.dispatcher:
+            self.dispatcher.cancel()
+            try:
+                await self.dispatcher
+            except asyncio.CancelledError:
+                pass
+            self.dispatcher = None
+        
+        for _, _, _, future, _ in self.queue:
+            if not future.done():
+                future.cancel()
+        self.queue.clear()
+        self.queued = {priority: 0 for priority in self.weights}
+    
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict[str, Any], List[Dict[str, Any]]]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[Dict]
+    ) -> Union[bool, Dict[str, Any], List[Dict[str, Any]]]:
+        """Выполнение запроса Bot API в очереди своего класса (по умолчанию — ответ пользователю)"""
+        if endpoint in UNLIMITED_ENDPOINTS:
+            return await callback(*args, **kwargs)
+        
+        priority = (rate_limit_args or {}).get('priority', PRIORITY_INTERACTIVE)
+        await self.acquire(priority)
+        
+        try:
+            result = await callback(*args, **kwargs)
+        except RetryAfter as e:
+            retry_after = e.retry_after
+            retry_after = retry_after.total_seconds() if hasattr(retry_after, 'total_seconds') else retry_after
+            self.bucket.pause(float(retry_after))
+            raise
+        
+        self.bucket.recover()
+        return result
+    
+    async def acquire(self, priority: str = PRIORITY_INTERACTIVE):
+        """Ожидание своей очереди на одну отправку"""
+        if priority not in self.weights:
+            priority = PRIORITY_INTERACTIVE
+        await self.initialize()
+        
+        # Метка завершения: чем больше вес класса, тем меньше шаг между его сообщениями
+        finish = max(self.virtual_time, self.last_finish[priority]) + 1.0 / self.weights[priority]
+        self.last_finish[priority] = finish
+        
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.queue, (finish, next(self.sequence), priority, future, time.monotonic()))
+        self.queued[priority] += 1
+        self.ready.set()
+        await future
+    
+    async def _dispatch(self):
+        """Выдача токенов ожидающим отправкам в порядке меток завершения"""
+        while True:
+            await self.ready.wait()
+            await self.bucket.acquire()
+            
+            served = False
+            while self.queue and not served:
+                finish, _, priority, future, enqueued = heapq.heappop(self.queue)
+                self.queued[priority] -= 1
+                # Отмененные ожидания не занимают токен
+                if future.done():
+                    continue
+                
+                self.virtual_time = finish
+                wait = time.monotonic() - enqueued
+                self.latencies[priority].append(wait)
+                self.served[priority] += 1
+                self.max_latency[priority] = max(self.max_latency[priority], wait)
+                future.set_result(None)
+                served = True
+            
+            if not served:
+                self.bucket.refund()
+            if not self.queue:
+                self.ready.clear()
+    
+    def latency_snapshot(self) -> Dict[str, Dict]:
+        """Время ожидания в очереди по классам (секунды)"""
+        snapshot = {}
+        for priority in self.weights:
+            recent = sorted(self.latencies[priority])
+            snapshot[priority] = {
+                'served': self.served[priority],
+                'queued': self.queued[priority],
+                'avg': sum(recent) / len(recent) if recent else 0.0,
+                'p95': recent[min(len(recent) - 1, int(len(recent) * 0.95))] if recent else 0.0,
+                'max': self.max_latency[priority]
+            }
+        return snapshot
@@ -0,0 +1,109 @@
+import logging
+from typing import Dict, List, Optional
+
+from coefficient_matcher import CoefficientMatcher
+from config import ODDS_DELTA_EPSILON
+from fixture_resolver import retention_seconds
+from ttl import TTLMap
+
+logger = logging.getLogger(__name__)
+
+# Типы изменений между сканированиями
+DELTA_NEW = 'new'
+DELTA_PRICE_CHANGED = 'price_changed'
+DELTA_LEFT_BAND = 'left_band'
+DELTA_REMOVED = 'removed'
+
+
+def event_key(match: Dict) -> str:
+    """Ключ события внутри источника"""
+    return match.get('fixture_id') or f"{match['home_team']}|{match['away_team']}"
+
+
+class OddsDeltaEngine:
+    """Вычисление изменений линии между сканированиями каждого источника"""
+    
+    def __init__(self, matcher: CoefficientMatcher, epsilon: float = ODDS_DELTA_EPSILON):
+        self.matcher = matcher
+        self.epsilon = epsilon
+        # source -> {ключ события: последнее отданное состояние в целевом диапазоне}
+        self.state: Dict[str, Dict[str, Dict]] = {}
+        # События, о которых уже отдан DELTA_NEW с fixture_new; переживают выход из диапазона
+        # и хранятся до конца срока хранения матча
+        self.announced = TTLMap()
+        self.pending: List[Dict] = []
+    
+    def update_source(self, source: str, events: List[Dict]):
+        """Сравнение нового сканирования источника с предыдущим"""
+        # Пустой ответ считаем сбоем сканирования, а не снятием всей линии
+        if not events:
+            logger.warning(f"Пустое сканирование {source}, изменения не вычисляются")
+            return
+        
+        previous = self.state.get(source, {})
+        current = {}
+        mask = self.matcher.match_mask(
+            [event['coefficient_1'] for event in events],
+            [event['coefficient_2'] for event in events]
+        )
+        
+        for event, hit in zip(events, mask.tolist()):
+            key = event_key(event)
+            last = previous.get(key)
+            
+            if not hit:
+                if last is not None and key not in current:
+                    self._emit(DELTA_LEFT_BAND, source, key, event)
+                continue
+            
+            if key in current:
+                continue
+            
+            if last is None:
+                current[key] = self._snapshot(event)
+                fixture_new = key not in self.announced
+                if fixture_new:
+                    self.announced.set(key, True, retention_seconds(event))
+                self._emit(DELTA_NEW, source, key, event, fixture_new=fixture_new)
+            elif self._price_moved(last, event):
+                current[key] = self._snapshot(event)
+                self._emit(DELTA_PRICE_CHANGED, source, key, event, previous=last)
+            else:
+                # Изменение меньше порога: сравниваем дальше с последней отданной ценой
+                current[key] = last
+        
+        seen = {event_key(event) for event in events}
+        for key, last in previous.items():
+            if key not in seen:
+                self._emit(DELTA_REMOVED, source, key, last['match'])
+        
+        self.state[source] = current
+    
+    def _snapshot(self, event: Dict) -> Dict:
+        return {
+            'coefficient_1': float(event['coefficient_1']),
+            'coefficient_2': float(event['coefficient_2']),
+            'match': event
+        }
+    
+    def _price_moved(self, last: Dict, event: Dict) -> bool:
+        return (
+            abs(float(event['coefficient_1']) - last['coefficient_1']) > self.epsilon or
+            abs(float(event['coefficient_2']) - last['coefficient_2']) > self.epsilon
+        )
+    
+    def _emit(self, delta_type: str, source: str, key: str, match: Dict,
+              previous: Optional[Dict] = None, fixture_new: bool = False):
+        self.pending.append({
+            'type': delta_type,
+            'source': source,
+            'key': key,
+            'match': match,
+            'previous': previous,
+            'fixture_new': fixture_new
+        })
+    
+    def pop_deltas(self) -> List[Dict]:
+        """Изменения, накопленные с прошлого вызова"""
+        deltas, self.pending = self.pending, []
+        return deltas
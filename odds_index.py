@@ -0,0 +1,166 @@
+import logging
+from typing import Dict, List, Optional, Set, Tuple
+
+from config import ARBITRAGE_MIN_EDGE
+from fixture_resolver import retention_seconds
+from ttl import TTLMap
+
+logger = logging.getLogger(__name__)
+
+# Исходы рынка 1X2 и соответствующие поля словаря матча; без цены ничьей вилка не считается
+OUTCOMES = ('coefficient_1', 'coefficient_draw', 'coefficient_2')
+# Лучшие цены должны быть хотя бы у стольких разных букмекеров
+ARBITRAGE_MIN_BOOKMAKERS = 2
+
+
+class BestOddsIndex:
+    """Лучшие коэффициенты по каждому матчу среди всех букмекеров"""
+    
+    def __init__(self):
+        # fixture_id -> {'prices': {bookmaker: (коэф_1, коэф_X, коэф_2)}, 'best': [(цена, букмекер), ...], ...}
+        self.fixtures: Dict[str, Dict] = {}
+        # bookmaker -> матчи, по которым у букмекера есть цены
+        self.source_fixtures: Dict[str, Set[str]] = {}
+        # Матчи, где сумма лучших цен дает вилку
+        self.arbitrage: Set[str] = set()
+        # Вилки, о которых уже отправлены сигналы
+        self.notified: Set[str] = set()
+        # Таймеры удаления давно начавшихся матчей
+        self.expiry = TTLMap(on_expire=self._expire_fixtures)
+    
+    def update_source(self, bookmaker: str, matches: List[Dict]):
+        """Обновление индекса по результатам сканирования одного источника"""
+        seen = set()
+        for match in matches:
+            fixture_id = match.get('fixture_id')
+            if not fixture_id:
+                continue
+            seen.add(fixture_id)
+            self.update_price(fixture_id, bookmaker, match)
+        
+        # Цены матчей, пропавших из линии букмекера, больше не актуальны
+        for fixture_id in self.source_fixtures.get(bookmaker, set()) - seen:
+            self.remove_price(fixture_id, bookmaker)
+        
+        self.source_fixtures[bookmaker] = seen
+    
+    def update_price(self, fixture_id: str, bookmaker: str, match: Dict):
+        """Обновление цены одного букмекера по матчу"""
+        # Источник без цены исхода (например, ничьей) дает по нему 0
+        prices = tuple(float(match.get(outcome) or 0) for outcome in OUTCOMES)
+        fixture = self.fixtures.get(fixture_id)
+        
+        if fixture is None:
+            fixture = self.fixtures[fixture_id] = {
+                'prices': {},
+                'best': [(0.0, None)] * len(OUTCOMES),
+                'margin': None,
+                'match': match
+            }
+            self.expiry.set(fixture_id, None, retention_seconds(match))
+        
+        previous = fixture['prices'].get(bookmaker)
+        fixture['prices'][bookmaker] = prices
+        if fixture['match']['match_time'] != match['match_time']:
+            # Перенос начала матча переносит и срок хранения
+            self.expiry.set(fixture_id, None, retention_seconds(match))
+        fixture['match'] = match
+        
+        best = fixture['best']
+        for i, price in enumerate(prices):
+            best_price, best_bookmaker = best[i]
+            if price > best_price:
+                best[i] = (price, bookmaker)
+            elif best_bookmaker == bookmaker and previous and price < previous[i]:
+                # Лучшая цена ухудшилась — пересчитываем по всем букмекерам матча
+                best[i] = self._best_for_outcome(fixture, i)
+        
+        self._update_margin(fixture_id, fixture)
+    
+    def remove_price(self, fixture_id: str, bookmaker: str):
+        """Удаление цены букмекера по матчу"""
+        fixture = self.fixtures.get(fixture_id)
+        if not fixture or bookmaker not in fixture['prices']:
+            return
+        
+        del fixture['prices'][bookmaker]
+        if not fixture['prices']:
+            self._drop_fixture(fixture_id)
+            return
+        
+        best = fixture['best']
+        for i in range(len(OUTCOMES)):
+            if best[i][1] == bookmaker:
+                best[i] = self._best_for_outcome(fixture, i)
+        
+        self._update_margin(fixture_id, fixture)
+    
+    def _best_for_outcome(self, fixture: Dict, outcome: int) -> Tuple[float, Optional[str]]:
+        """Лучшая цена исхода среди букмекеров матча"""
+        best = (0.0, None)
+        for bookmaker, prices in fixture['prices'].items():
+            if prices[outcome] > best[0]:
+                best = (prices[outcome], bookmaker)
+        return best
+    
+    def _update_margin(self, fixture_id: str, fixture: Dict):
+        """Пересчет маржи по лучшим ценам"""
+        best_prices = [price for price, _ in fixture['best']]
+        if all(price > 0 for price in best_prices):
+            fixture['margin'] = sum(1 / price for price in best_prices) - 1
+        else:
+            fixture['margin'] = None
+        
+        # Вилка — только по всем трем исходам и по ценам разных букмекеров
+        bookmakers = {bookmaker for _, bookmaker in fixture['best']}
+        if (fixture['margin'] is not None and fixture['margin'] <= -ARBITRAGE_MIN_EDGE
+                and len(bookmakers) >= ARBITRAGE_MIN_BOOKMAKERS):
+            self.arbitrage.add(fixture_id)
+        else:
+            self.arbitrage.discard(fixture_id)
+            # Вилка закрылась — при повторном появлении снова уведомим
+            self.notified.discard(fixture_id)
+    
+    def _drop_fixture(self, fixture_id: str):
+        """Удаление матча из индекса"""
+        self.fixtures.pop(fixture_id, None)
+        self.expiry.pop(fixture_id)
+        self.arbitrage.discard(fixture_id)
+        self.notified.discard(fixture_id)
+    
+    def best_price(self, fixture_id: str, outcome: str) -> Tuple[float, Optional[str]]:
+        """Лучшая цена исхода и букмекер"""
+        fixture = self.fixtures.get(fixture_id)
+        if not fixture:
+            return (0.0, None)
+        return fixture['best'][OUTCOMES.index(outcome)]
+    
+    def margin(self, fixture_id: str) -> Optional[float]:
+        """Маржа по лучшим ценам (отрицательная — вилка)"""
+        fixture = self.fixtures.get(fixture_id)
+        return fixture['margin'] if fixture else None
+    
+    def is_arbitrage(self, fixture_id: str) -> bool:
+        """Есть ли вилка по матчу"""
+        return fixture_id in self.arbitrage
+    
+    def pop_new_arbitrage(self) -> List[Dict]:
+        """Новые вилки, о которых еще не отправлялись сигналы"""
+        opportunities = []
+        for fixture_id in self.arbitrage - self.notified:
+            fixture = self.fixtures[fixture_id]
+            self.notified.add(fixture_id)
+            opportunities.append({
+                'fixture_id': fixture_id,
+                'match': fixture['match'],
+                'best': list(fixture['best']),
+                'margin': fixture['margin']
+            })
+        return opportunities
+    
+    def _expire_fixtures(self, expired: List[Tuple[str, None]]):
+        """Удаление давно начавшихся матчей по таймерам"""
+        for fixture_id, _ in expired:
+            self._drop_fixture(fixture_id)
+            for fixtures in self.source_fixtures.values():
+                fixtures.discard(fixture_id)
\ No newline at end of file
@@ -0,0 +1,175 @@
+import logging
+import math
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import (
+    TARGET_COEFFICIENTS, COEFFICIENT_TOLERANCE, ODDS_MOVEMENT_WINDOW, ODDS_MOVEMENT_MIN_POINTS,
+    ODDS_MOVEMENT_MIN_SLOPE, ODDS_MOVEMENT_MAX_DISTANCE, ODDS_MOVEMENT_MAX_VOLATILITY,
+    ODDS_MOVEMENT_MAX_STREAMS
+)
+
+logger = logging.getLogger(__name__)
+
+
+class PriceWindow:
+    """Кольцевой буфер точек (время, расстояние) с накопленными суммами"""
+    
+    __slots__ = ('size', 'times', 'values', 'start', 'count', 'origin',
+                 'sum_t', 'sum_v', 'sum_tt', 'sum_tv', 'sum_vv', 'armed')
+    
+    def __init__(self, size: int, origin: float):
+        self.size = size
+        self.times = [0.0] * size
+        self.values = [0.0] * size
+        self.start = 0
+        self.count = 0
+        # Время считаем в часах от первой точки, чтобы суммы не теряли точность
+        self.origin = origin
+        self.sum_t = self.sum_v = self.sum_tt = self.sum_tv = self.sum_vv = 0.0
+        # Сигнал по потоку еще не отправлялся с момента последнего сброса
+        self.armed = True
+    
+    def push(self, timestamp: float, value: float):
+        """Добавление точки с вытеснением самой старой"""
+        t = (timestamp - self.origin) / 3600
+        if self.count == self.size:
+            self._accumulate(self.times[self.start], self.values[self.start], -1)
+            self.times[self.start] = t
+            self.values[self.start] = value
+            self.start = (self.start + 1) % self.size
+        else:
+            index = (self.start + self.count) % self.size
+            self.times[index] = t
+            self.values[index] = value
+            self.count += 1
+        self._accumulate(t, value, 1)
+    
+    def _accumulate(self, t: float, value: float, sign: int):
+        self.sum_t += sign * t
+        self.sum_v += sign * value
+        self.sum_tt += sign * t * t
+        self.sum_tv += sign * t * value
+        self.sum_vv += sign * value * value
+    
+    def last(self) -> float:
+        return self.values[(self.start + self.count - 1) % self.size]
+    
+    def slope(self) -> float:
+        """Наклон линейной регрессии по окну (единиц в час)"""
+        denominator = self.count * self.sum_tt - self.sum_t * self.sum_t
+        if self.count < 2 or denominator <= 1e-12:
+            return 0.0
+        return (self.count * self.sum_tv - self.sum_t * self.sum_v) / denominator
+    
+    def velocity(self) -> float:
+        """Изменение между первой и последней точками окна (единиц в час)"""
+        if self.count < 2:
+            return 0.0
+        first = self.start
+        last = (self.start + self.count - 1) % self.size
+        elapsed = self.times[last] - self.times[first]
+        if elapsed <= 0:
+            return 0.0
+        return (self.values[last] - self.values[first]) / elapsed
+    
+    def volatility(self) -> float:
+        """Стандартное отклонение значений окна"""
+        if self.count < 2:
+            return 0.0
+        mean = self.sum_v / self.count
+        return math.sqrt(max(self.sum_vv / self.count - mean * mean, 0.0))
+
+
+class OddsMovementDetector:
+    """Обнаружение движения коэффициентов к целевым значениям"""
+    
+    def __init__(self, targets: Sequence[Tuple[float, float]] = None,
+                 max_streams: int = ODDS_MOVEMENT_MAX_STREAMS):
+        self.targets = np.asarray(TARGET_COEFFICIENTS if targets is None else targets, dtype=np.float64).reshape(-1, 2)
+        self.max_streams = max_streams
+        # (fixture_id, bookmaker) -> окно; порядок — давность обновления
+        self.windows: OrderedDict = OrderedDict()
+        self.pending: List[Dict] = []
+    
+    def update_source(self, bookmaker: str, events: List[Dict], timestamp: datetime = None):
+        """Добавление цен сканирования источника в потоки матчей"""
+        events = [event for event in events if event.get('fixture_id')]
+        if not events or not len(self.targets):
+            return
+        
+        ts = (timestamp or datetime.now()).timestamp()
+        prices = np.array([(event['coefficient_1'], event['coefficient_2']) for event in events], dtype=np.float64)
+        
+        # Расстояние до ближайшей цели в метрике допуска (максимум по исходам)
+        distances = np.abs(prices[:, None, :] - self.targets[None, :, :]).max(axis=2)
+        nearest = distances.argmin(axis=1)
+        distances = distances[np.arange(len(events)), nearest]
+        
+        for event, distance, target in zip(events, distances.tolist(), nearest.tolist()):
+            self._update_stream(event, bookmaker, ts, distance, target)
+    
+    def _update_stream(self, event: Dict, bookmaker: str, ts: float, distance: float, target: int):
+        key = (event['fixture_id'], bookmaker)
+        window = self.windows.get(key)
+        if window is None:
+            window = self.windows[key] = PriceWindow(ODDS_MOVEMENT_WINDOW, ts)
+            if len(self.windows) > self.max_streams:
+                self.windows.popitem(last=False)
+        else:
+            self.windows.move_to_end(key)
+        
+        window.push(ts, distance)
+        slope = window.slope()
+        
+        # Цель достигнута — дальше работает обычный сигнал
+        if distance <= COEFFICIENT_TOLERANCE:
+            window.armed = False
+            return
+        # Повторный сигнал возможен только после разворота движения
+        if slope >= 0:
+            window.armed = True
+            return
+        
+        if not window.armed or window.count < ODDS_MOVEMENT_MIN_POINTS:
+            return
+        if distance > ODDS_MOVEMENT_MAX_DISTANCE or -slope < ODDS_MOVEMENT_MIN_SLOPE:
+            return
+        
+        volatility = window.volatility()
+        if volatility > ODDS_MOVEMENT_MAX_VOLATILITY:
+            return
+        
+        window.armed = False
+        self.pending.append({
+            'fixture_id': event['fixture_id'],
+            'bookmaker': bookmaker,
+            'match': event,
+            'target': tuple(self.targets[target].tolist()),
+            'distance': distance,
+            'slope': slope,
+            'velocity': window.velocity(),
+            'volatility': volatility,
+            'eta_hours': distance / -slope
+        })
+    
+    def metrics(self, fixture_id: str, bookmaker: str) -> Optional[Dict]:
+        """Текущие метрики потока матча у букмекера"""
+        window = self.windows.get((fixture_id, bookmaker))
+        if window is None or not window.count:
+            return None
+        return {
+            'distance': window.last(),
+            'slope': window.slope(),
+            'velocity': window.velocity(),
+            'volatility': window.volatility(),
+            'points': window.count
+        }
+    
+    def pop_alerts(self) -> List[Dict]:
+        """Сигналы о движении, накопленные с прошлого вызова"""
+        alerts, self.pending = self.pending, []
+        return alerts
@@ -0,0 +1,399 @@
+import array
+import asyncio
+import json
+import logging
+import os
+import re
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import ODDS_STORE_PATH, ODDS_SEGMENT_MAX_POINTS, ODDS_FLUSH_POINTS, ODDS_RETENTION_DAYS
+
+logger = logging.getLogger(__name__)
+
+# Формат записи в сегменте (23 байта, без выравнивания)
+RECORD_DTYPE = np.dtype([
+    ('ts', '<i8'),
+    ('fixture', '<u4'),
+    ('bookmaker', '<u2'),
+    ('market', '<u1'),
+    ('price', '<f8')
+])
+
+# Рынки, сохраняемые из словаря матча
+MARKETS = ('coefficient_1', 'coefficient_2')
+
+_SEGMENT_RE = re.compile(r'^segment_(\d{6})\.bin$')
+
+
+class StringDictionary:
+    """Словарное кодирование строк в целые числа"""
+    
+    def __init__(self):
+        self.codes: Dict[str, int] = {}
+        self.values: List[str] = []
+    
+    def __len__(self) -> int:
+        return len(self.values)
+    
+    def get(self, value: str) -> Optional[int]:
+        return self.codes.get(value)
+    
+    def add(self, value: str) -> Tuple[int, bool]:
+        """Код строки и признак того, что она добавлена впервые"""
+        code = self.codes.get(value)
+        if code is not None:
+            return code, False
+        code = len(self.values)
+        self.codes[value] = code
+        self.values.append(value)
+        return code, True
+    
+    def value(self, code: int) -> str:
+        return self.values[code]
+
+
+class OddsSnapshotStore:
+    """Колоночное хранилище истории коэффициентов в append-only сегментах"""
+    
+    def __init__(self, path: str = ODDS_STORE_PATH):
+        self.path = path
+        self.dictionaries = {
+            'fixture': StringDictionary(),
+            'team': StringDictionary(),
+            'league': StringDictionary(),
+            'bookmaker': StringDictionary(),
+            'market': StringDictionary()
+        }
+        # Код матча -> (код хозяев, код гостей, код лиги)
+        self.fixture_meta: List[Tuple[int, int, int]] = []
+        
+        # Буфер еще не записанных точек по колонкам
+        self.ts = array.array('q')
+        self.fixture = array.array('I')
+        self.bookmaker = array.array('H')
+        self.market = array.array('B')
+        self.price = array.array('d')
+        
+        # Новые словарные записи, ожидающие записи на диск
+        self.pending_entries: List[Dict] = []
+        # Буферы, которые сейчас пишутся на диск в отдельном потоке (видны в истории до конца записи)
+        self.in_flight: List[Tuple[array.array, ...]] = []
+        # Номер сегмента -> (memmap, мин. код матча, макс. код матча)
+        self.segments: Dict[int, Tuple[np.memmap, int, int]] = {}
+        # Номер сегмента -> максимальная метка времени (индекс сегментов на диске)
+        self.segment_max_ts: Dict[int, int] = {}
+        self.current_segment = 0
+        self.current_points = 0
+        self.loaded = False
+        # Файловые операции выполняются вне цикла событий и по одной
+        self.io_lock = asyncio.Lock()
+        self.flush_task: Optional[asyncio.Task] = None
+    
+    def _segment_path(self, number: int) -> str:
+        return os.path.join(self.path, f'segment_{number:06d}.bin')
+    
+    def _dictionary_path(self) -> str:
+        return os.path.join(self.path, 'dictionaries.jsonl')
+    
+    def _index_path(self) -> str:
+        return os.path.join(self.path, 'segments.json')
+    
+    def _save_index(self):
+        """Атомарная запись индекса сегментов"""
+        temp_path = self._index_path() + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({str(number): ts for number, ts in self.segment_max_ts.items()}, f)
+        os.replace(temp_path, self._index_path())
+    
+    def load(self):
+        """Загрузка словарей и списка сегментов с диска"""
+        if self.loaded:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        
+        if os.path.exists(self._dictionary_path()):
+            with open(self._dictionary_path(), 'rb') as f:
+                data = f.read()
+            # Оборванная дозапись оставляет строку без перевода строки — отрезаем, иначе коды словарей съедут
+            end = data.rfind(b'\n') + 1
+            if end < len(data):
+                logger.warning(f"Словари: отброшена неполная строка {len(data) - end} байт")
+                os.truncate(self._dictionary_path(), end)
+            # Сначала разбираем все строки: при ошибке словари не остаются заполненными наполовину
+            entries = [json.loads(line) for line in data[:end].decode('utf-8').splitlines() if line.strip()]
+            for entry in entries:
+                self._apply_entry(entry)
+        
+        numbers = sorted(
+            int(match.group(1)) for match in map(_SEGMENT_RE.match, os.listdir(self.path)) if match
+        )
+        for number in numbers:
+            # Оборванная дозапись оставляет неполную запись в хвосте — отрезаем, иначе сдвинутся все следующие
+            path = self._segment_path(number)
+            size = os.path.getsize(path)
+            tail = size % RECORD_DTYPE.itemsize
+            if tail:
+                logger.warning(f"Сегмент {number}: отброшен неполный хвост {tail} байт")
+                os.truncate(path, size - tail)
+        if numbers:
+            self.current_segment = numbers[-1]
+            self.current_points = os.path.getsize(self._segment_path(self.current_segment)) // RECORD_DTYPE.itemsize
+        
+        if os.path.exists(self._index_path()):
+            with open(self._index_path(), encoding='utf-8') as f:
+                self.segment_max_ts = {int(number): ts for number, ts in json.load(f).items()}
+        self.segment_max_ts = {number: ts for number, ts in self.segment_max_ts.items() if number in numbers}
+        
+        # Сегменты без записи в индексе (созданные до его появления) читаются один раз
+        missing = [number for number in numbers if number not in self.segment_max_ts]
+        for number in missing:
+            if os.path.getsize(self._segment_path(number)):
+                records = np.memmap(self._segment_path(number), dtype=RECORD_DTYPE, mode='r')
+                self.segment_max_ts[number] = int(records['ts'].max())
+                del records
+        if missing:
+            self._save_index()
+        
+        self.loaded = True
+        logger.info(f"Хранилище коэффициентов: сегментов {len(numbers)}, матчей {len(self.dictionaries['fixture'])}")
+    
+    def _apply_entry(self, entry: Dict):
+        """Восстановление словарной записи"""
+        self.dictionaries[entry['d']].add(entry['v'])
+        if entry['d'] == 'fixture':
+            self.fixture_meta.append(tuple(entry['m']))
+    
+    def _encode(self, dictionary: str, value: str) -> int:
+        """Кодирование строки с фиксацией новой записи словаря"""
+        code, created = self.dictionaries[dictionary].add(value)
+        if created:
+            self.pending_entries.append({'d': dictionary, 'v': value})
+        return code
+    
+    def _encode_fixture(self, match: Dict) -> int:
+        """Код матча с метаданными команд и лиги"""
+        fixture_id = match['fixture_id']
+        code = self.dictionaries['fixture'].get(fixture_id)
+        if code is not None:
+            return code
+        
+        meta = (
+            self._encode('team', match['home_team']),
+            self._encode('team', match['away_team']),
+            self._encode('league', match.get('league') or '')
+        )
+        code, _ = self.dictionaries['fixture'].add(fixture_id)
+        self.fixture_meta.append(meta)
+        self.pending_entries.append({'d': 'fixture', 'v': fixture_id, 'm': list(meta)})
+        return code
+    
+    def record_scan(self, bookmaker: str, events: List[Dict], timestamp: datetime = None):
+        """Добавление всех цен из сканирования источника"""
+        self.load()
+        ts = int((timestamp or datetime.now()).timestamp())
+        bookmaker_code = self._encode('bookmaker', bookmaker)
+        market_codes = [self._encode('market', market) for market in MARKETS]
+        
+        for event in events:
+            if not event.get('fixture_id'):
+                continue
+            fixture_code = self._encode_fixture(event)
+            for market, market_code in zip(MARKETS, market_codes):
+                self.ts.append(ts)
+                self.fixture.append(fixture_code)
+                self.bookmaker.append(bookmaker_code)
+                self.market.append(market_code)
+                self.price.append(float(event[market]))
+        
+        if len(self.ts) >= ODDS_FLUSH_POINTS:
+            self._schedule_flush()
+    
+    def _schedule_flush(self):
+        """Фоновый сброс заполненного буфера, не блокирующий цикл событий"""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.create_task(self.flush_async())
+    
+    def _take_buffer(self) -> Tuple[List[Dict], Tuple[array.array, ...]]:
+        """Передача накопленного буфера на запись; новые точки копятся в свежих массивах"""
+        entries, self.pending_entries = self.pending_entries, []
+        columns = (self.ts, self.fixture, self.bookmaker, self.market, self.price)
+        self.ts = array.array('q')
+        self.fixture = array.array('I')
+        self.bookmaker = array.array('H')
+        self.market = array.array('B')
+        self.price = array.array('d')
+        return entries, columns
+    
+    def _write(self, entries: List[Dict], columns: Tuple[array.array, ...]):
+        """Запись словарных записей и точек в сегменты"""
+        # Словари пишем раньше точек: каждый код в сегменте уже описан
+        if entries:
+            with open(self._dictionary_path(), 'a', encoding='utf-8') as f:
+                for entry in entries:
+                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        
+        ts, fixture, bookmaker, market, price = columns
+        total = len(ts)
+        written = 0
+        while written < total:
+            if self.current_points >= ODDS_SEGMENT_MAX_POINTS:
+                self.current_segment += 1
+                self.current_points = 0
+            
+            count = min(total - written, ODDS_SEGMENT_MAX_POINTS - self.current_points)
+            records = np.empty(count, dtype=RECORD_DTYPE)
+            part = slice(written, written + count)
+            records['ts'] = np.frombuffer(ts, dtype=np.int64)[part]
+            records['fixture'] = np.frombuffer(fixture, dtype=np.uint32)[part]
+            records['bookmaker'] = np.frombuffer(bookmaker, dtype=np.uint16)[part]
+            records['market'] = np.frombuffer(market, dtype=np.uint8)[part]
+            records['price'] = np.frombuffer(price, dtype=np.float64)[part]
+            
+            with open(self._segment_path(self.current_segment), 'ab') as f:
+                f.write(records.tobytes())
+            
+            # Отображение дописанного сегмента нужно открыть заново
+            self.segments.pop(self.current_segment, None)
+            self.segment_max_ts[self.current_segment] = max(
+                self.segment_max_ts.get(self.current_segment, 0), int(records['ts'].max())
+            )
+            self.current_points += count
+            written += count
+        
+        if total:
+            self._save_index()
+    
+    def flush(self):
+        """Синхронная запись буфера в текущий сегмент (при остановке)"""
+        self.load()
+        self._write(*self._take_buffer())
+    
+    async def flush_async(self):
+        """Запись буфера в отдельном потоке"""
+        await asyncio.to_thread(self.load)
+        async with self.io_lock:
+            entries, columns = self._take_buffer()
+            if not entries and not len(columns[0]):
+                return
+            self.in_flight.append(columns)
+            try:
+                await asyncio.to_thread(self._write, entries, columns)
+            finally:
+                self.in_flight.remove(columns)
+    
+    def _open_segment(self, number: int) -> Optional[Tuple[np.memmap, int, int]]:
+        """Отображение сегмента в память с диапазоном кодов матчей"""
+        segment = self.segments.get(number)
+        if segment is not None:
+            return segment
+        
+        path = self._segment_path(number)
+        if not os.path.exists(path) or not os.path.getsize(path):
+            return None
+        
+        records = np.memmap(path, dtype=RECORD_DTYPE, mode='r')
+        segment = (records, int(records['fixture'].min()), int(records['fixture'].max()))
+        self.segments[number] = segment
+        return segment
+    
+    def price_history(self, fixture_id: str, bookmaker: str = None, market: str = None) -> List[Tuple[datetime, str, str, float]]:
+        """История цен матча: (время, букмекер, рынок, цена)"""
+        self.load()
+        fixture_code = self.dictionaries['fixture'].get(fixture_id)
+        if fixture_code is None:
+            return []
+        
+        bookmaker_code = self.dictionaries['bookmaker'].get(bookmaker) if bookmaker else None
+        market_code = self.dictionaries['market'].get(market) if market else None
+        if (bookmaker and bookmaker_code is None) or (market and market_code is None):
+            return []
+        
+        parts = []
+        for number in range(self.current_segment + 1):
+            segment = self._open_segment(number)
+            if segment is None:
+                continue
+            records, min_code, max_code = segment
+            if not min_code <= fixture_code <= max_code:
+                continue
+            parts.append(records[records['fixture'] == fixture_code])
+        
+        # Еще не записанные точки из буфера и из записываемых сейчас пачек
+        for ts, fixture, bookmaker, market, price in [
+            (self.ts, self.fixture, self.bookmaker, self.market, self.price), *self.in_flight
+        ]:
+            if not len(ts):
+                continue
+            buffered = np.frombuffer(fixture, dtype=np.uint32) == fixture_code
+            if buffered.any():
+                records = np.empty(int(buffered.sum()), dtype=RECORD_DTYPE)
+                records['ts'] = np.frombuffer(ts, dtype=np.int64)[buffered]
+                records['fixture'] = fixture_code
+                records['bookmaker'] = np.frombuffer(bookmaker, dtype=np.uint16)[buffered]
+                records['market'] = np.frombuffer(market, dtype=np.uint8)[buffered]
+                records['price'] = np.frombuffer(price, dtype=np.float64)[buffered]
+                parts.append(records)
+        
+        if not parts:
+            return []
+        
+        history = np.concatenate(parts)
+        if bookmaker_code is not None:
+            history = history[history['bookmaker'] == bookmaker_code]
+        if market_code is not None:
+            history = history[history['market'] == market_code]
+        history = history[np.argsort(history['ts'], kind='stable')]
+        
+        bookmakers = self.dictionaries['bookmaker']
+        markets = self.dictionaries['market']
+        return [
+            (datetime.fromtimestamp(int(record['ts'])), bookmakers.value(int(record['bookmaker'])),
+             markets.value(int(record['market'])), float(record['price']))
+            for record in history
+        ]
+    
+    def fixture_info(self, fixture_id: str) -> Optional[Dict]:
+        """Декодированные команды и лига матча"""
+        self.load()
+        code = self.dictionaries['fixture'].get(fixture_id)
+        if code is None:
+            return None
+        home, away, league = self.fixture_meta[code]
+        return {
+            'home_team': self.dictionaries['team'].value(home),
+            'away_team': self.dictionaries['team'].value(away),
+            'league': self.dictionaries['league'].value(league)
+        }
+    
+    def remove_old_segments(self, now: datetime = None):
+        """Удаление сегментов старше срока хранения по индексу максимальных меток времени"""
+        self.load()
+        border = int(((now or datetime.now()) - timedelta(days=ODDS_RETENTION_DAYS)).timestamp())
+        expired = [
+            number for number, max_ts in self.segment_max_ts.items()
+            if number < self.current_segment and max_ts < border
+        ]
+        
+        for number in expired:
+            # Отображение закрывается до удаления файла
+            self.segments.pop(number, None)
+            os.remove(self._segment_path(number))
+            del self.segment_max_ts[number]
+        
+        if expired:
+            self._save_index()
+            logger.info(f"Удалено старых сегментов коэффициентов: {len(expired)}")
+        return len(expired)
+    
+    async def remove_old_segments_async(self, now: datetime = None):
+        """Удаление старых сегментов в отдельном потоке"""
+        async with self.io_lock:
+            return await asyncio.to_thread(self.remove_old_segments, now)
\ No newline at end of file
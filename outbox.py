@@ -0,0 +1,155 @@
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from telegram import InlineKeyboardMarkup
+
+from broadcast import BroadcastEngine
+from config import (
+    OUTBOX_WORKERS, OUTBOX_BATCH_SIZE, OUTBOX_MAX_ATTEMPTS, OUTBOX_BACKOFF_BASE,
+    OUTBOX_BACKOFF_MAX, OUTBOX_CLAIM_TIMEOUT, OUTBOX_POLL_INTERVAL, OUTBOX_RETENTION_DAYS,
+    SIGNAL_DIGEST_WINDOW
+)
+from database import Database
+from delivery_errors import is_permanent
+from message_renderer import MessageRenderer, match_from_row
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxDispatcher:
+    """Доставка сигналов из таблицы outbox с повторами и восстановлением после рестарта"""
+    
+    def __init__(self, database: Database, broadcaster: BroadcastEngine, renderer: MessageRenderer,
+                 workers: int = OUTBOX_WORKERS):
+        self.db = database
+        self.broadcaster = broadcaster
+        self.renderer = renderer
+        self.workers = workers
+        self.wakeup = asyncio.Event()
+        self.tasks: List[asyncio.Task] = []
+        self.running = False
+    
+    async def enqueue(self, rows: List[Tuple[int, int, str]]) -> int:
+        """Пакетная постановка (пользователь, матч, payload) в очередь"""
+        if not rows:
+            return 0
+        # Сигналы одного окна уходят пользователю одним дайджестом
+        added = await self.db.enqueue_outbox(rows, datetime.now() + timedelta(seconds=SIGNAL_DIGEST_WINDOW))
+        logger.info(f"В outbox добавлено сигналов: {added} из {len(rows)}")
+        return added
+    
+    async def start(self):
+        """Возврат зависших отправок и запуск воркеров"""
+        # После рестарта ни одна строка не может реально отправляться
+        reset = await self.db.reset_stale_outbox(datetime.now())
+        if reset:
+            logger.warning(f"Возвращено в очередь незавершенных отправок: {reset}")
+        
+        self.running = True
+        self.tasks = [asyncio.create_task(self.worker(number)) for number in range(self.workers)]
+        logger.info(f"Запущено воркеров outbox: {self.workers}")
+    
+    async def stop(self):
+        """Остановка воркеров"""
+        self.running = False
+        self.wakeup.set()
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+    
+    async def worker(self, number: int):
+        """Цикл воркера: захват пачки, отправка, фиксация результата"""
+        while self.running:
+            try:
+                batch = await self.db.claim_outbox(OUTBOX_BATCH_SIZE, datetime.now())
+                if not batch:
+                    self.wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self.wakeup.wait(), OUTBOX_POLL_INTERVAL)
+                    except asyncio.TimeoutError:
+                        pass
+                    # Заодно возвращаем строки воркеров, зависших дольше таймаута
+                    await self.db.reset_stale_outbox(datetime.now() - timedelta(seconds=OUTBOX_CLAIM_TIMEOUT))
+                    continue
+                
+                await self.deliver(batch)
+            
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка воркера outbox {number}: {e}")
+                await asyncio.sleep(OUTBOX_POLL_INTERVAL)
+    
+    async def deliver(self, batch: List[Dict]):
+        """Отправка захваченной пачки: одно сообщение на пользователя"""
+        rows_by_user: Dict[int, List[Dict]] = {}
+        for row in batch:
+            rows_by_user.setdefault(row['user_id'], []).append(row)
+        
+        rows_by_message = {}
+        messages = []
+        # Одинаковые payload (один матч многим пользователям) разбираются один раз
+        decoded = {}
+        
+        for user_id, rows in rows_by_user.items():
+            if len(rows) == 1:
+                message = dict(self._decode(rows[0]['payload'], decoded), chat_id=user_id)
+            else:
+                message = await self._build_digest(user_id, rows)
+                if message is None:
+                    continue
+            rows_by_message[id(message)] = rows
+            messages.append(message)
+        
+        async def on_sent(message: Dict):
+            # Фиксируем доставку сразу, чтобы сузить окно повторной отправки при сбое
+            await self.db.complete_outbox(rows_by_message[id(message)], datetime.now())
+        
+        async def on_failed(message: Dict, error: Exception):
+            rows = rows_by_message[id(message)]
+            ids = [row['id'] for row in rows]
+            attempts = max(row['attempts'] for row in rows)
+            # Недоступному чату повторять бессмысленно
+            if is_permanent(error) or attempts >= OUTBOX_MAX_ATTEMPTS:
+                await self.db.fail_outbox(ids, str(error))
+                logger.error(f"Сигналы {[row['match_id'] for row in rows]} пользователю {rows[0]['user_id']} не доставлены: {error}")
+                return
+            
+            delay = min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1))
+            await self.db.retry_outbox(ids, datetime.now() + timedelta(seconds=delay), str(error))
+        
+        await self.broadcaster.broadcast(messages, "доставка outbox", on_sent, on_failed)
+    
+    def _decode(self, payload: str, decoded: Dict) -> Dict:
+        """Аргументы send_message из сохраненного payload"""
+        template = decoded.get(payload)
+        if template is None:
+            data = json.loads(payload)
+            template = decoded[payload] = {
+                'text': data['text'],
+                'parse_mode': data.get('parse_mode'),
+                'reply_markup': InlineKeyboardMarkup.de_json(data.get('reply_markup'), self.broadcaster.bot)
+            }
+        return template
+    
+    async def _build_digest(self, user_id: int, rows: List[Dict]) -> Optional[Dict]:
+        """Один дайджест вместо нескольких сообщений пользователю"""
+        match_ids = [row['match_id'] for row in rows]
+        matches_by_id = await self.db.get_matches_by_ids(match_ids)
+        matches = [match_from_row(matches_by_id[match_id]) for match_id in match_ids if match_id in matches_by_id]
+        if not matches:
+            await self.db.fail_outbox([row['id'] for row in rows], "матчи не найдены")
+            return None
+        
+        digest_id = await self.db.add_digest(user_id, [match['id'] for match in matches])
+        return self.renderer.digest_page(digest_id, matches, 0).for_chat(user_id)
+    
+    async def prune(self):
+        """Удаление давно обработанных строк"""
+        removed = await self.db.prune_outbox(datetime.now() - timedelta(days=OUTBOX_RETENTION_DAYS))
+        if removed:
+            logger.info(f"Удалено старых строк outbox: {removed}")
@@ -3,16 +3,23 @@ import asyncio
 import logging
 from bs4 import BeautifulSoup
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional, Tuple
+from typing import Callable, List, Dict, Optional, Tuple
 import re
-from config import TARGET_COEFFICIENTS, REQUEST_TIMEOUT, MAX_RETRIES
+from config import REQUEST_TIMEOUT, MAX_RETRIES
 from database import Database
+from coefficient_matcher import CoefficientMatcher
+from fixture_resolver import FixtureResolver
 
 logger = logging.getLogger(__name__)
 
 class MatchParser:
-    def __init__(self, database: Database):
+    def __init__(self, database: Database, matcher: Optional[CoefficientMatcher] = None,
+                 fixture_resolver: Optional[FixtureResolver] = None):
         self.db = database
+        self.matcher = matcher or CoefficientMatcher()
+        self.fixture_resolver = fixture_resolver or FixtureResolver(database)
+        # Подписчики на результаты сканирования каждого источника: callback(bookmaker, events)
+        self.scan_listeners: List[Callable[[str, List[Dict]], None]] = []
         self.session = None
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
@@ -26,9 +33,9 @@ class MatchParser:
         if self.session:
             await self.session.close()
     
-    async def parse_all_bookmakers(self) -> List[Dict]:
-        """Парсинг всех букмекеров"""
-        all_matches = []
+    async def parse_all_bookmakers(self, notify_listeners: bool = True) -> List[Dict]:
+        """Парсинг всех букмекеров; поиск по запросу пользователя не передает сканирование подписчикам"""
+        all_events = []
         
         # Список букмекеров для парсинга
         bookmakers = [
@@ -41,20 +48,22 @@ class MatchParser:
         
         tasks = []
         for bookmaker in bookmakers:
-            task = asyncio.create_task(self.parse_bookmaker(bookmaker))
+            task = asyncio.create_task(self.parse_bookmaker(bookmaker, notify_listeners))
             tasks.append(task)
         
         results = await asyncio.gather(*tasks, return_exceptions=True)
         
         for result in results:
             if isinstance(result, list):
-                all_matches.extend(result)
+                all_events.extend(result)
             elif isinstance(result, Exception):
                 logger.error(f"Ошибка при парсинге: {result}")
         
-        return all_matches
+        # Проверяем коэффициенты всех событий одной пачкой
+        target_matches = self.matcher.filter_matches(all_events)
+        return self.fixture_resolver.unique_by_fixture(target_matches)
     
-    async def parse_bookmaker(self, bookmaker: Dict) -> List[Dict]:
+    async def parse_bookmaker(self, bookmaker: Dict, notify_listeners: bool = True) -> List[Dict]:
         """Парсинг конкретного букмекера"""
         matches = []
         
@@ -70,13 +79,26 @@ class MatchParser:
             elif bookmaker['name'] == 'unibet':
                 matches = await self.parse_unibet(bookmaker['url'])
             
-            logger.info(f"Найдено {len(matches)} матчей на {bookmaker['name']}")
+            logger.info(f"Получено {len(matches)} событий на {bookmaker['name']}")
+            
+            # Сопоставляем один и тот же матч разных букмекеров
+            await self.fixture_resolver.resolve_matches(matches)
+            if notify_listeners:
+                self.notify_scan_listeners(bookmaker['name'], matches)
             return matches
             
         except Exception as e:
             logger.error(f"Ошибка при парсинге {bookmaker['name']}: {e}")
             return []
     
+    def notify_scan_listeners(self, bookmaker: str, events: List[Dict]):
+        """Передача результатов сканирования источника подписчикам"""
+        for listener in self.scan_listeners:
+            try:
+                listener(bookmaker, events)
+            except Exception as e:
+                logger.error(f"Ошибка обработчика сканирования {bookmaker}: {e}")
+    
     async def parse_1xbet(self, url: str) -> List[Dict]:
         """Парсинг 1xbet"""
         matches = []
@@ -93,7 +115,7 @@ class MatchParser:
                     for element in match_elements:
                         try:
                             match_data = await self.extract_match_data_1xbet(element)
-                            if match_data and self.check_target_coefficients(match_data['coefficient_1'], match_data['coefficient_2']):
+                            if match_data:
                                 matches.append(match_data)
                         except Exception as e:
                             logger.error(f"Ошибка при извлечении данных матча 1xbet: {e}")
@@ -120,7 +142,7 @@ class MatchParser:
                     for element in match_elements:
                         try:
                             match_data = await self.extract_match_data_bet365(element)
-                            if match_data and self.check_target_coefficients(match_data['coefficient_1'], match_data['coefficient_2']):
+                            if match_data:
                                 matches.append(match_data)
                         except Exception as e:
                             logger.error(f"Ошибка при извлечении данных матча bet365: {e}")
@@ -147,7 +169,7 @@ class MatchParser:
                     for element in match_elements:
                         try:
                             match_data = await self.extract_match_data_williamhill(element)
-                            if match_data and self.check_target_coefficients(match_data['coefficient_1'], match_data['coefficient_2']):
+                            if match_data:
                                 matches.append(match_data)
                         except Exception as e:
                             logger.error(f"Ошибка при извлечении данных матча William Hill: {e}")
@@ -174,7 +196,7 @@ class MatchParser:
                     for element in match_elements:
                         try:
                             match_data = await self.extract_match_data_bwin(element)
-                            if match_data and self.check_target_coefficients(match_data['coefficient_1'], match_data['coefficient_2']):
+                            if match_data:
                                 matches.append(match_data)
                         except Exception as e:
                             logger.error(f"Ошибка при извлечении данных матча bwin: {e}")
@@ -201,7 +223,7 @@ class MatchParser:
                     for element in match_elements:
                         try:
                             match_data = await self.extract_match_data_unibet(element)
-                            if match_data and self.check_target_coefficients(match_data['coefficient_1'], match_data['coefficient_2']):
+                            if match_data:
                                 matches.append(match_data)
                         except Exception as e:
                             logger.error(f"Ошибка при извлечении данных матча Unibet: {e}")
@@ -362,11 +384,7 @@ class MatchParser:
     
     def check_target_coefficients(self, coef1: float, coef2: float) -> bool:
         """Проверка соответствия коэффициентов целевым значениям"""
-        for target_coef1, target_coef2 in TARGET_COEFFICIENTS:
-            # Допустимая погрешность ±0.05
-            if (abs(coef1 - target_coef1) <= 0.05 and abs(coef2 - target_coef2) <= 0.05):
-                return True
-        return False
+        return self.matcher.matches(coef1, coef2)
     
     def parse_match_time(self, time_str: str) -> datetime:
         """Парсинг времени матча"""
@@ -402,14 +420,15 @@ class MatchParser:
         """Сохранение найденных матчей в базу данных"""
         for match in matches:
             try:
-                await self.db.add_match(
+                match['id'] = await self.db.add_match(
                     home_team=match['home_team'],
                     away_team=match['away_team'],
                     league=match['league'],
                     bookmaker=match['bookmaker'],
                     coefficient_1=match['coefficient_1'],
                     coefficient_2=match['coefficient_2'],
-                    match_time=match['match_time']
+                    match_time=match['match_time'],
+                    fixture_id=match.get('fixture_id')
                 )
             except Exception as e:
                 logger.error(f"Ошибка при сохранении матча в БД: {e}")
@@ -0,0 +1,140 @@
+import logging
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import PAYMENT_INTENT_CACHE_SIZE, PAYMENT_LINK_TTL_HOURS, PAYMENT_RECONCILE_PAGE_SIZE
+from database import Database
+from ttl import TTLMap
+
+logger = logging.getLogger(__name__)
+
+INTENT_PENDING = 'pending'
+INTENT_PAID = 'paid'
+INTENT_EXPIRED = 'expired'
+INTENT_FAILED = 'failed'
+
+
+class PaymentIntentStore:
+    """Намерения оплаты в базе с небольшим кэшем в памяти"""
+    
+    def __init__(self, database: Database, cache_size: int = PAYMENT_INTENT_CACHE_SIZE,
+                 ttl_hours: float = PAYMENT_LINK_TTL_HOURS):
+        self.db = database
+        self.cache_size = cache_size
+        self.ttl = timedelta(hours=ttl_hours)
+        # unique_id -> намерение; статус в кэше не используется для решений — оплату учитывает
+        # только транзакция журнала платежей в базе, поэтому хранилище можно делить между процессами
+        self.cache: OrderedDict = OrderedDict()
+        # external_id -> unique_id для записей кэша
+        self.external_ids: Dict[str, str] = {}
+        # Таймеры просрочки неоплаченных намерений этого процесса
+        self.expiry = TTLMap(on_expire=self._expire_intents)
+        # Обработчики просроченных намерений (список unique_id)
+        self.expiry_listeners: List[Callable[[List[str]], None]] = []
+    
+    def _remember(self, intent: Dict):
+        """Добавление записи в кэш с вытеснением самой давней"""
+        unique_id = intent['unique_id']
+        self.cache[unique_id] = intent
+        self.cache.move_to_end(unique_id)
+        if intent.get('external_id'):
+            self.external_ids[intent['external_id']] = unique_id
+        
+        while len(self.cache) > self.cache_size:
+            _, evicted = self.cache.popitem(last=False)
+            self.external_ids.pop(evicted.get('external_id'), None)
+    
+    def forget(self, unique_id: str):
+        """Удаление записи из кэша и снятие таймера просрочки"""
+        self.expiry.pop(unique_id)
+        intent = self.cache.pop(unique_id, None)
+        if intent:
+            self.external_ids.pop(intent.get('external_id'), None)
+    
+    async def create(self, user_id: int, subscription_type: str, amount: float,
+                     webhook_url_template: str = None) -> Dict:
+        """Новое намерение оплаты с уникальным идентификатором"""
+        unique_id = str(uuid.uuid4())
+        intent = {
+            'unique_id': unique_id,
+            'external_id': unique_id,
+            'user_id': user_id,
+            'subscription_type': subscription_type,
+            'amount': amount,
+            'webhook_url': webhook_url_template.format(unique_id=unique_id) if webhook_url_template else None,
+            'status': INTENT_PENDING,
+            'created_at': datetime.now()
+        }
+        await self.db.add_payment_intent(intent)
+        self._remember(intent)
+        self.expiry.set(unique_id, None, self.ttl.total_seconds())
+        return intent
+    
+    async def fail(self, unique_id: str):
+        """Пометка намерения, которое платежная система не приняла"""
+        try:
+            await self.db.set_payment_intent_status(unique_id, INTENT_FAILED)
+        except Exception as e:
+            logger.error(f"Ошибка при отметке намерения {unique_id}: {e}")
+        self.forget(unique_id)
+    
+    async def get(self, unique_id: str) -> Optional[Dict]:
+        """Намерение по unique_id"""
+        intent = self.cache.get(unique_id)
+        if intent is not None:
+            self.cache.move_to_end(unique_id)
+            return intent
+        
+        intent = await self.db.get_payment_intent(unique_id=unique_id)
+        if intent:
+            self._remember(intent)
+        return intent
+    
+    async def get_by_external_id(self, external_id: str) -> Optional[Dict]:
+        """Намерение по external_id платежной системы"""
+        unique_id = self.external_ids.get(external_id)
+        if unique_id is not None:
+            return await self.get(unique_id)
+        
+        intent = await self.db.get_payment_intent(external_id=external_id)
+        if intent:
+            self._remember(intent)
+        return intent
+    
+    async def schedule_pending(self, page_size: int = PAYMENT_RECONCILE_PAGE_SIZE) -> int:
+        """Постановка таймеров для неоплаченных намерений из базы (после рестарта)"""
+        now = datetime.now()
+        scheduled = 0
+        after = None
+        while True:
+            page = await self.db.get_pending_payment_intents(page_size, after)
+            for intent in page:
+                created_at = intent['created_at']
+                if isinstance(created_at, str):
+                    created_at = datetime.fromisoformat(created_at)
+                # Просроченные за время простоя истекут на ближайшем тике
+                self.expiry.set(intent['unique_id'], None, (created_at + self.ttl - now).total_seconds())
+            scheduled += len(page)
+            if len(page) < page_size:
+                return scheduled
+            after = (page[-1]['created_at'], page[-1]['unique_id'])
+    
+    async def _expire_intents(self, expired: List[Tuple[str, None]]):
+        """Перевод сработавших по таймеру намерений в expired; оплаченные за это время не трогаются"""
+        try:
+            unique_ids = await self.db.expire_payment_intents([unique_id for unique_id, _ in expired])
+        except Exception as e:
+            logger.error(f"Ошибка при просрочке ссылок на оплату: {e}")
+            # Повторим через минуту, иначе намерения останутся ожидающими до рестарта
+            for unique_id, _ in expired:
+                self.expiry.set(unique_id, None, 60)
+            return
+        
+        for unique_id in unique_ids:
+            self.forget(unique_id)
+        if unique_ids:
+            logger.info(f"Просрочено ссылок на оплату: {len(unique_ids)}")
+            for listener in self.expiry_listeners:
+                listener(unique_ids)
\ No newline at end of file
@@ -0,0 +1,124 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from config import SUBSCRIPTION_DAYS, PAYMENT_LEDGER_CACHE_SIZE
+from database import Database
+from payment_intents import PaymentIntentStore
+
+logger = logging.getLogger(__name__)
+
+
+def ledger_key(payment_id, unique_id: Optional[str]) -> str:
+    """Ключ платежа в журнале: идентификатор провайдера, иначе намерение оплаты"""
+    return str(payment_id) if payment_id else f"intent:{unique_id}"
+
+
+class PaymentLedger:
+    """Однократная активация подписки по каждому платежу"""
+    
+    def __init__(self, database: Database, intents: PaymentIntentStore,
+                 cache_size: int = PAYMENT_LEDGER_CACHE_SIZE):
+        self.db = database
+        self.intents = intents
+        self.cache_size = cache_size
+        # Платежи, уже учтенные этим процессом: повторы отвечаются без обращения к базе
+        self.known: OrderedDict = OrderedDict()
+        # Платежи, активируемые прямо сейчас: параллельные повторы ждут первую попытку
+        self.in_progress: Dict[str, asyncio.Future] = {}
+        self.stats = {'activated': 0, 'duplicates': 0}
+        # Обработчики активированных платежей (уведомление пользователя)
+        self.activation_listeners: List[Callable[[List[Dict]], Awaitable[None]]] = []
+    
+    async def _notify(self, activated: List[Dict]):
+        """Вызов обработчиков активированных платежей"""
+        for listener in self.activation_listeners:
+            try:
+                await listener(activated)
+            except Exception as e:
+                logger.error(f"Ошибка обработчика активации платежей: {e}")
+    
+    def _remember(self, key: str):
+        """Запоминание учтенного платежа"""
+        self.known[key] = True
+        self.known.move_to_end(key)
+        while len(self.known) > self.cache_size:
+            self.known.popitem(last=False)
+    
+    async def activate(self, payment_id, user_id: int, subscription_type: str, amount: float,
+                       unique_id: Optional[str] = None) -> bool:
+        """Активация подписки по платежу; False, если платеж уже учтен"""
+        key = ledger_key(payment_id, unique_id)
+        if key in self.known:
+            self.stats['duplicates'] += 1
+            return False
+        
+        pending = self.in_progress.get(key)
+        if pending is not None:
+            # Повтор дожидается первой попытки; если она упала, пробуем сами
+            if await asyncio.shield(pending):
+                self.stats['duplicates'] += 1
+                return False
+            return await self.activate(payment_id, user_id, subscription_type, amount, unique_id)
+        
+        pending = asyncio.get_running_loop().create_future()
+        self.in_progress[key] = pending
+        recorded = False
+        try:
+            days = SUBSCRIPTION_DAYS.get(subscription_type, 7)
+            end_date = await self.db.activate_payment(key, unique_id, user_id, subscription_type, amount, days)
+            recorded = True
+        finally:
+            # И при ошибке, и при отмене (CancelledError) ожидающие повторы не должны зависнуть
+            del self.in_progress[key]
+            pending.set_result(recorded)
+        
+        self._remember(key)
+        if unique_id:
+            self.intents.forget(unique_id)
+        
+        if end_date is None:
+            self.stats['duplicates'] += 1
+            logger.info(f"Платеж {key} уже учтен, повторная активация пропущена")
+            return False
+        
+        self.stats['activated'] += 1
+        logger.info(f"Платеж {key}: подписка {subscription_type} пользователя {user_id} активирована")
+        await self._notify([{
+            'payment_id': key, 'unique_id': unique_id, 'user_id': user_id, 'subscription_type': subscription_type,
+            'amount': amount, 'days': days, 'subscription_end': end_date
+        }])
+        return True
+    
+    async def activate_many(self, payments: List[Dict]) -> List[Dict]:
+        """Активация пачки платежей (payment_id, user_id, subscription_type, amount, unique_id) одной транзакцией"""
+        batch = {}
+        for payment in payments:
+            key = ledger_key(payment.get('payment_id'), payment.get('unique_id'))
+            if key in self.known or key in self.in_progress:
+                self.stats['duplicates'] += 1
+                continue
+            batch[key] = {
+                'payment_id': key,
+                'unique_id': payment.get('unique_id'),
+                'user_id': payment['user_id'],
+                'subscription_type': payment['subscription_type'],
+                'amount': payment['amount'],
+                'days': SUBSCRIPTION_DAYS.get(payment['subscription_type'], 7)
+            }
+        if not batch:
+            return []
+        
+        activated = await self.db.activate_payments(list(batch.values()))
+        for key, payment in batch.items():
+            self._remember(key)
+            if payment['unique_id']:
+                self.intents.forget(payment['unique_id'])
+        
+        self.stats['activated'] += len(activated)
+        self.stats['duplicates'] += len(batch) - len(activated)
+        if activated:
+            logger.info(f"Активировано подписок по сверке платежей: {len(activated)}")
+            await self._notify(activated)
+        return activated
\ No newline at end of file
@@ -0,0 +1,115 @@
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.constants import ParseMode
+from telegram.error import BadRequest
+
+from database import Database
+from message_scheduler import PRIORITY_PAYMENT
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIPTION_NAMES = {
+    'week': 'неделю',
+    'two_weeks': 'две недели',
+    'month': 'месяц'
+}
+
+
+def payment_success_text(subscription_type: str, amount: float, days: int) -> str:
+    """Текст подтверждения оплаты"""
+    subscription_name = SUBSCRIPTION_NAMES.get(subscription_type, subscription_type)
+    return f"""
+✅ **Оплата прошла успешно!**
+
+💳 **Подписка активирована:**
+📅 Тип: {subscription_name}
+💰 Сумма: {amount}₽
+⏰ Срок: {days} дней
+
+🎉 **Приятного пользования!**
+
+Теперь вы можете получать до 15 сигналов в день.
+
+💡 Используйте команды:
+/status - проверить статус
+/help - справка
+"""
+
+
+class PaymentNotifier:
+    """Подтверждение оплаты правкой исходного сообщения со ссылкой на оплату"""
+    
+    def __init__(self, database: Database, bot):
+        self.db = database
+        self.bot = bot
+        # unique_id намерения -> (chat_id, message_id) сообщения со ссылкой на оплату
+        self.subscriptions: Dict[str, Tuple[int, int]] = {}
+        self.stats = {'edited': 0, 'sent': 0}
+    
+    async def subscribe(self, unique_id: str, chat_id: int, message_id: int):
+        """Подписка сообщения на подтверждение оплаты (запоминается и в базе на случай рестарта)"""
+        if self.subscriptions.get(unique_id) == (chat_id, message_id):
+            return
+        self.subscriptions[unique_id] = (chat_id, message_id)
+        await self.db.set_payment_intent_message(unique_id, chat_id, message_id)
+    
+    def forget(self, unique_ids: Iterable[str]):
+        """Отписка намерений, которые больше не будут оплачены"""
+        for unique_id in unique_ids:
+            self.subscriptions.pop(unique_id, None)
+    
+    async def _target(self, unique_id: Optional[str]) -> Optional[Tuple[int, int]]:
+        """Сообщение, подписанное на намерение: из памяти или из базы"""
+        if not unique_id:
+            return None
+        target = self.subscriptions.pop(unique_id, None)
+        if target is None:
+            intent = await self.db.get_payment_intent(unique_id=unique_id)
+            if intent and intent.get('message_id'):
+                target = (intent['chat_id'], intent['message_id'])
+        return target
+    
+    async def on_activated(self, payments: List[Dict]):
+        """Уведомление пользователей об активированных платежах"""
+        for payment in payments:
+            try:
+                await self.notify(payment)
+            except Exception as e:
+                logger.error(f"Ошибка уведомления об оплате пользователя {payment['user_id']}: {e}")
+    
+    async def notify(self, payment: Dict):
+        """Правка исходного сообщения; без него или при ошибке правки — новое сообщение"""
+        text = payment_success_text(payment['subscription_type'], payment['amount'], payment['days'])
+        reply_markup = InlineKeyboardMarkup([
+            [InlineKeyboardButton("📊 Статус подписки", callback_data="status")],
+            [InlineKeyboardButton("⚽️ Найти матчи", callback_data="find_matches")]
+        ])
+        
+        target = await self._target(payment.get('unique_id'))
+        if target:
+            chat_id, message_id = target
+            try:
+                await self.bot.edit_message_text(
+                    text,
+                    chat_id=chat_id,
+                    message_id=message_id,
+                    reply_markup=reply_markup,
+                    parse_mode=ParseMode.MARKDOWN,
+                    rate_limit_args={'priority': PRIORITY_PAYMENT}
+                )
+                self.stats['edited'] += 1
+                return
+            except BadRequest as e:
+                # Сообщение удалено, слишком старое или уже показывает подтверждение
+                logger.info(f"Сообщение об оплате {payment.get('unique_id')} не изменено: {e}")
+        
+        await self.bot.send_message(
+            chat_id=payment['user_id'],
+            text=text,
+            reply_markup=reply_markup,
+            parse_mode=ParseMode.MARKDOWN,
+            rate_limit_args={'priority': PRIORITY_PAYMENT}
+        )
+        self.stats['sent'] += 1
@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from config import (
+    PAYMENT_RECONCILE_INTERVAL, PAYMENT_RECONCILE_MIN_INTERVAL, PAYMENT_RECONCILE_PAGE_SIZE,
+    PAYMENT_RECONCILE_CONCURRENCY, PAYMENT_RECONCILE_MAX_PAGES
+)
+from donation_alerts import DonationAlerts
+
+logger = logging.getLogger(__name__)
+
+# Запас на расхождение часов бота и DonationAlerts при остановке обхода страниц
+CLOCK_SKEW = timedelta(minutes=5)
+
+
+def parse_utc(value, naive_is_utc: bool) -> Optional[datetime]:
+    """Время в UTC; время без пояса считается UTC (ответы DonationAlerts) или локальным (база бота)"""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.strip())
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc) if naive_is_utc else value.astimezone()
+    return value.astimezone(timezone.utc)
+
+
+class PaymentReconciler:
+    """Фоновая сверка неоплаченных намерений со списком платежей DonationAlerts"""
+    
+    def __init__(self, donation_alerts: DonationAlerts,
+                 interval: float = PAYMENT_RECONCILE_INTERVAL, min_interval: float = PAYMENT_RECONCILE_MIN_INTERVAL,
+                 page_size: int = PAYMENT_RECONCILE_PAGE_SIZE, concurrency: int = PAYMENT_RECONCILE_CONCURRENCY,
+                 max_pages: int = PAYMENT_RECONCILE_MAX_PAGES):
+        self.donation_alerts = donation_alerts
+        self.db = donation_alerts.db
+        self.interval = interval
+        self.min_interval = min_interval
+        self.page_size = page_size
+        self.concurrency = concurrency
+        self.max_pages = max_pages
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.last_run = 0.0
+        self.stats = {'runs': 0, 'pages': 0, 'activated': 0, 'last_pending': 0}
+    
+    def start(self):
+        """Запуск периодической сверки"""
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+    
+    async def stop(self):
+        """Остановка сверки"""
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+    
+    def request_run(self):
+        """Внеочередная сверка (например, пользователь нажал «Проверить оплату»)"""
+        self.wakeup.set()
+    
+    async def run(self):
+        """Сверка по расписанию или по запросу, не чаще min_interval"""
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            
+            wait = self.last_run + self.min_interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self.wakeup.clear()
+            self.last_run = time.monotonic()
+            
+            try:
+                await self.reconcile()
+            except Exception as e:
+                logger.error(f"Ошибка сверки платежей: {e}")
+    
+    async def load_pending(self) -> Dict[str, Dict]:
+        """Все неоплаченные намерения постранично: external_id -> намерение"""
+        pending = {}
+        after = None
+        while True:
+            page = await self.db.get_pending_payment_intents(self.page_size, after)
+            for intent in page:
+                pending[intent['external_id']] = intent
+            if len(page) < self.page_size:
+                return pending
+            after = (page[-1]['created_at'], page[-1]['unique_id'])
+    
+    async def reconcile(self) -> int:
+        """Один проход сверки; возвращает число активированных подписок"""
+        pending = await self.load_pending()
+        self.stats['runs'] += 1
+        self.stats['last_pending'] = len(pending)
+        if not pending:
+            return 0
+        
+        # Список платежей идет от новых к старым: страницы старше самого раннего намерения не нужны
+        created = [parse_utc(intent['created_at'], naive_is_utc=False) for intent in pending.values()]
+        oldest = min((value for value in created if value is not None), default=None)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        
+        async def fetch(page: int) -> Optional[Dict]:
+            async with semaphore:
+                return await self.donation_alerts.list_donations(page)
+        
+        paid = []
+        page = 1
+        while pending and page <= self.max_pages:
+            # Окно страниц запрашивается параллельно, не больше concurrency запросов одновременно
+            window = list(range(page, min(page + self.concurrency, self.max_pages + 1)))
+            responses = await asyncio.gather(*(fetch(number) for number in window))
+            self.stats['pages'] += len(window)
+            
+            finished = False
+            for response in responses:
+                donations = (response or {}).get('data') or []
+                for donation in donations:
+                    intent = pending.get(donation.get('external_id'))
+                    if intent is None or donation.get('status') != 'paid':
+                        continue
+                    amount = float(donation.get('amount', 0))
+                    if amount < intent['amount']:
+                        continue
+                    
+                    del pending[intent['external_id']]
+                    paid.append({
+                        'payment_id': donation.get('id'),
+                        'unique_id': intent['unique_id'],
+                        'user_id': intent['user_id'],
+                        'subscription_type': intent['subscription_type'],
+                        'amount': amount
+                    })
+                
+                meta = (response or {}).get('meta') or {}
+                last_page = meta.get('last_page')
+                # Сравниваются моменты времени в UTC, а не строки в разных поясах и форматах
+                last_created = parse_utc(donations[-1].get('created_at'), naive_is_utc=True) if donations else None
+                if (not donations or (oldest and last_created and last_created < oldest - CLOCK_SKEW)
+                        or (last_page is not None and meta.get('current_page', 0) >= last_page)):
+                    finished = True
+            
+            if finished:
+                break
+            page += len(window)
+        
+        if not paid:
+            return 0
+        
+        activated = await self.donation_alerts.ledger.activate_many(paid)
+        # Уведомления отправляют обработчики активации журнала платежей
+        self.stats['activated'] += len(activated)
+        return len(activated)
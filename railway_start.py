@@ -13,6 +13,7 @@ import signal
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from main import FootballBot
+from config import WEBHOOK_SECRET_TOKEN
 
 # Настройка логирования
 logging.basicConfig(
@@ -44,8 +45,8 @@ class RailwayBot:
             webhook_url = f"https://{railway_url}/webhook"
             logger.info(f"🚀 Запуск бота с webhook URL: {webhook_url}")
             
-            # Устанавливаем webhook URL для Telegram
-            await self.bot.application.bot.set_webhook(url=webhook_url)
+            # Устанавливаем webhook URL для Telegram; секрет проверяется до чтения тела запроса
+            await self.bot.application.bot.set_webhook(url=webhook_url, secret_token=WEBHOOK_SECRET_TOKEN)
             logger.info(f"Webhook URL установлен: {webhook_url}")
             
             # Настраиваем обработчики сигналов
@@ -0,0 +1,109 @@
+import logging
+from typing import Dict, Iterable, List, Set
+
+import numpy as np
+
+from config import TARGET_COEFFICIENTS, COEFFICIENT_TOLERANCE
+from coefficient_matcher import CoefficientMatcher
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+# Владелец глобальных целевых коэффициентов из config.py
+GLOBAL_OWNER = -1
+
+
+class StrategyEngine:
+    """Сопоставление событий с пользовательскими стратегиями"""
+    
+    def __init__(self, database: Database):
+        self.db = database
+        # Общий индекс ячеек коэффициентов для глобальных и пользовательских целей
+        self.matcher = CoefficientMatcher()
+        # Владелец каждой цели индекса (GLOBAL_OWNER для глобальных)
+        self.target_owners = np.full(len(TARGET_COEFFICIENTS), GLOBAL_OWNER, dtype=np.int64)
+        # Пользователи, задавшие собственные стратегии
+        self.users_with_strategies: Set[int] = set()
+        self.strategies: Dict[int, Dict] = {}
+    
+    async def load(self):
+        """Загрузка стратегий из базы данных и построение индекса"""
+        strategies = await self.db.get_all_strategies()
+        self.strategies = {strategy['id']: strategy for strategy in strategies}
+        self.rebuild()
+        logger.info(f"Загружено пользовательских стратегий: {len(self.strategies)}")
+    
+    def rebuild(self):
+        """Перестроение индекса по текущему набору стратегий"""
+        targets = list(TARGET_COEFFICIENTS)
+        tolerances = [COEFFICIENT_TOLERANCE] * len(targets)
+        owners = [GLOBAL_OWNER] * len(targets)
+        
+        for strategy in self.strategies.values():
+            targets.append((strategy['coefficient_1'], strategy['coefficient_2']))
+            tolerances.append(strategy['tolerance'])
+            owners.append(strategy['user_id'])
+        
+        self.matcher.set_targets(targets, tolerances)
+        self.target_owners = np.asarray(owners, dtype=np.int64)
+        self.users_with_strategies = {strategy['user_id'] for strategy in self.strategies.values()}
+    
+    async def add_strategy(self, user_id: int, coefficient_1: float, coefficient_2: float,
+                           tolerance: float = COEFFICIENT_TOLERANCE) -> int:
+        """Добавление стратегии пользователя"""
+        strategy_id = await self.db.add_user_strategy(user_id, coefficient_1, coefficient_2, tolerance)
+        self.strategies[strategy_id] = {
+            'id': strategy_id,
+            'user_id': user_id,
+            'coefficient_1': coefficient_1,
+            'coefficient_2': coefficient_2,
+            'tolerance': tolerance
+        }
+        self.rebuild()
+        return strategy_id
+    
+    async def remove_strategy(self, user_id: int, strategy_id: int) -> bool:
+        """Удаление стратегии пользователя"""
+        if not await self.db.remove_user_strategy(user_id, strategy_id):
+            return False
+        
+        self.strategies.pop(strategy_id, None)
+        self.rebuild()
+        return True
+    
+    def get_user_strategies(self, user_id: int) -> List[Dict]:
+        """Стратегии пользователя из памяти"""
+        return [strategy for strategy in self.strategies.values() if strategy['user_id'] == user_id]
+    
+    def recipients_for_matches(self, matches: List[Dict], candidates: Iterable[int]) -> List[Set[int]]:
+        """Получатели каждого матча среди кандидатов"""
+        candidates = set(candidates)
+        recipients = [set() for _ in matches]
+        if not matches or not candidates:
+            return recipients
+        
+        coef1 = np.fromiter((match['coefficient_1'] for match in matches), dtype=np.float64, count=len(matches))
+        coef2 = np.fromiter((match['coefficient_2'] for match in matches), dtype=np.float64, count=len(matches))
+        events, targets = self.matcher.match_pairs(coef1, coef2)
+        
+        # Пользователи без своих стратегий получают сигналы по глобальным целям
+        default_audience = None
+        
+        for event, owner in zip(events.tolist(), self.target_owners[targets].tolist()):
+            if owner == GLOBAL_OWNER:
+                if default_audience is None:
+                    default_audience = candidates - self.users_with_strategies
+                recipients[event] |= default_audience
+            elif owner in candidates:
+                recipients[event].add(owner)
+        
+        return recipients
+    
+    def recipients_for_match(self, match: Dict, candidates: Iterable[int]) -> Set[int]:
+        """Получатели одного матча среди кандидатов"""
+        return self.recipients_for_matches([match], candidates)[0]
+    
+    def matches_for_user(self, user_id: int, matches: List[Dict]) -> List[Dict]:
+        """Матчи, подходящие под стратегии пользователя"""
+        recipients = self.recipients_for_matches(matches, [user_id])
+        return [match for match, users in zip(matches, recipients) if user_id in users]
@@ -0,0 +1,151 @@
+import asyncio
+import inspect
+import logging
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from config import TIMER_TICK, TIMER_SLOTS
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class TimerWheel:
+    """Хешированное колесо таймеров: постановка и отмена за O(1), срабатывание пачками по тикам"""
+    
+    def __init__(self, tick: float = TIMER_TICK, slots: int = TIMER_SLOTS):
+        self.tick = tick
+        self.slots = slots
+        # слот -> {(владелец, ключ): срок}; записи дальше одного оборота ждут своего круга в том же слоте
+        self.buckets: List[Dict[Tuple[Any, Hashable], float]] = [{} for _ in range(slots)]
+        # (владелец, ключ) -> слот
+        self.entries: Dict[Tuple[Any, Hashable], int] = {}
+        # Последний полностью обработанный тик
+        self.current = int(time.monotonic() / tick) - 1
+        self.task: Optional[asyncio.Task] = None
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    def schedule(self, owner, key: Hashable, delay: float):
+        """Срабатывание таймера ключа через delay секунд; повторная постановка переносит срок"""
+        entry = (owner, key)
+        self.cancel(owner, key)
+        
+        deadline = time.monotonic() + max(delay, 0.0)
+        slot = max(int(deadline / self.tick), self.current + 1) % self.slots
+        self.buckets[slot][entry] = deadline
+        self.entries[entry] = slot
+    
+    def cancel(self, owner, key: Hashable) -> bool:
+        """Отмена таймера ключа"""
+        slot = self.entries.pop((owner, key), None)
+        if slot is None:
+            return False
+        del self.buckets[slot][(owner, key)]
+        return True
+    
+    def advance(self, now: float = None) -> Dict[Any, List[Hashable]]:
+        """Сработавшие ключи по владельцам за прошедшие тики"""
+        now = time.monotonic() if now is None else now
+        done = int(now / self.tick) - 1
+        expired = defaultdict(list)
+        
+        # После долгого простоя достаточно одного оборота: каждый слот просматривается не больше раза
+        for tick in range(self.current + 1, min(done, self.current + self.slots) + 1):
+            bucket = self.buckets[tick % self.slots]
+            if not bucket:
+                continue
+            due = [entry for entry, deadline in bucket.items() if deadline <= now]
+            for entry in due:
+                del bucket[entry]
+                del self.entries[entry]
+                expired[entry[0]].append(entry[1])
+        
+        self.current = max(self.current, done)
+        return expired
+    
+    async def fire(self, now: float = None):
+        """Передача сработавших ключей владельцам, по одному вызову на владельца"""
+        for owner, keys in self.advance(now).items():
+            try:
+                await owner.expire(keys)
+            except Exception as e:
+                logger.error(f"Ошибка при обработке истекших записей: {e}")
+    
+    async def run(self):
+        """Цикл колеса"""
+        while True:
+            await asyncio.sleep(self.tick)
+            await self.fire()
+    
+    def start(self):
+        """Запуск цикла колеса"""
+        if not self.task:
+            self.task = asyncio.create_task(self.run())
+    
+    async def stop(self):
+        """Остановка цикла колеса"""
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+
+# Общее колесо процесса
+timers = TimerWheel()
+
+
+class TTLMap:
+    """Словарь с временем жизни записей на колесе таймеров"""
+    
+    def __init__(self, on_expire: Callable[[List[Tuple[Hashable, Any]]], Any] = None,
+                 wheel: TimerWheel = None):
+        self.wheel = wheel if wheel is not None else timers
+        # Пачка истекших пар (ключ, значение); может быть корутиной
+        self.on_expire = on_expire
+        # ключ -> (значение, срок)
+        self.items: Dict[Hashable, Tuple[Any, float]] = {}
+    
+    def __len__(self):
+        return len(self.items)
+    
+    def __contains__(self, key: Hashable):
+        return self.get(key, _MISSING) is not _MISSING
+    
+    def set(self, key: Hashable, value: Any, ttl: float):
+        """Запись значения на ttl секунд"""
+        self.items[key] = (value, time.monotonic() + ttl)
+        self.wheel.schedule(self, key, ttl)
+    
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Значение ключа; истекшая запись не видна даже до срабатывания колеса"""
+        item = self.items.get(key)
+        if item is None or item[1] <= time.monotonic():
+            return default
+        return item[0]
+    
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Удаление записи без вызова on_expire"""
+        self.wheel.cancel(self, key)
+        item = self.items.pop(key, None)
+        return item[0] if item else default
+    
+    def keys(self) -> Iterable[Hashable]:
+        """Ключи записей, включая истекшие, но еще не снятые колесом"""
+        return self.items.keys()
+    
+    async def expire(self, keys: List[Hashable]):
+        """Удаление сработавших записей и вызов on_expire одной пачкой"""
+        now = time.monotonic()
+        # Ключ, перезаписанный после срабатывания, остается с новым сроком
+        expired = [(key, self.items.pop(key)[0]) for key in keys if key in self.items and self.items[key][1] <= now]
+        if expired and self.on_expire:
+            result = self.on_expire(expired)
+            if inspect.isawaitable(result):
+                await result
\ No newline at end of file
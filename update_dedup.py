@@ -0,0 +1,90 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from typing import Deque, List, Set, Tuple
+
+from config import UPDATE_DEDUP_WINDOW, UPDATE_DEDUP_CAPACITY, UPDATE_DEDUP_PATH
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateDeduplicator:
+    """Окно недавно принятых update_id: повторные доставки Telegram не обрабатываются дважды"""
+    
+    def __init__(self, window: float = UPDATE_DEDUP_WINDOW, capacity: int = UPDATE_DEDUP_CAPACITY,
+                 path: str = UPDATE_DEDUP_PATH):
+        self.window = window
+        self.capacity = capacity
+        self.path = path
+        # Кольцевой буфер (update_id, время приема) в порядке поступления и множество для проверки
+        self.recent: Deque[Tuple[int, float]] = deque()
+        self.ids: Set[int] = set()
+        self.suppressed = 0
+    
+    def _evict(self, now: float):
+        """Удаление записей старше окна и сверх емкости"""
+        while self.recent and (len(self.recent) > self.capacity or now - self.recent[0][1] > self.window):
+            update_id, _ = self.recent.popleft()
+            self.ids.discard(update_id)
+    
+    def is_duplicate(self, update_id: int) -> bool:
+        """True, если обновление уже принималось; такие обновления учитываются как отсеченные"""
+        self._evict(time.time())
+        if update_id in self.ids:
+            self.suppressed += 1
+            return True
+        return False
+    
+    def remember(self, update_id: int):
+        """Запоминание принятого обновления"""
+        if update_id not in self.ids:
+            self.recent.append((update_id, time.time()))
+            self.ids.add(update_id)
+            self._evict(time.time())
+    
+    def admit(self, update_id: int) -> bool:
+        """Проверка и запоминание update_id; False для повторной доставки"""
+        if self.is_duplicate(update_id):
+            return False
+        self.remember(update_id)
+        return True
+    
+    def load(self):
+        """Загрузка окна, сохраненного перед прошлой остановкой"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except Exception as e:
+            logger.error(f"Ошибка загрузки принятых обновлений: {e}")
+            return
+        
+        for update_id, received in entries:
+            if update_id not in self.ids:
+                self.recent.append((update_id, received))
+                self.ids.add(update_id)
+        self._evict(time.time())
+        logger.info(f"Загружено недавно принятых обновлений: {len(self.recent)}")
+    
+    def _write(self, entries: List[Tuple[int, float]]):
+        """Атомарная запись окна в файл"""
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f)
+        os.replace(temp_path, self.path)
+    
+    def save(self):
+        """Сохранение окна для проверки повторов после рестарта"""
+        if self.path:
+            self._evict(time.time())
+            self._write(list(self.recent))
+    
+    async def save_async(self):
+        """Сохранение окна без блокировки цикла событий"""
+        if self.path:
+            self._evict(time.time())
+            await asyncio.to_thread(self._write, list(self.recent))
@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, Tuple
+
+from telegram import Update
+
+from config import UPDATE_WORKERS, UPDATE_QUEUE_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+def update_key(update: Update) -> int:
+    """Ключ упорядочивания: обновления одного пользователя обрабатываются по очереди"""
+    if update.effective_user:
+        return update.effective_user.id
+    if update.effective_chat:
+        return update.effective_chat.id
+    return -update.update_id
+
+
+class UpdateQueue:
+    """Фоновая обработка входящих обновлений с сохранением порядка для каждого пользователя"""
+    
+    def __init__(self, application, workers: int = UPDATE_WORKERS, max_pending: int = UPDATE_QUEUE_SIZE):
+        self.application = application
+        self.workers_count = workers
+        self.max_pending = max_pending
+        # Ключ пользователя -> его необработанные обновления (обновление, время постановки)
+        self.pending: Dict[int, Deque[Tuple[Update, float]]] = {}
+        # Пользователи, у которых есть обновления и нет обновления в работе
+        self.ready: asyncio.Queue = asyncio.Queue()
+        self.size = 0
+        self.workers = []
+        self.stats = {'accepted': 0, 'rejected': 0, 'processed': 0, 'failed': 0, 'wait_total': 0.0,
+                      'wait_max': 0.0, 'processing_total': 0.0}
+    
+    def submit(self, update: Update) -> bool:
+        """Постановка обновления в очередь; False, если очередь переполнена"""
+        if self.size >= self.max_pending:
+            self.stats['rejected'] += 1
+            return False
+        
+        key = update_key(update)
+        updates = self.pending.get(key)
+        if updates is None:
+            self.pending[key] = deque([(update, time.monotonic())])
+            self.ready.put_nowait(key)
+        else:
+            # Пользователь уже в очереди или в работе — обновление дождется предыдущих
+            updates.append((update, time.monotonic()))
+        
+        self.size += 1
+        self.stats['accepted'] += 1
+        return True
+    
+    def start(self):
+        """Запуск обработчиков очереди"""
+        if not self.workers:
+            self.workers = [asyncio.create_task(self.worker()) for _ in range(self.workers_count)]
+            logger.info(f"Очередь обновлений запущена: обработчиков {self.workers_count}")
+    
+    async def stop(self, timeout: float = 10.0):
+        """Остановка с ожиданием уже принятых обновлений"""
+        deadline = time.monotonic() + timeout
+        while self.size and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        if self.size:
+            logger.warning(f"Очередь обновлений остановлена, не обработано: {self.size}")
+        
+        for task in self.workers:
+            task.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+    
+    async def worker(self):
+        """Обработка по одному обновлению пользователя за раз"""
+        while True:
+            key = await self.ready.get()
+            updates = self.pending[key]
+            update, enqueued = updates.popleft()
+            
+            started = time.monotonic()
+            wait = started - enqueued
+            self.stats['wait_total'] += wait
+            self.stats['wait_max'] = max(self.stats['wait_max'], wait)
+            
+            try:
+                await self.application.process_update(update)
+                self.stats['processed'] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats['failed'] += 1
+                logger.error(f"Ошибка обработки обновления {update.update_id}: {e}")
+            finally:
+                self.stats['processing_total'] += time.monotonic() - started
+                self.size -= 1
+                # Следующее обновление пользователя становится доступно только после текущего
+                if updates:
+                    self.ready.put_nowait(key)
+                else:
+                    del self.pending[key]
+    
+    def oldest_age(self) -> float:
+        """Возраст самого старого необработанного обновления (секунды)"""
+        now = time.monotonic()
+        heads = [updates[0][1] for updates in self.pending.values() if updates]
+        return now - min(heads) if heads else 0.0
+    
+    def snapshot(self) -> Dict:
+        """Глубина очереди, возраст и счетчики обработки"""
+        handled = self.stats['processed'] + self.stats['failed']
+        return {
+            'pending': self.size,
+            'users': len(self.pending),
+            'oldest_age': round(self.oldest_age(), 3),
+            'accepted': self.stats['accepted'],
+            'rejected': self.stats['rejected'],
+            'processed': self.stats['processed'],
+            'failed': self.stats['failed'],
+            'avg_wait': round(self.stats['wait_total'] / handled, 3) if handled else 0.0,
+            'max_wait': round(self.stats['wait_max'], 3),
+            'avg_processing': round(self.stats['processing_total'] / handled, 3) if handled else 0.0
+        }
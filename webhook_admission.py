@@ -0,0 +1,94 @@
+import hmac
+import logging
+from collections import Counter
+from typing import Awaitable, Callable, Dict, Optional
+
+from aiohttp import web
+
+from config import WEBHOOK_TRUST_FORWARDED
+
+logger = logging.getLogger(__name__)
+
+SECRET_TOKEN_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+Handler = Callable[[web.Request], Awaitable[web.StreamResponse]]
+
+
+def client_ip(request: web.Request) -> str:
+    """Адрес клиента; за прокси — последний адрес, добавленный самим прокси"""
+    if WEBHOOK_TRUST_FORWARDED:
+        forwarded = request.headers.get('X-Forwarded-For')
+        if forwarded:
+            return forwarded.split(',')[-1].strip()
+    return request.remote or 'unknown'
+
+
+class AdmissionControl:
+    """Ранний отказ для webhook-маршрута: секрет, размер тела и лимит одновременных запросов"""
+    
+    def __init__(self, name: str, max_body: int, max_in_flight: int, per_ip: int,
+                 secret_token: Optional[str] = None):
+        self.name = name
+        self.max_body = max_body
+        self.max_in_flight = max_in_flight
+        self.per_ip = per_ip
+        self.secret_token = secret_token
+        self.in_flight = 0
+        # Адрес -> запросов в обработке
+        self.in_flight_by_ip: Dict[str, int] = {}
+        self.stats = Counter()
+    
+    def reject(self, reason: str, status: int, ip: str) -> web.Response:
+        """Отказ до чтения тела запроса"""
+        self.stats[reason] += 1
+        # Отказы считаются в snapshot; отладочный уровень не дает мусорному трафику забить лог
+        logger.debug(f"Webhook {self.name}: запрос с {ip} отклонен ({reason})")
+        return web.json_response({'status': reason}, status=status)
+    
+    def wrap(self, handler: Handler) -> Handler:
+        """Обработчик маршрута с проверками до разбора тела"""
+        
+        async def admitted(request: web.Request) -> web.StreamResponse:
+            ip = client_ip(request)
+            
+            # Секрет сравнивается по заголовку — тело чужих запросов не читается
+            if self.secret_token is not None:
+                token = request.headers.get(SECRET_TOKEN_HEADER, '')
+                if not hmac.compare_digest(token.encode(), self.secret_token.encode()):
+                    return self.reject('forbidden', 401, ip)
+            
+            if request.content_length is not None and request.content_length > self.max_body:
+                return self.reject('too_large', 413, ip)
+            
+            # Бюджеты маршрута независимы: поток на один маршрут не вытесняет другой
+            if self.in_flight >= self.max_in_flight:
+                return self.reject('busy', 503, ip)
+            if self.in_flight_by_ip.get(ip, 0) >= self.per_ip:
+                return self.reject('too_many_requests', 429, ip)
+            
+            self.in_flight += 1
+            self.in_flight_by_ip[ip] = self.in_flight_by_ip.get(ip, 0) + 1
+            try:
+                # Тело без Content-Length ограничено client_max_size приложения и проверяется после чтения
+                try:
+                    body = await request.read()
+                except web.HTTPRequestEntityTooLarge:
+                    return self.reject('too_large', 413, ip)
+                if len(body) > self.max_body:
+                    return self.reject('too_large', 413, ip)
+                
+                self.stats['accepted'] += 1
+                return await handler(request)
+            finally:
+                self.in_flight -= 1
+                left = self.in_flight_by_ip[ip] - 1
+                if left:
+                    self.in_flight_by_ip[ip] = left
+                else:
+                    del self.in_flight_by_ip[ip]
+        
+        return admitted
+    
+    def snapshot(self) -> Dict:
+        """Текущая нагрузка и счетчики отказов"""
+        return {'in_flight': self.in_flight, 'clients': len(self.in_flight_by_ip), **self.stats}
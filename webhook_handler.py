@@ -4,25 +4,46 @@ from aiohttp import web
 from typing import Dict, Optional
 from database import Database
 from donation_alerts import DonationAlerts
+from update_queue import UpdateQueue
+from update_dedup import UpdateDeduplicator
+from webhook_admission import AdmissionControl
+from config import (
+    WEBHOOK_SECRET_TOKEN, WEBHOOK_MAX_BODY, TELEGRAM_WEBHOOK_MAX_BODY, TELEGRAM_WEBHOOK_MAX_IN_FLIGHT,
+    TELEGRAM_WEBHOOK_PER_IP, PAYMENT_WEBHOOK_MAX_BODY, PAYMENT_WEBHOOK_MAX_IN_FLIGHT, PAYMENT_WEBHOOK_PER_IP
+)
 
 logger = logging.getLogger(__name__)
 
 class WebhookHandler:
-    def __init__(self, database: Database, donation_alerts: DonationAlerts, bot_application):
+    def __init__(self, database: Database, donation_alerts: DonationAlerts, bot_application,
+                 deduplicator: Optional[UpdateDeduplicator] = None):
         self.db = database
         self.donation_alerts = donation_alerts
         self.bot_application = bot_application
-        self.app = web.Application()
+        self.deduplicator = deduplicator
+        # Обновления Telegram обрабатываются в фоне, webhook отвечает сразу
+        self.updates = UpdateQueue(bot_application)
+        # Раздельные лимиты: поток платежных запросов не мешает обновлениям Telegram и наоборот
+        self.telegram_admission = AdmissionControl(
+            'telegram', TELEGRAM_WEBHOOK_MAX_BODY, TELEGRAM_WEBHOOK_MAX_IN_FLIGHT, TELEGRAM_WEBHOOK_PER_IP,
+            secret_token=WEBHOOK_SECRET_TOKEN
+        )
+        self.payment_admission = AdmissionControl(
+            'donation_alerts', PAYMENT_WEBHOOK_MAX_BODY, PAYMENT_WEBHOOK_MAX_IN_FLIGHT, PAYMENT_WEBHOOK_PER_IP
+        )
+        self.app = web.Application(client_max_size=WEBHOOK_MAX_BODY)
         self.setup_routes()
     
     def setup_routes(self):
         """Настройка маршрутов для webhook'ов"""
         # Telegram webhook
-        self.app.router.add_post('/webhook', self.handle_telegram_webhook)
+        self.app.router.add_post('/webhook', self.telegram_admission.wrap(self.handle_telegram_webhook))
         # DonationAlerts webhook
-        self.app.router.add_post('/webhook/donation_alerts', self.handle_donation_alerts_webhook)
+        self.app.router.add_post('/webhook/donation_alerts', self.payment_admission.wrap(self.handle_donation_alerts_webhook))
         # Индивидуальные webhook'и для каждого платежа
-        self.app.router.add_post('/webhook/donation_alerts/{payment_id}', self.handle_individual_payment_webhook)
+        self.app.router.add_post(
+            '/webhook/donation_alerts/{payment_id}', self.payment_admission.wrap(self.handle_individual_payment_webhook)
+        )
         # Health check
         self.app.router.add_get('/health', self.health_check)
     
@@ -31,14 +52,27 @@ class WebhookHandler:
         try:
             # Получаем данные из webhook
             data = await request.json()
-            logger.info(f"Получен webhook от Telegram")
+            if not isinstance(data, dict) or not isinstance(data.get('update_id'), int):
+                logger.warning("Некорректное обновление Telegram")
+                return web.json_response({'status': 'invalid'}, status=400)
+            
+            # Повторная доставка уже принятого обновления подтверждается без обработки
+            if self.deduplicator and self.deduplicator.is_duplicate(data['update_id']):
+                logger.info(f"Повторное обновление {data['update_id']} пропущено")
+                return web.json_response({'status': 'duplicate'})
             
             # Создаем Update объект
             from telegram import Update
             update = Update.de_json(data, self.bot_application.bot)
             
-            # Обрабатываем update через application
-            await self.bot_application.process_update(update)
+            # Ставим в очередь и отвечаем сразу; при переполнении Telegram повторит доставку позже
+            if not self.updates.submit(update):
+                logger.warning(f"Очередь обновлений переполнена, обновление {update.update_id} отклонено")
+                return web.json_response({'status': 'busy'}, status=503)
+            
+            # Отклоненное обновление не запоминается, чтобы повторная доставка была обработана
+            if self.deduplicator:
+                self.deduplicator.remember(update.update_id)
             
             return web.json_response({'status': 'ok'})
             
@@ -62,23 +96,13 @@ class WebhookHandler:
                 amount = payment_result['amount']
                 payment_id = payment_result['payment_id']
                 
-                # Определяем количество дней для подписки
-                subscription_days = {
-                    'week': 7,
-                    'two_weeks': 14,
-                    'month': 30
-                }
-                
-                days = subscription_days.get(subscription_type, 7)
-                
-                # Обновляем подписку пользователя
-                await self.db.update_user_subscription(user_id, subscription_type, days)
-                
-                # Добавляем запись о платеже
-                await self.db.add_subscription_record(user_id, subscription_type, amount, payment_id)
-                
-                # Отправляем уведомление пользователю
-                await self.send_payment_success_message(user_id, subscription_type, amount, days)
+                # Учет платежа, продление подписки и запись о покупке — одна транзакция;
+                # повторный webhook по тому же платежу подтверждается без повторной активации.
+                # Пользователя уведомляет обработчик активации журнала платежей
+                if not await self.donation_alerts.ledger.activate(
+                    payment_id, user_id, subscription_type, amount, payment_result.get('unique_id')
+                ):
+                    return web.json_response({'status': 'already_processed'})
                 
                 logger.info(f"Платеж успешно обработан для пользователя {user_id}")
                 
@@ -107,37 +131,26 @@ class WebhookHandler:
             
             # Мгновенно обрабатываем платеж
             if data.get('status') == 'paid':
-                # Находим данные платежа в кэше
-                payment_data = self.donation_alerts.payment_links.get(payment_id)
+                # Находим намерение оплаты (в кэше или в базе)
+                payment_data = await self.donation_alerts.intents.get(payment_id)
                 
                 if payment_data:
                     user_id = payment_data['user_id']
                     subscription_type = payment_data['subscription_type']
                     amount = float(data.get('amount', 0))
                     
-                    # Определяем количество дней для подписки
-                    subscription_days = {
-                        'week': 7,
-                        'two_weeks': 14,
-                        'month': 30
-                    }
-                    
-                    days = subscription_days.get(subscription_type, 7)
-                    
-                    # Мгновенно обновляем подписку пользователя
-                    await self.db.update_user_subscription(user_id, subscription_type, days)
-                    
-                    # Добавляем запись о платеже
-                    await self.db.add_subscription_record(user_id, subscription_type, amount, data.get('id'))
-                    
-                    # Мгновенно отправляем уведомление пользователю
-                    await self.send_instant_payment_success_message(user_id, subscription_type, amount, days)
+                    # Мгновенно и однократно активируем подписку пользователя
+                    # (исходное сообщение со ссылкой на оплату правит обработчик активации)
+                    if not await self.donation_alerts.ledger.activate(
+                        data.get('id'), user_id, subscription_type, amount, payment_id
+                    ):
+                        return web.json_response({'status': 'already_processed'})
                     
                     logger.info(f"Мгновенный платеж обработан для пользователя {user_id}")
                     
                     return web.json_response({'status': 'success', 'message': 'Платеж мгновенно обработан'})
                 else:
-                    logger.warning(f"Данные платежа {payment_id} не найдены в кэше")
+                    logger.warning(f"Намерение оплаты {payment_id} не найдено")
                     return web.json_response({'status': 'not_found'})
             else:
                 logger.info(f"Платеж {payment_id} имеет статус: {data.get('status')}")
@@ -147,104 +160,23 @@ class WebhookHandler:
             logger.error(f"Ошибка обработки мгновенного webhook: {e}")
             return web.json_response({'status': 'error'}, status=500)
     
-    async def send_payment_success_message(self, user_id: int, subscription_type: str, amount: float, days: int):
-        """Отправка сообщения об успешной оплате"""
-        try:
-            subscription_names = {
-                'week': 'неделю',
-                'two_weeks': 'две недели',
-                'month': 'месяц'
-            }
-            
-            subscription_name = subscription_names.get(subscription_type, subscription_type)
-            
-            message_text = f"""
-✅ **Оплата прошла успешно!**
-
-💳 **Подписка активирована:**
-📅 Тип: {subscription_name}
-💰 Сумма: {amount}₽
-⏰ Срок: {days} дней
-
-🎉 **Приятного пользования!**
-
-Теперь вы можете получать до 15 сигналов в день.
-
-💡 Используйте команды:
-/status - проверить статус
-/help - справка
-"""
-            
-            keyboard = [
-                [InlineKeyboardButton("📊 Статус подписки", callback_data="status")],
-                [InlineKeyboardButton("⚽️ Найти матчи", callback_data="find_matches")]
-            ]
-            
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await self.bot_application.bot.send_message(
-                chat_id=user_id,
-                text=message_text,
-                reply_markup=reply_markup,
-                parse_mode=ParseMode.MARKDOWN
-            )
-            
-        except Exception as e:
-            logger.error(f"Ошибка отправки сообщения об успешной оплате: {e}")
-    
-    async def send_instant_payment_success_message(self, user_id: int, subscription_type: str, amount: float, days: int):
-        """Мгновенная отправка сообщения об успешной оплате"""
-        try:
-            subscription_names = {
-                'week': 'неделю',
-                'two_weeks': 'две недели',
-                'month': 'месяц'
-            }
-            
-            subscription_name = subscription_names.get(subscription_type, subscription_type)
-            
-            message_text = f"""
-⚡️ **ОПЛАТА ПРОШЛА МГНОВЕННО!**
-
-✅ **Подписка активирована:**
-📅 Тип: {subscription_name}
-💰 Сумма: {amount}₽
-⏰ Срок: {days} дней
-
-🎉 **Приятного пользования!**
-
-Теперь вы можете получать до 15 сигналов в день.
-
-💡 Используйте команды:
-/status - проверить статус
-/help - справка
-"""
-            
-            keyboard = [
-                [InlineKeyboardButton("📊 Статус подписки", callback_data="status")],
-                [InlineKeyboardButton("⚽️ Найти матчи", callback_data="find_matches")]
-            ]
-            
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await self.bot_application.bot.send_message(
-                chat_id=user_id,
-                text=message_text,
-                reply_markup=reply_markup,
-                parse_mode=ParseMode.MARKDOWN
-            )
-            
-            logger.info(f"Мгновенное уведомление отправлено пользователю {user_id}")
-            
-        except Exception as e:
-            logger.error(f"Ошибка отправки мгновенного уведомления: {e}")
-    
     async def health_check(self, request):
         """Проверка здоровья сервиса"""
-        return web.json_response({'status': 'healthy'})
+        updates = self.updates.snapshot()
+        if self.deduplicator:
+            updates['duplicates'] = self.deduplicator.suppressed
+        return web.json_response({
+            'status': 'healthy',
+            'updates': updates,
+            'admission': {
+                'telegram': self.telegram_admission.snapshot(),
+                'donation_alerts': self.payment_admission.snapshot()
+            }
+        })
     
     async def start_server(self, host: str = '0.0.0.0', port: int = 8080):
         """Запуск webhook сервера"""
+        self.updates.start()
         runner = web.AppRunner(self.app)
         await runner.setup()
         site = web.TCPSite(runner, host, port)
@@ -257,8 +189,5 @@ class WebhookHandler:
     async def stop_server(self, runner):
         """Остановка webhook сервера"""
         await runner.cleanup()
-        logger.info("Webhook сервер остановлен")
-
-# Импорты для inline кнопок
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.constants import ParseMode 
+        await self.updates.stop()
+        logger.info("Webhook сервер остановлен")
\ No newline at end of file